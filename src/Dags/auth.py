@@ -0,0 +1,307 @@
+"""
+Управление токенами доступа Spotify (OAuth 2.0, grant_type=refresh_token).
+
+Для каждого пользователя хранится refresh-токен; access-токен кэшируется
+до момента незадолго до истечения. Фоновый поток обновляет токены заранее
+(за SPOTIFY_TOKEN_REFRESH_AHEAD секунд), поэтому запрос с истёкшим токеном
+не уходит в API, а горячий путь get_token() — это чтение из словаря.
+Параллельные обновления одного пользователя объединяются (single-flight):
+в token endpoint уходит один запрос, остальные потоки ждут его результат.
+
+Токены (включая выданные взамен refresh-токены) сохраняются в локальный
+JSON-файл SPOTIFY_TOKEN_CACHE_FILE, чтобы следующий запуск DAG не
+обновлял ещё действующий токен.
+
+Переменные окружения:
+- SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET — учётные данные приложения;
+- SPOTIFY_REFRESH_TOKEN — refresh-токен пользователя SPOTIFY_USER_ID;
+- SPOTIFY_TOKEN — статический access-токен (если refresh-токена нет).
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+TOKEN_URL = os.getenv("SPOTIFY_TOKEN_URL", "https://accounts.spotify.com/api/token")
+DEFAULT_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "state", "tokens.json")
+EXPIRY_MARGIN = float(os.getenv("SPOTIFY_TOKEN_EXPIRY_MARGIN", "60"))  # Токен считается истёкшим раньше срока
+REFRESH_AHEAD = float(os.getenv("SPOTIFY_TOKEN_REFRESH_AHEAD", "300"))  # Фоновое обновление до истечения
+REFRESH_INTERVAL = float(os.getenv("SPOTIFY_TOKEN_REFRESH_INTERVAL", "30"))  # Период проверки фонового потока
+REQUEST_TIMEOUT = float(os.getenv("SPOTIFY_TOKEN_TIMEOUT", "10"))
+
+
+
+class TokenManager:
+    """
+    Кэш access-токенов с обновлением по refresh-токенам.
+
+    Args:
+        client_id (Optional[str]): Client ID приложения Spotify.
+        client_secret (Optional[str]): Client secret приложения Spotify.
+        token_url (str): Адрес token endpoint.
+        cache_path (Optional[str]): Файл для сохранения токенов; None — только в памяти.
+        expiry_margin (float): За сколько секунд до истечения токен обновляется синхронно.
+        refresh_ahead (float): За сколько секунд до истечения токен обновляется в фоне.
+    """
+
+    def __init__(
+        self,
+        client_id: Optional[str] = None,
+        client_secret: Optional[str] = None,
+        token_url: str = TOKEN_URL,
+        cache_path: Optional[str] = None,
+        expiry_margin: float = EXPIRY_MARGIN,
+        refresh_ahead: float = REFRESH_AHEAD,
+    ):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.token_url = token_url
+        self.cache_path = cache_path
+        self.expiry_margin = expiry_margin
+        self.refresh_ahead = max(refresh_ahead, expiry_margin)
+
+        self._session = requests.Session()
+        self._tokens: Dict[str, dict] = {}  # user_id -> access_token, expires_at, refresh_token, registered_refresh_token
+        self._user_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._counters = {"hits": 0, "refreshes": 0, "coalesced": 0, "background_refreshes": 0, "failures": 0}
+
+        if cache_path:
+            self._load()
+
+    def register(
+        self,
+        user_id: str,
+        refresh_token: Optional[str] = None,
+        access_token: Optional[str] = None,
+        expires_at: Optional[float] = None,
+    ) -> None:
+        """
+        Добавляет пользователя.
+
+        Access-токен без срока действия (статический SPOTIFY_TOKEN) считается
+        бессрочным. Refresh-токен, отличный от зарегистрированного ранее
+        (например, новый SPOTIFY_REFRESH_TOKEN после отзыва доступа), заменяет
+        сохранённый в кэше, а выданный по старому access-токен считается
+        истёкшим. Повторная регистрация того же токена не перезаписывает
+        refresh-токен, который Spotify мог выдать взамен при обновлении.
+
+        Args:
+            user_id (str): Идентификатор пользователя.
+            refresh_token (Optional[str]): Refresh-токен.
+            access_token (Optional[str]): Уже выданный access-токен.
+            expires_at (Optional[float]): Время истечения access-токена (Unix-время).
+        """
+        with self._lock:
+            entry = self._tokens.setdefault(user_id, {})
+            if refresh_token and refresh_token != entry.get("registered_refresh_token"):
+                if entry.get("refresh_token") not in (None, refresh_token):
+                    entry["expires_at"] = 0.0
+                entry["refresh_token"] = refresh_token
+                entry["registered_refresh_token"] = refresh_token
+            if access_token and not entry.get("access_token"):
+                entry["access_token"] = access_token
+                entry["expires_at"] = expires_at if expires_at is not None else float("inf")
+
+    def get_token(self, user_id: str) -> str:
+        """
+        Возвращает действующий access-токен пользователя.
+
+        Args:
+            user_id (str): Идентификатор пользователя.
+
+        Returns:
+            str: Access-токен.
+
+        Raises:
+            KeyError: Если для пользователя нет ни access-, ни refresh-токена.
+            requests.HTTPError: Если обновление токена не удалось.
+        """
+        entry = self._tokens.get(user_id)
+        if entry is not None and self._is_fresh(entry, self.expiry_margin):
+            self._count("hits")
+            return entry["access_token"]
+        return self._refresh(user_id, self.expiry_margin)
+
+    def invalidate(self, user_id: str) -> None:
+        """
+        Помечает access-токен пользователя как истёкший (например, после ответа 401).
+
+        Args:
+            user_id (str): Идентификатор пользователя.
+        """
+        with self._lock:
+            entry = self._tokens.get(user_id)
+            if entry is not None and entry.get("refresh_token"):
+                entry["expires_at"] = 0.0
+
+    def start(self, interval: float = REFRESH_INTERVAL) -> None:
+        """
+        Запускает фоновое обновление токенов (один поток на процесс).
+
+        Args:
+            interval (float): Период проверки сроков действия, секунды.
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, args=(interval,), name="spotify-token-refresh", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Останавливает фоновое обновление."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> dict:
+        """
+        Возвращает счётчики кэша токенов.
+
+        Returns:
+            dict: hits, refreshes, coalesced (ожидания чужого обновления),
+                background_refreshes, failures, users.
+        """
+        with self._lock:
+            return {**self._counters, "users": len(self._tokens)}
+
+    def _is_fresh(self, entry: dict, margin: float) -> bool:
+        return entry.get("access_token") is not None and entry.get("expires_at", 0.0) - margin > time.time()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def _user_lock(self, user_id: str) -> threading.Lock:
+        with self._lock:
+            return self._user_locks.setdefault(user_id, threading.Lock())
+
+    def _refresh(self, user_id: str, margin: float) -> str:
+        """Обновляет токен, если за время ожидания блокировки его не обновил другой поток."""
+        with self._user_lock(user_id):
+            entry = self._tokens.get(user_id)
+            if entry is not None and self._is_fresh(entry, margin):
+                self._count("coalesced")
+                return entry["access_token"]
+            if entry is None or not entry.get("refresh_token"):
+                raise KeyError(f"Нет refresh-токена для пользователя {user_id}")
+
+            try:
+                body = self._request_token(entry["refresh_token"])
+            except requests.RequestException:
+                self._count("failures")
+                raise
+
+            with self._lock:
+                entry["access_token"] = body["access_token"]
+                entry["expires_at"] = time.time() + float(body.get("expires_in", 3600))
+                if body.get("refresh_token"):
+                    entry["refresh_token"] = body["refresh_token"]  # Spotify может выдать новый
+                self._counters["refreshes"] += 1
+            self._save()
+            logger.info(f"Токен пользователя {user_id} обновлён, действует {body.get('expires_in', 3600)} с")
+            return entry["access_token"]
+
+    def _request_token(self, refresh_token: str) -> dict:
+        """Запрашивает access-токен в token endpoint."""
+        if not self.client_id or not self.client_secret:
+            raise ValueError("Переменные SPOTIFY_CLIENT_ID и SPOTIFY_CLIENT_SECRET не заданы")
+        response = self._session.post(
+            self.token_url,
+            data={"grant_type": "refresh_token", "refresh_token": refresh_token},
+            auth=(self.client_id, self.client_secret),
+            timeout=REQUEST_TIMEOUT,
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def _run(self, interval: float) -> None:
+        """Цикл фонового потока: обновляет токены, истекающие в ближайшие refresh_ahead секунд."""
+        while not self._stop.wait(interval):
+            with self._lock:
+                due = [
+                    user_id for user_id, entry in self._tokens.items()
+                    if entry.get("refresh_token") and not self._is_fresh(entry, self.refresh_ahead)
+                ]
+            for user_id in due:
+                try:
+                    self._refresh(user_id, self.refresh_ahead)
+                    self._count("background_refreshes")
+                except Exception as e:
+                    # Следующая попытка — на следующей итерации или синхронно в get_token()
+                    logger.warning(f"Фоновое обновление токена {user_id} не удалось: {e}")
+
+    def _load(self) -> None:
+        """Читает сохранённые токены."""
+        if not os.path.exists(self.cache_path):
+            return
+        with open(self.cache_path, encoding="utf-8") as f:
+            self._tokens = json.load(f)
+
+    def _save(self) -> None:
+        """Атомарно сохраняет токены с правами только для владельца."""
+        if not self.cache_path:
+            return
+        # Снимок копируется под блокировкой: записи других пользователей меняются
+        # их обновлениями, пока файл пишется
+        with self._lock:
+            state = {
+                user_id: dict(entry) for user_id, entry in self._tokens.items()
+                if entry.get("refresh_token")  # Статические токены в файл не попадают
+            }
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        tmp_path = f"{self.cache_path}.{threading.get_ident()}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.cache_path)
+
+
+
+_manager: Optional[TokenManager] = None
+_manager_lock = threading.Lock()
+
+
+
+def get_token_manager() -> TokenManager:
+    """
+    Возвращает общий для процесса менеджер токенов.
+
+    При создании регистрирует пользователя SPOTIFY_USER_ID с токенами из
+    переменных окружения и, если есть refresh-токен, запускает фоновое
+    обновление.
+
+    Returns:
+        TokenManager: Менеджер токенов.
+    """
+    global _manager
+    if _manager is None:
+        with _manager_lock:
+            if _manager is None:
+                manager = TokenManager(
+                    client_id=os.getenv("SPOTIFY_CLIENT_ID"),
+                    client_secret=os.getenv("SPOTIFY_CLIENT_SECRET"),
+                    cache_path=os.getenv("SPOTIFY_TOKEN_CACHE_FILE", DEFAULT_CACHE_FILE),
+                )
+                user_id = os.getenv("SPOTIFY_USER_ID")
+                refresh_token = os.getenv("SPOTIFY_REFRESH_TOKEN")
+                if user_id and refresh_token:
+                    manager.register(user_id, refresh_token=refresh_token)
+                    manager.start()
+                elif user_id and os.getenv("SPOTIFY_TOKEN"):
+                    manager.register(user_id, access_token=os.getenv("SPOTIFY_TOKEN"))
+                _manager = manager
+    return _manager
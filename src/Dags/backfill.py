@@ -0,0 +1,345 @@
+"""
+Загрузка исторических данных параллельными окнами по времени.
+
+Диапазон дат делится на окна по window_days дней. Каждое окно независимо
+проходит проверку качества (data_quality) и трансформацию (transform_df)
+в отдельном процессе пула и загружается в БД своей транзакцией. Загрузка
+идемпотентна (см. db.load_plays()), поэтому команду можно безопасно
+перезапустить целиком или для части диапазона.
+
+По умолчанию окно с нарушением качества прерывает команду (--on-error fail).
+С --on-error quarantine строки с нарушениями окна записываются в
+quarantine_plays (или в CSV без --load, см. quarantine), а корректные
+строки загружаются.
+
+С --load окна сверяются с индексом загруженных ключей (см. key_index):
+уже загруженные прослушивания отсеиваются в процессе окна до обращения
+к БД, а ключи загруженных строк добавляются в индекс и сохраняются после
+каждого завершённого окна, поэтому прерванная команда не теряет индекс
+загруженных окон.
+
+Каждое окно читает свои данные в своём процессе. Для выгрузки родитель
+только определяет период записей каждого файла (разбирается одно время,
+см. ExportSource.time_ranges()), а процесс окна читает лишь файлы,
+пересекающиеся с окном. Из архива берутся ответы только владельца
+my_played_tracks (SPOTIFY_USER_ID, см. key_index.table_owner()).
+
+С флагом --arrow окна передаются между этапами и процессами таблицами
+Apache Arrow (время — timestamp[ms, UTC], строки — словарём), а строки
+прослушиваний загружаются в PostgreSQL командой COPY (см. db).
+
+Источники:
+- export — выгрузка данных аккаунта Spotify (каталог или JSON-файл:
+  endsong_*.json, Streaming_History_Audio_*.json, StreamingHistory*.json);
+- archive — архив сырых ответов API (см. raw_archive).
+
+Пример:
+    python backfill.py --source export --path ./my_spotify_data \\
+        --start 2020-01-01 --end 2024-01-01 --window-days 30 --workers 4 --load
+"""
+
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta, timezone
+from typing import TYPE_CHECKING, List, Optional, Tuple, Union
+
+import pandas as pd
+from sqlalchemy import create_engine
+
+from db import create_tables, db_url_from_env, load_plays
+from decoding import is_arrow
+from extractor import ArchiveSource, Extractor, ExportSource
+from key_index import KeyIndex, played_at_keys, table_owner
+from quality import ON_ERROR
+from quarantine import QuarantineSink
+from spotify_etl import run_etl
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+
+
+def split_windows(start: date, end: date, window_days: int) -> List[Tuple[str, str]]:
+    """
+    Делит полуинтервал дат [start, end) на окна целых суток.
+
+    Args:
+        start (date): Первая дата.
+        end (date): Дата, следующая за последней.
+        window_days (int): Длина окна в днях.
+
+    Returns:
+        List[Tuple[str, str]]: Границы окон в формате ISO 8601 (начало включительно).
+    """
+    windows = []
+    current = start
+    while current < end:
+        upper = min(current + timedelta(days=window_days), end)
+        windows.append((f"{current.isoformat()}T00:00:00", f"{upper.isoformat()}T00:00:00"))
+        current = upper
+    return windows
+
+
+
+def _window_ms(bound: str) -> int:
+    """Граница окна из split_windows() в Unix-времени (мс)."""
+    return int(datetime.fromisoformat(bound).replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+
+def in_window(data: Union[pd.DataFrame, "pa.Table"], window_start: str, window_end: str) -> Union[pd.DataFrame, "pa.Table"]:
+    """
+    Отбирает записи с played_at в полуинтервале [window_start, window_end).
+
+    Args:
+        data (Union[pd.DataFrame, pa.Table]): Записи.
+        window_start (str): Начало окна (ISO 8601, UTC).
+        window_end (str): Конец окна (ISO 8601, UTC).
+
+    Returns:
+        Union[pd.DataFrame, pa.Table]: Записи окна того же типа.
+    """
+    if not is_arrow(data):
+        lower, upper = (pd.Timestamp(bound, tz="UTC") for bound in (window_start, window_end))
+        return data[(data["played_at"] >= lower) & (data["played_at"] < upper)]
+
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    lower, upper = (
+        pa.scalar(datetime.fromisoformat(bound).replace(tzinfo=timezone.utc), pa.timestamp("ms", tz="UTC"))
+        for bound in (window_start, window_end)
+    )
+    played_at = data.column("played_at")
+    return data.filter(pc.and_(pc.greater_equal(played_at, lower), pc.less(played_at, upper)))
+
+
+
+def window_files(ranges: List[Tuple[str, str, str]], window_start: str, window_end: str) -> List[str]:
+    """
+    Отбирает файлы выгрузки, записи которых пересекаются с окном.
+
+    Args:
+        ranges (List[Tuple[str, str, str]]): Результат ExportSource.time_ranges().
+        window_start (str): Начало окна (ISO 8601, UTC).
+        window_end (str): Конец окна (ISO 8601, UTC).
+
+    Returns:
+        List[str]: Файлы окна.
+    """
+    return [path for path, first, last in ranges if last >= window_start and first < window_end]
+
+
+
+def read_window(
+    window_start: str,
+    window_end: str,
+    source: str,
+    files: Optional[List[str]] = None,
+    user_id: Optional[str] = None,
+    arrow: bool = False,
+) -> Union[pd.DataFrame, "pa.Table"]:
+    """
+    Читает записи окна из выгрузки или архива сырых ответов.
+
+    Записи без названия трека или артиста (подкасты, аудиокниги) пропускаются.
+
+    Args:
+        window_start (str): Начало окна (ISO 8601, UTC).
+        window_end (str): Конец окна (ISO 8601, UTC).
+        source (str): export или archive.
+        files (Optional[List[str]]): Файлы выгрузки окна (см. window_files()).
+        user_id (Optional[str]): Пользователь архива.
+        arrow (bool): Вернуть таблицу Arrow вместо DataFrame.
+
+    Returns:
+        Union[pd.DataFrame, pa.Table]: Записи окна с колонками COLUMNS.
+    """
+    if source == "export":
+        reader = ExportSource(files or [])
+    else:
+        # Файлы архива выбираются по индексу периода
+        reader = ArchiveSource(user_id=user_id, played_from=window_start, played_to=window_end)
+    return in_window(Extractor(reader, arrow=arrow).collect(), window_start, window_end)
+
+
+
+def process_window(
+    window: Tuple[str, str],
+    source: str,
+    files: Optional[List[str]] = None,
+    user_id: Optional[str] = None,
+    db_url: Optional[str] = None,
+    arrow: bool = False,
+    on_error: str = "fail",
+    known: Optional[KeyIndex] = None,
+) -> dict:
+    """
+    Читает, проверяет, трансформирует и (при db_url) загружает одно окно.
+
+    Выполняется в процессе пула.
+
+    Args:
+        window (Tuple[str, str]): Границы окна.
+        source (str): export или archive.
+        files (Optional[List[str]]): Файлы выгрузки окна (для export).
+        user_id (Optional[str]): Пользователь архива (для archive).
+        db_url (Optional[str]): URL БД; None — без загрузки.
+        arrow (bool): Обрабатывать окно в формате Arrow.
+        on_error (str): fail, drop или quarantine (см. quality.apply_quality()).
+        known (Optional[KeyIndex]): Ключи уже загруженных строк окна; они отсеиваются.
+
+    Returns:
+        dict: window, rows, duplicates, loaded, quarantined, inserted, seconds, keys
+            (ключи загруженных строк для индекса).
+    """
+    started = time.perf_counter()
+    df = read_window(*window, source, files, user_id, arrow)
+
+    # В выгрузке одна и та же отметка времени может встречаться несколько раз
+    # (записи Arrow уже без повторов: их отбрасывает Extractor)
+    before = len(df)
+    if not is_arrow(df):
+        df = df.drop_duplicates(subset="played_at", ignore_index=True)
+    deduplicated = len(df)
+    if known is not None:
+        df = known.filter_new(df)
+
+    sink = QuarantineSink() if on_error == "quarantine" else None
+    raw_df, _ = run_etl([df] if len(df) else [], on_error, sink)
+    quarantined = sink.rows if sink else 0
+
+    inserted, keys = 0, None
+    if db_url and (len(raw_df) or quarantined):
+        engine = create_engine(db_url)
+        if len(raw_df):
+            # fav_artist за даты окна пересчитывается по таблице в той же транзакции:
+            # отсев индексом ключей и повторные запуски не искажают счётчики
+            inserted, _ = load_plays(engine, raw_df)
+            keys = played_at_keys(raw_df)
+        if quarantined:
+            sink.to_db(engine)
+        engine.dispose()
+    elif quarantined:
+        sink.to_file()
+
+    return {
+        "window": f"{window[0][:10]}..{window[1][:10]}",
+        "rows": len(raw_df),
+        "duplicates": before - deduplicated,
+        "loaded": deduplicated - len(df),
+        "quarantined": quarantined,
+        "inserted": inserted,
+        "seconds": time.perf_counter() - started,
+        "keys": keys,
+    }
+
+
+
+def backfill(
+    source: str,
+    start: date,
+    end: date,
+    window_days: int = 30,
+    workers: int = os.cpu_count() or 1,
+    path: Optional[str] = None,
+    load: bool = False,
+    arrow: bool = False,
+    on_error: str = "fail",
+) -> List[dict]:
+    """
+    Загружает историю за период параллельными окнами.
+
+    Args:
+        source (str): export или archive.
+        start (date): Первая дата.
+        end (date): Дата, следующая за последней.
+        window_days (int): Длина окна в днях.
+        workers (int): Число процессов.
+        path (Optional[str]): Путь к выгрузке (для export).
+        load (bool): Загружать ли результат в БД (переменные DB_*).
+        arrow (bool): Передавать окна таблицами Arrow вместо DataFrame.
+        on_error (str): Что делать со строками, не прошедшими проверку: fail, drop
+            или quarantine.
+
+    Returns:
+        List[dict]: Статистика по окнам (см. process_window()).
+    """
+    started = time.perf_counter()
+    windows = split_windows(start, end, window_days)
+
+    user_id = table_owner()
+    db_url, index = None, None
+    if load:
+        db_url = db_url_from_env()
+        engine = create_engine(db_url)
+        create_tables(engine)
+        index = KeyIndex.load(user_id, engine)
+        engine.dispose()
+
+    files = [None] * len(windows)
+    if source == "export":
+        ranges = ExportSource(path).time_ranges()
+        files = [window_files(ranges, lower, upper) for lower, upper in windows]
+        logger.info(f"Файлов выгрузки: {len(ranges)}")
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(
+                process_window, window, source, paths, user_id, db_url, arrow, on_error,
+                index.between(_window_ms(window[0]), _window_ms(window[1])) if index is not None else None,
+            )
+            for window, paths in zip(windows, files)
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if index is not None and result["keys"] is not None:
+                # Индекс сохраняется после каждого окна: прерванная команда его не теряет
+                index.add(result["keys"])
+                index.save()
+    results.sort(key=lambda result: result["window"])
+
+    elapsed = time.perf_counter() - started
+    total = sum(result["rows"] for result in results)
+    for result in results:
+        logger.info(
+            f"Окно {result['window']}: строк {result['rows']}, дубликатов {result['duplicates']}, "
+            f"уже загружено {result['loaded']}, "
+            f"в карантине {result['quarantined']}, "
+            f"загружено {result['inserted']}, {result['seconds']:.2f} с"
+        )
+    logger.info(
+        f"Backfill завершён: окон {len(windows)}, строк {total} за {elapsed:.2f} с "
+        f"({total / elapsed if elapsed else 0:.0f} строк/с, процессов {workers})"
+    )
+    return results
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Загрузка исторических данных Spotify")
+    parser.add_argument("--source", choices=["export", "archive"], required=True)
+    parser.add_argument("--path", help="Файл или каталог выгрузки (для --source export)")
+    parser.add_argument("--start", type=date.fromisoformat, required=True, help="Первая дата (YYYY-MM-DD)")
+    parser.add_argument("--end", type=date.fromisoformat, required=True, help="Дата после последней (YYYY-MM-DD)")
+    parser.add_argument("--window-days", type=int, default=30)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--load", action="store_true", help="Загрузить результат в БД")
+    parser.add_argument("--arrow", action="store_true", help="Передавать окна таблицами Arrow")
+    parser.add_argument(
+        "--on-error", choices=ON_ERROR, default="fail",
+        help="Строки с нарушениями качества: прервать, отбросить или записать в карантин",
+    )
+    args = parser.parse_args()
+
+    if args.source == "export" and not args.path:
+        parser.error("--path обязателен для --source export")
+
+    backfill(args.source, args.start, args.end, args.window_days, args.workers, args.path, args.load, args.arrow, args.on_error)
@@ -0,0 +1,113 @@
+"""
+Автоматический выключатель (circuit breaker) для запросов к Spotify API.
+
+Выключатель считает исходы последних window запросов. Когда доля ошибок
+(таймауты, обрывы соединения, ответы 5xx) достигает failure_ratio, он
+размыкается: следующие запросы сразу получают CircuitOpenError, не дожидаясь
+таймаутов, а вызывающий код переключается на кэш или архив. Через
+reset_timeout секунд пропускается один пробный запрос: успех замыкает
+выключатель, ошибка снова размыкает его.
+"""
+
+import threading
+import time
+from collections import deque
+
+import requests
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Запрос отклонён без обращения к API: выключатель разомкнут."""
+
+
+
+class CircuitBreaker:
+    """
+    Потокобезопасный выключатель по доле ошибок в скользящем окне.
+
+    Args:
+        failure_ratio (float): Доля ошибок, при которой выключатель размыкается.
+        window (int): Число последних запросов, по которым считается доля.
+        min_requests (int): Минимум запросов в окне для принятия решения.
+        reset_timeout (float): Через сколько секунд пропускается пробный запрос.
+    """
+
+    def __init__(self, failure_ratio: float, window: int, min_requests: int, reset_timeout: float):
+        self.failure_ratio = failure_ratio
+        self.min_requests = min_requests
+        self.reset_timeout = reset_timeout
+        self._outcomes = deque(maxlen=window)  # True — ошибка
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+        self.rejected = 0  # Запросов отклонено без обращения к API
+        self.trips = 0  # Сколько раз выключатель размыкался
+
+    @property
+    def state(self) -> str:
+        """Текущее состояние: closed, open или half_open."""
+        with self._lock:
+            return self._state
+
+    def before_request(self) -> None:
+        """
+        Проверяет, можно ли отправить запрос.
+
+        Raises:
+            CircuitOpenError: Если выключатель разомкнут или пробный запрос уже выполняется.
+        """
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self._state = HALF_OPEN
+                self._probe_in_flight = False
+            if self._state == CLOSED:
+                return
+            if self._state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            self.rejected += 1
+        raise CircuitOpenError("Spotify API недоступен: выключатель разомкнут")
+
+    def record(self, failed: bool) -> None:
+        """
+        Учитывает исход запроса.
+
+        Args:
+            failed (bool): True для таймаута, ошибки соединения или ответа 5xx.
+        """
+        with self._lock:
+            if self._state == HALF_OPEN:
+                if failed:
+                    self._trip()
+                else:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                return
+
+            self._outcomes.append(failed)
+            if self._state == CLOSED and len(self._outcomes) >= self.min_requests:
+                if sum(self._outcomes) / len(self._outcomes) >= self.failure_ratio:
+                    self._trip()
+
+    def _trip(self) -> None:
+        self._state = OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        self.trips += 1
+
+    def stats(self) -> dict:
+        """
+        Возвращает состояние и счётчики.
+
+        Returns:
+            dict: breaker_state, breaker_trips, breaker_rejected.
+        """
+        with self._lock:
+            return {"breaker_state": self._state, "breaker_trips": self.trips, "breaker_rejected": self.rejected}
@@ -0,0 +1,303 @@
+"""
+Схема таблиц пайплайна и идемпотентная загрузка в PostgreSQL.
+
+DDL используется DAG (задача create_table) и пакетными командами
+(backfill, replay). Загрузку можно повторять для тех же данных:
+прослушивания с уже загруженным played_at пропускаются, а агрегаты
+fav_artist за затронутые даты пересчитываются по my_played_tracks в той
+же транзакции (см. load_plays()). Строки, не прошедшие проверку качества
+в режиме quarantine, дописываются в quarantine_plays с причиной (см. quarantine).
+
+Таблицы Arrow (см. Extractor(arrow=True)) загружаются в PostgreSQL
+командой COPY из CSV, который пишет pyarrow, без Python-объекта на значение.
+
+played_at хранится как TIMESTAMPTZ (8 байт, сравнение целых чисел в
+первичном ключе) и приходит из пачек уже разобранным: datetime64[ms, UTC]
+в pandas и timestamp[ms, UTC] в Arrow. Таблицы, созданные со строковым
+played_at, переводятся на TIMESTAMPTZ тем же DDL.
+
+Модуль импортируется файлом DAG при каждом парсинге, поэтому pandas,
+pyarrow и SQLAlchemy загружаются только внутри функций.
+"""
+
+from __future__ import annotations
+
+import io
+import os
+from typing import TYPE_CHECKING, Tuple, Union
+
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
+
+MY_PLAYED_TRACKS_DDL = """
+    CREATE TABLE IF NOT EXISTS my_played_tracks (
+        song_name VARCHAR(200),
+        artist_name VARCHAR(200),
+        played_at TIMESTAMPTZ,
+        timestamp VARCHAR(200),
+        track_id VARCHAR(64),
+        artist_id VARCHAR(64),
+        album_name VARCHAR(200),
+        duration_ms INTEGER,
+        popularity SMALLINT,
+        artist_genres VARCHAR(500),
+        artist_followers BIGINT,
+        CONSTRAINT primary_key_constraint PRIMARY KEY (played_at)
+    );
+    ALTER TABLE my_played_tracks ADD COLUMN IF NOT EXISTS track_id VARCHAR(64);
+    ALTER TABLE my_played_tracks ADD COLUMN IF NOT EXISTS artist_id VARCHAR(64);
+    ALTER TABLE my_played_tracks ADD COLUMN IF NOT EXISTS album_name VARCHAR(200);
+    ALTER TABLE my_played_tracks ADD COLUMN IF NOT EXISTS duration_ms INTEGER;
+    ALTER TABLE my_played_tracks ADD COLUMN IF NOT EXISTS popularity SMALLINT;
+    ALTER TABLE my_played_tracks ADD COLUMN IF NOT EXISTS artist_genres VARCHAR(500);
+    ALTER TABLE my_played_tracks ADD COLUMN IF NOT EXISTS artist_followers BIGINT;
+    DO $$
+    BEGIN
+        IF (SELECT data_type FROM information_schema.columns
+            WHERE table_name = 'my_played_tracks' AND column_name = 'played_at') <> 'timestamp with time zone' THEN
+            ALTER TABLE my_played_tracks ALTER COLUMN played_at TYPE TIMESTAMPTZ USING CAST(played_at AS TIMESTAMPTZ);
+        END IF;
+    END $$;
+"""
+
+# Все колонки текстовые и без ограничений: в карантин попадают именно
+# значения, которые не подходят по типу, NULL и повторы
+QUARANTINE_PLAYS_DDL = """
+    CREATE TABLE IF NOT EXISTS quarantine_plays (
+        song_name TEXT,
+        artist_name TEXT,
+        played_at TEXT,
+        timestamp TEXT,
+        track_id TEXT,
+        artist_id TEXT,
+        album_name TEXT,
+        duration_ms TEXT,
+        popularity TEXT,
+        artist_genres TEXT,
+        artist_followers TEXT,
+        reason TEXT NOT NULL,
+        quarantined_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+"""
+
+FAV_ARTIST_DDL = """
+    CREATE TABLE IF NOT EXISTS fav_artist (
+        timestamp VARCHAR(200),
+        ID VARCHAR(200),
+        artist_name VARCHAR(200),
+        count VARCHAR(200),
+        CONSTRAINT fav_artist_pkey PRIMARY KEY (ID)
+    );
+"""
+
+PLAYS_CONFLICT = "ON CONFLICT (played_at) DO NOTHING"
+
+
+
+def db_url_from_env() -> str:
+    """
+    Собирает URL подключения к PostgreSQL из переменных DB_*.
+
+    Returns:
+        str: URL для SQLAlchemy.
+
+    Raises:
+        ValueError: Если не все переменные заданы.
+    """
+    names = ["DB_USER", "DB_PASSWORD", "DB_HOST", "DB_PORT", "DB_NAME"]
+    values = [os.getenv(name) for name in names]
+    if not all(values):
+        raise ValueError("Не все переменные окружения для БД заданы в .env")
+    user, password, host, port, name = values
+    return f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{name}"
+
+
+
+def create_tables(engine) -> None:
+    """
+    Создаёт таблицы my_played_tracks, fav_artist и quarantine_plays, если их ещё нет.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Движок SQLAlchemy.
+    """
+    from sqlalchemy import text
+
+    with engine.begin() as conn:
+        conn.execute(text(MY_PLAYED_TRACKS_DDL))
+        conn.execute(text(FAV_ARTIST_DDL))
+        conn.execute(text(QUARANTINE_PLAYS_DDL))
+
+
+
+def _arrow_text_columns(data: pa.Table) -> pa.Table:
+    """
+    Приводит время прослушивания к строке ISO 8601 для текстовых колонок
+    (quarantine_plays, файлы карантина).
+
+    Returns:
+        pa.Table: Таблица, где timestamp-колонки заменены строками ISO 8601
+            с миллисекундами (2026-01-29T10:15:30.123Z).
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    for index, field in enumerate(data.schema):
+        if pa.types.is_timestamp(field.type):
+            data = data.set_column(index, field.name, pc.strftime(data.column(index), format="%Y-%m-%dT%H:%M:%SZ"))
+    return data
+
+
+
+def _copy_stage(conn, stage: str, table: str, data: pa.Table) -> None:
+    """Создаёт временную таблицу по образцу table и заполняет её командой COPY."""
+    import pyarrow.csv as pacsv
+
+    buffer = io.BytesIO()
+    pacsv.write_csv(data, buffer)
+    buffer.seek(0)
+
+    columns = ", ".join(f'"{column}"' for column in data.schema.names)
+    cursor = conn.connection.cursor()  # COPY доступен только через курсор psycopg2
+    try:
+        cursor.execute(f"CREATE TEMP TABLE {stage} (LIKE {table} INCLUDING DEFAULTS)")
+        cursor.copy_expert(f"COPY {stage} ({columns}) FROM STDIN WITH (FORMAT csv, HEADER true)", buffer)
+    finally:
+        cursor.close()
+
+
+
+def _stage_upsert(conn, df: Union[pd.DataFrame, pa.Table], table: str, conflict_sql: str) -> int:
+    """
+    Загружает таблицу через временную промежуточную таблицу и INSERT ... ON CONFLICT.
+
+    Args:
+        conn (sqlalchemy.engine.Connection): Соединение с открытой транзакцией.
+        df (Union[pd.DataFrame, pa.Table]): Загружаемые строки.
+        table (str): Целевая таблица.
+        conflict_sql (str): Предложение ON CONFLICT.
+
+    Returns:
+        int: Число вставленных или обновлённых строк.
+    """
+    from sqlalchemy import text
+
+    from decoding import is_arrow
+
+    if len(df) == 0:
+        return 0
+
+    arrow = is_arrow(df)
+    stage = f"stage_{table}_{os.getpid()}"
+    columns = ", ".join(f'"{column}"' for column in (df.column_names if arrow else df.columns))
+    if arrow and conn.dialect.name == "postgresql":
+        _copy_stage(conn, stage, table, df)
+    else:
+        (df.to_pandas() if arrow else df).to_sql(stage, conn, if_exists="replace", index=False, method="multi")
+    # WHERE true снимает неоднозначность разбора INSERT ... SELECT ... ON CONFLICT в SQLite
+    result = conn.execute(text(
+        f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {stage} WHERE true {conflict_sql}"
+    ))
+    conn.execute(text(f"DROP TABLE {stage}"))
+    return result.rowcount
+
+
+
+def _upsert(engine, df: Union[pd.DataFrame, pa.Table], table: str, conflict_sql: str) -> int:
+    """Выполняет _stage_upsert() в отдельной транзакции."""
+    if len(df) == 0:
+        return 0
+    with engine.begin() as conn:
+        return _stage_upsert(conn, df, table, conflict_sql)
+
+
+
+def upsert_plays(engine, df: Union[pd.DataFrame, pa.Table]) -> int:
+    """
+    Загружает прослушивания, пропуская уже загруженные played_at.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Движок SQLAlchemy.
+        df (Union[pd.DataFrame, pa.Table]): Прослушивания в формате return_dataframe()
+            или таблица Arrow (см. Extractor(arrow=True)).
+
+    Returns:
+        int: Число новых строк.
+    """
+    return _upsert(engine, df, "my_played_tracks", PLAYS_CONFLICT)
+
+
+
+def load_plays(engine, df: Union[pd.DataFrame, pa.Table]) -> Tuple[int, int]:
+    """
+    Загружает прослушивания и пересчитывает fav_artist за их даты в одной транзакции.
+
+    Агрегаты считаются transform_df() по всем строкам my_played_tracks за
+    затронутые даты, а не по загружаемой пачке. Поэтому повторная загрузка,
+    пачка после отсева индексом ключей и пересекающиеся источники (архив,
+    выгрузка) не искажают счётчики, а сбой не оставляет прослушивания без
+    агрегатов.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Движок SQLAlchemy.
+        df (Union[pd.DataFrame, pa.Table]): Прослушивания в формате return_dataframe()
+            или таблица Arrow (см. Extractor(arrow=True)).
+
+    Returns:
+        Tuple[int, int]: Число новых прослушиваний и строк fav_artist за затронутые даты.
+    """
+    import pandas as pd
+    import pyarrow.compute as pc
+    from sqlalchemy import bindparam, text
+
+    from decoding import is_arrow
+    from spotify_etl import transform_df
+
+    if len(df) == 0:
+        return 0, 0
+
+    dates = pc.unique(df.column("timestamp")).to_pylist() if is_arrow(df) else df["timestamp"].unique().tolist()
+    dates = sorted(str(value) for value in dates)
+    dates_param = bindparam("dates", expanding=True)
+    with engine.begin() as conn:
+        inserted = _stage_upsert(conn, df, "my_played_tracks", PLAYS_CONFLICT)
+        plays = pd.read_sql(
+            text('SELECT "timestamp", artist_name FROM my_played_tracks WHERE "timestamp" IN :dates').bindparams(dates_param),
+            conn,
+            params={"dates": dates},
+        )
+        fav_artist = transform_df(plays).rename(columns={"ID": "id"})  # Postgres хранит имя колонки в нижнем регистре
+        conn.execute(text('DELETE FROM fav_artist WHERE "timestamp" IN :dates').bindparams(dates_param), {"dates": dates})
+        fav_artist.to_sql("fav_artist", conn, if_exists="append", index=False, method="multi")
+    return inserted, len(fav_artist)
+
+
+
+def upsert_fav_artist(engine, df: pd.DataFrame) -> int:
+    """
+    Загружает агрегаты по артистам и датам, перезаписывая счётчики существующих ID.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Движок SQLAlchemy.
+        df (pd.DataFrame): Результат transform_df().
+
+    Returns:
+        int: Число вставленных или обновлённых строк.
+    """
+    df = df.rename(columns={"ID": "id"})  # Postgres хранит имя колонки в нижнем регистре
+    return _upsert(engine, df, "fav_artist", "ON CONFLICT (id) DO UPDATE SET count = EXCLUDED.count")
+
+
+
+def insert_quarantine(engine, df: Union[pd.DataFrame, pa.Table]) -> int:
+    """
+    Дописывает отклонённые проверкой качества строки в quarantine_plays.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Движок SQLAlchemy.
+        df (Union[pd.DataFrame, pa.Table]): Строки с колонкой reason (см. quality.with_reasons()).
+
+    Returns:
+        int: Число записанных строк.
+    """
+    return _upsert(engine, df, "quarantine_plays", "")
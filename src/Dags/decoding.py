@@ -0,0 +1,515 @@
+"""
+Типизированное декодирование ответов recently-played.
+
+Ответ разбирается msgspec сразу из байтов в компактные структуры, в которых
+объявлены только нужные пайплайну поля; остальное содержимое JSON
+пропускается без создания Python-объектов. Из структур записи переносятся
+в колоночные буферы (по списку на колонку), из которых без промежуточных
+кортежей собирается DataFrame или пачка Apache Arrow (см. arrow_schema()).
+
+Время прослушивания разбирается из ISO 8601 один раз, при сборке пачки,
+одной векторной операцией (parse_played_at()). Дальше оно передаётся как
+Unix-время в миллисекундах: timestamp[ms, UTC] в Arrow и datetime64[ms, UTC]
+в pandas (int64 внутри), а дата (колонка timestamp) вычисляется из него же.
+Значения не в формате PLAYED_AT_FORMAT (в том числе с точностью выше
+миллисекунд, которые иначе пришлось бы усечь) не разбираются: исходная
+строка сохраняется в колонке bad_played_at, и проверка качества отклоняет
+такую строку (правило bad_played_at, см. quality).
+
+Часто повторяющиеся строки (song_name, artist_name, timestamp) кодируются
+словарём: dictionary<string> в Arrow и category в pandas. Каждое значение
+хранится один раз, строки таблицы — целочисленные коды; группировка
+(transform_df) идёт по кодам без хеширования строк. Пачки pandas с разными
+словарями объединяются через concat_frames(). Замер: benchmarks/bench_categorical.py.
+
+Замер до/после: benchmarks/bench_decoding.py.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, List, Optional, Union
+
+import msgspec
+
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
+
+# Точность Spotify — миллисекунды; более точные значения при переводе в ms
+# совпали бы с соседними прослушиваниями по первичному ключу
+PLAYED_AT_FORMAT = r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d{1,3})?Z$"  # 2026-01-29T10:15:30.123Z
+BAD_PLAYED_AT = "bad_played_at"
+
+
+
+class Artist(msgspec.Struct, gc=False):
+    id: Optional[str] = None
+    name: Optional[str] = None
+
+
+
+class Album(msgspec.Struct, gc=False):
+    artists: List[Artist] = []
+
+
+
+class Track(msgspec.Struct, gc=False):
+    id: Optional[str] = None  # У локальных файлов ID нет
+    name: Optional[str] = None
+    album: Optional[Album] = None
+
+
+
+class PlayHistory(msgspec.Struct, gc=False):
+    played_at: Optional[str] = None
+    track: Optional[Track] = None
+
+
+
+class RecentlyPlayedPage(msgspec.Struct, gc=False):
+    items: Optional[List[PlayHistory]] = None  # None — ключа items в ответе нет
+    next: Optional[str] = None
+
+
+
+class ArchivedPage(msgspec.Struct, gc=False):
+    """Строка архива сырых ответов (см. raw_archive)."""
+
+    user_id: str
+    page: RecentlyPlayedPage
+
+
+
+class AlbumMetadata(msgspec.Struct, gc=False):
+    name: Optional[str] = None
+
+
+
+class TrackMetadata(msgspec.Struct, gc=False):
+    """Трек из ответа GET /tracks?ids=..."""
+
+    id: str
+    duration_ms: Optional[int] = None
+    popularity: Optional[int] = None
+    album: Optional[AlbumMetadata] = None
+
+
+
+class TracksResponse(msgspec.Struct, gc=False):
+    tracks: List[Optional[TrackMetadata]] = []  # null для неизвестных ID
+
+
+
+class Followers(msgspec.Struct, gc=False):
+    total: Optional[int] = None
+
+
+
+class ArtistMetadata(msgspec.Struct, gc=False):
+    """Артист из ответа GET /artists?ids=..."""
+
+    id: str
+    genres: List[str] = []
+    followers: Optional[Followers] = None
+    popularity: Optional[int] = None
+
+
+
+class ArtistsResponse(msgspec.Struct, gc=False):
+    artists: List[Optional[ArtistMetadata]] = []  # null для неизвестных ID
+
+
+
+class ExportRecord(msgspec.Struct, gc=False):
+    """
+    Запись выгрузки данных аккаунта Spotify.
+
+    Поддерживаются оба формата: расширенная история (endsong_*.json,
+    Streaming_History_Audio_*.json) и базовая (StreamingHistory*.json).
+    """
+
+    # Расширенная история
+    ts: Optional[str] = None
+    master_metadata_track_name: Optional[str] = None
+    master_metadata_album_artist_name: Optional[str] = None
+    spotify_track_uri: Optional[str] = None
+    # Базовая история
+    endTime: Optional[str] = None
+    trackName: Optional[str] = None
+    artistName: Optional[str] = None
+
+
+
+class ExportTime(msgspec.Struct, gc=False):
+    """Только время записи выгрузки: остальные поля пропускаются без разбора."""
+
+    ts: Optional[str] = None
+    endTime: Optional[str] = None
+
+
+
+_page_decoder = msgspec.json.Decoder(RecentlyPlayedPage)
+_export_decoder = msgspec.json.Decoder(List[ExportRecord])
+_export_time_decoder = msgspec.json.Decoder(List[ExportTime])
+_archived_page_decoder = msgspec.json.Decoder(ArchivedPage)
+_tracks_decoder = msgspec.json.Decoder(TracksResponse)
+_artists_decoder = msgspec.json.Decoder(ArtistsResponse)
+
+
+
+@lru_cache(maxsize=None)
+def arrow_schema() -> pa.Schema:
+    """
+    Схема пачек прослушиваний в формате Apache Arrow.
+
+    Названия и имена артистов повторяются, поэтому хранятся словарём
+    (dictionary<int32, string>); время прослушивания — timestamp[ms, UTC],
+    дата — date32.
+
+    Returns:
+        pa.Schema: Схема с колонками song_name, artist_name, played_at,
+            timestamp, track_id, artist_id.
+    """
+    import pyarrow as pa
+
+    text = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ("song_name", text),
+        ("artist_name", text),
+        ("played_at", pa.timestamp("ms", tz="UTC")),
+        ("timestamp", pa.date32()),
+        ("track_id", pa.string()),
+        ("artist_id", pa.string()),
+    ])
+
+
+
+def is_arrow(data: Any) -> bool:
+    """
+    Проверяет, что data — пачка или таблица Arrow, не импортируя pyarrow.
+
+    Args:
+        data (Any): DataFrame, pa.RecordBatch или pa.Table.
+
+    Returns:
+        bool: True для объектов pyarrow.
+    """
+    return type(data).__module__.startswith("pyarrow")
+
+
+
+def concat_frames(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Объединяет пачки DataFrame, сохраняя категориальные колонки.
+
+    У каждой пачки свой словарь, и pd.concat при несовпадении категорий
+    переводит колонку в object-строки. Категориальные колонки поэтому
+    объединяются union_categoricals(): словари сливаются, коды пачек
+    пересчитываются без обращения к строкам таблицы.
+
+    Args:
+        frames (List[pd.DataFrame]): Непустой список пачек.
+
+    Returns:
+        pd.DataFrame: Общая таблица с новым индексом.
+    """
+    import pandas as pd
+    from pandas.api.types import union_categoricals
+
+    frames = list(frames)
+    merged = {}
+    for name in frames[0].columns:
+        columns = [frame[name] for frame in frames if name in frame.columns]
+        if len(columns) == len(frames) and all(isinstance(column.dtype, pd.CategoricalDtype) for column in columns):
+            merged[name] = union_categoricals(columns, ignore_order=True)
+    if not merged:
+        return pd.concat(frames, ignore_index=True)
+
+    df = pd.concat([frame.drop(columns=list(merged)) for frame in frames], ignore_index=True)
+    for name, values in merged.items():
+        df[name] = values
+    # Порядок колонок — как у pd.concat: колонки первой пачки, затем новые
+    order = list(dict.fromkeys(name for frame in frames for name in frame.columns))
+    return df[order]
+
+
+
+def decode_page(raw: bytes) -> RecentlyPlayedPage:
+    """
+    Декодирует ответ recently-played из байтов.
+
+    Args:
+        raw (bytes): Тело ответа API.
+
+    Returns:
+        RecentlyPlayedPage: Страница с нужными полями.
+
+    Raises:
+        msgspec.DecodeError: Некорректный JSON или тип поля.
+    """
+    return _page_decoder.decode(raw)
+
+
+
+def decode_tracks(raw: bytes) -> TracksResponse:
+    """
+    Декодирует ответ пакетного эндпоинта треков.
+
+    Args:
+        raw (bytes): Тело ответа GET /tracks?ids=...
+
+    Returns:
+        TracksResponse: Треки в порядке запрошенных ID.
+    """
+    return _tracks_decoder.decode(raw)
+
+
+
+def decode_artists(raw: bytes) -> ArtistsResponse:
+    """
+    Декодирует ответ пакетного эндпоинта артистов.
+
+    Args:
+        raw (bytes): Тело ответа GET /artists?ids=...
+
+    Returns:
+        ArtistsResponse: Артисты в порядке запрошенных ID.
+    """
+    return _artists_decoder.decode(raw)
+
+
+
+def decode_export(raw: bytes) -> List[ExportRecord]:
+    """
+    Декодирует файл выгрузки истории прослушиваний.
+
+    Args:
+        raw (bytes): Содержимое JSON-файла выгрузки.
+
+    Returns:
+        List[ExportRecord]: Записи выгрузки.
+    """
+    return _export_decoder.decode(raw)
+
+
+
+def decode_export_times(raw: bytes) -> List[ExportTime]:
+    """
+    Декодирует из файла выгрузки только время записей (для выбора файлов по периоду).
+
+    Args:
+        raw (bytes): Содержимое JSON-файла выгрузки.
+
+    Returns:
+        List[ExportTime]: Время записей выгрузки.
+    """
+    return _export_time_decoder.decode(raw)
+
+
+
+def decode_archived_page(line: bytes) -> ArchivedPage:
+    """
+    Декодирует строку архива сырых ответов.
+
+    Args:
+        line (bytes): Строка JSONL из архива.
+
+    Returns:
+        ArchivedPage: Пользователь и страница ответа.
+    """
+    return _archived_page_decoder.decode(line)
+
+
+
+def _parse_one(value: Optional[str]) -> Optional[datetime]:
+    """Разбирает одно значение ISO 8601; некорректное — None."""
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+
+def parse_played_at(values: Union[List[Optional[str]], pa.Array]) -> pa.Array:
+    """
+    Разбирает время прослушивания из ISO 8601 в timestamp[ms, UTC].
+
+    Формат всех значений проверяется одним регулярным выражением
+    (PLAYED_AT_FORMAT), и весь столбец разбирается в C++ (pyarrow). Если
+    хотя бы одно значение некорректно, столбец разбирается поштучно, а
+    такие значения (и значения точнее миллисекунд) становятся NULL: строка
+    не прерывает извлечение, а отклоняется проверкой качества (см.
+    bad_played_at()).
+
+    Args:
+        values (Union[List[Optional[str]], pa.Array]): Значения played_at,
+            например 2026-01-29T10:15:30.123Z.
+
+    Returns:
+        pa.Array: Unix-время в миллисекундах (timestamp[ms, UTC]).
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    played_at_type = pa.timestamp("ms", tz="UTC")
+    if not isinstance(values, pa.Array):
+        values = pa.array(values, pa.string())
+    valid = pc.match_substring_regex(values, PLAYED_AT_FORMAT)
+    if pc.all(valid).as_py() is not False:
+        try:
+            return values.cast(played_at_type)
+        except pa.ArrowInvalid:
+            pass  # Формат верен, но значение нет (например, 13-й месяц)
+    return pa.array(
+        [_parse_one(value) if ok else None for value, ok in zip(values.to_pylist(), valid.to_pylist())],
+        played_at_type,
+    )
+
+
+
+def bad_played_at(raw: pa.Array, played_at: pa.Array) -> Optional[pa.Array]:
+    """
+    Исходные строки played_at, которые не удалось разобрать.
+
+    Args:
+        raw (pa.Array): Исходные значения (string).
+        played_at (pa.Array): Результат parse_played_at(raw).
+
+    Returns:
+        Optional[pa.Array]: Исходная строка для неразобранных значений и NULL
+            для остальных; None, если разобраны все значения.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if played_at.null_count == raw.null_count:
+        return None
+    return pc.if_else(pc.and_(played_at.is_null(), raw.is_valid()), raw, pa.scalar(None, pa.string()))
+
+
+
+class PlayColumns:
+    """
+    Колоночные буферы записей о прослушиваниях.
+
+    Колонки соответствуют формату return_dataframe(): song_name,
+    artist_name, played_at, timestamp, track_id, artist_id. Колонка
+    timestamp не буферизуется: она вычисляется из played_at при сборке.
+    """
+
+    __slots__ = ("song_name", "artist_name", "played_at", "track_id", "artist_id", "_strings")
+
+    def __init__(self):
+        self.song_name = []
+        self.artist_name = []
+        self.played_at = []
+        self.track_id = []
+        self.artist_id = []
+        # Названия и ID повторяются (артист — в каждом его прослушивании): буферы
+        # хранят по одному объекту на значение, а декодированные копии сразу освобождаются
+        self._strings = {}
+
+    def __len__(self) -> int:
+        return len(self.played_at)
+
+    def append(
+        self,
+        song_name: str,
+        artist_name: str,
+        played_at: str,
+        track_id: Optional[str],
+        artist_id: Optional[str],
+    ) -> None:
+        """Добавляет одну запись."""
+        intern = self._strings.setdefault
+        self.song_name.append(intern(song_name, song_name))
+        self.artist_name.append(intern(artist_name, artist_name))
+        self.played_at.append(played_at)
+        self.track_id.append(intern(track_id, track_id))
+        self.artist_id.append(intern(artist_id, artist_id))
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        Собирает DataFrame из буферов.
+
+        Строки кодируются словарём в C++ (pyarrow) и переходят в pandas
+        как category: Python-объект создаётся на значение словаря, а не на строку таблицы.
+
+        Returns:
+            pd.DataFrame: Таблица с колонками song_name, artist_name (category),
+                played_at (datetime64[ms, UTC]), timestamp (дата YYYY-MM-DD, category),
+                track_id, artist_id; bad_played_at — только если какое-то время
+                не удалось разобрать.
+        """
+        import pandas as pd  # Не загружается при импорте модуля (см. spotify_etl)
+        import pyarrow as pa
+
+        raw = pa.array(self.played_at, pa.string())
+        played_at = parse_played_at(raw)
+        text = pa.dictionary(pa.int32(), pa.string())  # Словарь строится сразу при переносе списка
+        df = pd.DataFrame({
+            "song_name": pa.array(self.song_name, text).to_pandas(),
+            "artist_name": pa.array(self.artist_name, text).to_pandas(),
+            "played_at": played_at.to_pandas(),
+            "timestamp": played_at.cast(pa.date32()).cast(pa.string()).dictionary_encode().to_pandas(),
+            "track_id": self.track_id,
+            "artist_id": self.artist_id,
+        })
+        bad = bad_played_at(raw, played_at)
+        if bad is not None:
+            df[BAD_PLAYED_AT] = bad.to_pandas()
+        return df
+
+    def to_record_batch(self) -> pa.RecordBatch:
+        """
+        Собирает пачку Arrow из буферов.
+
+        Время разбирается из ISO 8601 и строки кодируются словарём в C++
+        (pyarrow.compute), без Python-объекта на значение.
+
+        Returns:
+            pa.RecordBatch: Пачка со схемой arrow_schema() и колонкой
+                bad_played_at (string), если какое-то время не удалось разобрать.
+        """
+        import pyarrow as pa
+
+        raw = pa.array(self.played_at, pa.string())
+        played_at = parse_played_at(raw)
+        columns = [
+            pa.array(self.song_name, pa.string()).dictionary_encode(),
+            pa.array(self.artist_name, pa.string()).dictionary_encode(),
+            played_at,
+            played_at.cast(pa.date32()),
+            pa.array(self.track_id, pa.string()),
+            pa.array(self.artist_id, pa.string()),
+        ]
+        schema = arrow_schema()
+        bad = bad_played_at(raw, played_at)
+        if bad is not None:
+            columns.append(bad)
+            schema = schema.append(pa.field(BAD_PLAYED_AT, pa.string()))
+        return pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+
+def item_fields(item: PlayHistory) -> Optional[tuple]:
+    """
+    Достаёт из элемента название трека, первого артиста альбома, время и ID.
+
+    Args:
+        item (PlayHistory): Элемент страницы.
+
+    Returns:
+        Optional[tuple]: (song_name, artist_name, played_at, track_id, artist_id)
+            или None, если какого-то обязательного поля нет. ID могут быть None.
+    """
+    track = item.track
+    if item.played_at is None or track is None or track.name is None:
+        return None
+    album = track.album
+    if album is None or not album.artists or album.artists[0].name is None:
+        return None
+    artist = album.artists[0]
+    return track.name, artist.name, item.played_at, track.id, artist.id
@@ -0,0 +1,432 @@
+"""
+Обогащение прослушиваний метаданными треков и артистов из Spotify API.
+
+Для каждой пачки собираются уникальные ID треков; уже известные берутся из
+постоянного кэша (SQLite с TTL), остальные запрашиваются пакетным
+эндпоинтом GET /tracks по 50 ID за запрос. Кэш общий для всех пользователей
+и запусков, поэтому популярные треки запрашиваются один раз. Счётчики
+попаданий и промахов доступны через stats().
+
+Артисты обогащаются так же через GET /artists, но перед постоянным кэшем
+стоит LRU в памяти, а ID, которых нет в Spotify, тоже кэшируются
+(отрицательный результат). При многопользовательском запуске ID артистов
+собираются со всех пользователей и запрашиваются одним проходом.
+
+Путь к кэшу задаётся SPOTIFY_CACHE_FILE, сроки жизни записей —
+SPOTIFY_TRACK_CACHE_TTL и SPOTIFY_ARTIST_CACHE_TTL (в секундах), размер
+LRU артистов — SPOTIFY_ARTIST_LRU_SIZE.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+import msgspec
+import pandas as pd
+import requests
+
+from decoding import decode_artists, decode_tracks
+from spotify_client import SpotifyClient, get_client
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "state", "metadata_cache.sqlite")
+TRACK_CACHE_TTL = int(os.getenv("SPOTIFY_TRACK_CACHE_TTL", 7 * 24 * 3600))
+TRACKS_PER_REQUEST = 50  # Максимум ID в одном запросе GET /tracks
+ENRICHED_COLUMNS = ["album_name", "duration_ms", "popularity"]
+ARTIST_CACHE_TTL = int(os.getenv("SPOTIFY_ARTIST_CACHE_TTL", 7 * 24 * 3600))
+ARTIST_LRU_SIZE = int(os.getenv("SPOTIFY_ARTIST_LRU_SIZE", 10_000))
+ARTISTS_PER_REQUEST = 50  # Максимум ID в одном запросе GET /artists
+ARTIST_COLUMNS = ["artist_genres", "artist_followers"]
+
+
+
+class SqliteCache:
+    """
+    Постоянный кэш «ключ -> JSON» со сроком жизни записей.
+
+    Одна таблица на вид объектов в общем файле SQLite. Соединение разделяется
+    потоками процесса под блокировкой; режим WAL позволяет читать кэш
+    параллельно из нескольких процессов.
+
+    Args:
+        table (str): Имя таблицы (например, tracks).
+        ttl (int): Срок жизни записи в секундах.
+        path (Optional[str]): Файл SQLite. По умолчанию — SPOTIFY_CACHE_FILE.
+    """
+
+    def __init__(self, table: str, ttl: int, path: Optional[str] = None):
+        self.table = table
+        self.ttl = ttl
+        self.path = path or os.getenv("SPOTIFY_CACHE_FILE", DEFAULT_CACHE_FILE)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT, updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys: List[str]) -> Dict[str, Optional[dict]]:
+        """
+        Возвращает неустаревшие записи для ключей.
+
+        Args:
+            keys (List[str]): Ключи.
+
+        Returns:
+            Dict[str, Optional[dict]]: Найденные записи; значение None означает
+                сохранённый отрицательный результат (объект не существует).
+        """
+        found = {}
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            # SQLite ограничивает число параметров запроса, поэтому читаем частями
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM {self.table} WHERE key IN ({placeholders}) AND updated_at >= ?",
+                    [*chunk, cutoff],
+                ).fetchall()
+                for key, value in rows:
+                    found[key] = json.loads(value) if value is not None else None
+        return found
+
+    def put_many(self, values: Dict[str, Optional[dict]]) -> None:
+        """
+        Сохраняет записи (None — отрицательный результат).
+
+        Args:
+            values (Dict[str, Optional[dict]]): Записи по ключам.
+        """
+        now = time.time()
+        rows = [(key, json.dumps(value) if value is not None else None, now) for key, value in values.items()]
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, updated_at) VALUES (?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+
+
+class TrackEnricher:
+    """
+    Подтягивает метаданные треков с постоянным кэшем и пакетными запросами.
+
+    Args:
+        cache (Optional[SqliteCache]): Кэш треков. По умолчанию — таблица tracks в SPOTIFY_CACHE_FILE.
+        client (Optional[SpotifyClient]): HTTP-клиент. По умолчанию — общий клиент процесса.
+    """
+
+    def __init__(self, cache: Optional[SqliteCache] = None, client: Optional[SpotifyClient] = None):
+        self.cache = cache or SqliteCache("tracks", TRACK_CACHE_TTL)
+        self.client = client
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.api_calls = 0
+
+    def fetch(self, track_ids: Iterable[str], token: str) -> Dict[str, Optional[dict]]:
+        """
+        Возвращает метаданные треков, запрашивая в API только отсутствующие в кэше.
+
+        Ошибка запроса (сбой API, разомкнутый выключатель) не прерывает
+        загрузку: она логируется, а треки без ответа остаются без метаданных
+        и будут запрошены в следующий раз.
+
+        Args:
+            track_ids (Iterable[str]): ID треков (повторы и None допускаются).
+            token (str): Токен доступа.
+
+        Returns:
+            Dict[str, Optional[dict]]: {track_id: {"album_name", "duration_ms",
+                "popularity"}}; None для ID, которых нет в Spotify.
+        """
+        unique = list(dict.fromkeys(track_id for track_id in track_ids if track_id))
+        found = self.cache.get_many(unique)
+        missing = [track_id for track_id in unique if track_id not in found]
+
+        client = self.client or get_client()
+        fetched = {}
+        calls = 0
+        for start in range(0, len(missing), TRACKS_PER_REQUEST):
+            chunk = missing[start:start + TRACKS_PER_REQUEST]
+            try:
+                response = client.get_decoded("tracks", token, {"ids": ",".join(chunk)}, decode_tracks)
+            except (requests.exceptions.RequestException, msgspec.MsgspecError) as e:
+                # Остальные треки останутся без метаданных и будут запрошены в следующий раз
+                logger.warning(f"Не удалось получить метаданные треков: {e}. Использован только кэш")
+                break
+            calls += 1
+            client.metrics.record_items("tracks", sum(1 for track in response.tracks if track is not None))
+            for track_id, track in zip(chunk, response.tracks):
+                fetched[track_id] = None if track is None else {
+                    "album_name": track.album.name if track.album else None,
+                    "duration_ms": track.duration_ms,
+                    "popularity": track.popularity,
+                }
+
+        if fetched:
+            self.cache.put_many(fetched)
+        with self._lock:
+            self.hits += len(unique) - len(missing)
+            self.misses += len(missing)
+            self.api_calls += calls
+
+        found.update(fetched)
+        return found
+
+    def enrich(self, df: pd.DataFrame, token: str) -> pd.DataFrame:
+        """
+        Добавляет к пачке колонки album_name, duration_ms, popularity.
+
+        Args:
+            df (pd.DataFrame): Пачка с колонкой track_id.
+            token (str): Токен доступа.
+
+        Returns:
+            pd.DataFrame: Та же пачка с дополнительными колонками; для треков
+                без метаданных — NULL.
+        """
+        metadata = self.fetch(df["track_id"], token)
+        for column in ENRICHED_COLUMNS:
+            values = {track_id: meta[column] for track_id, meta in metadata.items() if meta is not None}
+            df[column] = df["track_id"].map(values)
+        df["duration_ms"] = df["duration_ms"].astype("Int64")
+        df["popularity"] = df["popularity"].astype("Int64")
+        return df
+
+    def stats(self) -> dict:
+        """
+        Возвращает счётчики кэша.
+
+        Returns:
+            dict: hits/misses — уникальные ID, найденные/не найденные в кэше,
+                hit_ratio — доля попаданий, api_calls — запросов к GET /tracks.
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+                "api_calls": self.api_calls,
+            }
+
+
+
+class LruCache:
+    """
+    Потокобезопасный LRU-кэш в памяти.
+
+    Args:
+        maxsize (int): Максимальное число записей.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: List[str]) -> dict:
+        """Возвращает найденные записи и отмечает их как недавно использованные."""
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._data:
+                    self._data.move_to_end(key)
+                    found[key] = self._data[key]
+        return found
+
+    def put_many(self, values: dict) -> None:
+        """Сохраняет записи, вытесняя давно не использованные."""
+        with self._lock:
+            for key, value in values.items():
+                self._data[key] = value
+                self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+
+class ArtistEnricher:
+    """
+    Подтягивает жанры и подписчиков артистов: LRU -> SQLite -> GET /artists.
+
+    Args:
+        cache (Optional[SqliteCache]): Постоянный кэш. По умолчанию — таблица artists в SPOTIFY_CACHE_FILE.
+        client (Optional[SpotifyClient]): HTTP-клиент. По умолчанию — общий клиент процесса.
+        lru_size (int): Размер LRU в памяти.
+    """
+
+    def __init__(
+        self,
+        cache: Optional[SqliteCache] = None,
+        client: Optional[SpotifyClient] = None,
+        lru_size: int = ARTIST_LRU_SIZE,
+    ):
+        self.cache = cache or SqliteCache("artists", ARTIST_CACHE_TTL)
+        self.client = client
+        self.lru = LruCache(lru_size)
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.negative = 0
+        self.api_calls = 0
+
+    def fetch(self, artist_ids: Iterable[str], token: str) -> Dict[str, Optional[dict]]:
+        """
+        Возвращает метаданные артистов, запрашивая в API только неизвестные ID.
+
+        Ошибка запроса (сбой API, разомкнутый выключатель) не прерывает
+        загрузку: она логируется, а артисты без ответа остаются без метаданных
+        и будут запрошены в следующий раз.
+
+        Args:
+            artist_ids (Iterable[str]): ID артистов (повторы и None допускаются).
+            token (str): Токен доступа.
+
+        Returns:
+            Dict[str, Optional[dict]]: {artist_id: {"artist_genres", "artist_followers"}};
+                None для ID, которых нет в Spotify.
+        """
+        unique = list(dict.fromkeys(artist_id for artist_id in artist_ids if artist_id))
+        found = self.lru.get_many(unique)
+        memory_hits = len(found)
+
+        from_disk = self.cache.get_many([artist_id for artist_id in unique if artist_id not in found])
+        self.lru.put_many(from_disk)
+        found.update(from_disk)
+        missing = [artist_id for artist_id in unique if artist_id not in found]
+
+        client = self.client or get_client()
+        fetched = {}
+        calls = 0
+        for start in range(0, len(missing), ARTISTS_PER_REQUEST):
+            chunk = missing[start:start + ARTISTS_PER_REQUEST]
+            try:
+                response = client.get_decoded("artists", token, {"ids": ",".join(chunk)}, decode_artists)
+            except (requests.exceptions.RequestException, msgspec.MsgspecError) as e:
+                logger.warning(f"Не удалось получить метаданные артистов: {e}. Использован только кэш")
+                break
+            calls += 1
+            client.metrics.record_items("artists", sum(1 for artist in response.artists if artist is not None))
+            for artist_id, artist in zip(chunk, response.artists):
+                fetched[artist_id] = None if artist is None else {
+                    "artist_genres": ",".join(artist.genres),
+                    "artist_followers": artist.followers.total if artist.followers else None,
+                }
+
+        if fetched:
+            self.cache.put_many(fetched)
+            self.lru.put_many(fetched)
+        with self._lock:
+            self.memory_hits += memory_hits
+            self.disk_hits += len(from_disk)
+            self.misses += len(missing)
+            self.negative += sum(1 for value in fetched.values() if value is None)
+            self.api_calls += calls
+
+        found.update(fetched)
+        return found
+
+    def enrich(self, df: pd.DataFrame, token: str) -> pd.DataFrame:
+        """
+        Добавляет к таблице колонки artist_genres и artist_followers.
+
+        Args:
+            df (pd.DataFrame): Таблица с колонкой artist_id.
+            token (str): Токен доступа.
+
+        Returns:
+            pd.DataFrame: Та же таблица с дополнительными колонками.
+        """
+        return self.enrich_frames({None: df}, token)[None]
+
+    def enrich_frames(self, frames: Dict[str, pd.DataFrame], token: str) -> Dict[str, pd.DataFrame]:
+        """
+        Обогащает таблицы нескольких пользователей одним проходом по уникальным ID.
+
+        Args:
+            frames (Dict[str, pd.DataFrame]): Таблицы с колонкой artist_id по пользователям.
+            token (str): Токен доступа для запросов к GET /artists.
+
+        Returns:
+            Dict[str, pd.DataFrame]: Те же таблицы с колонками artist_genres и artist_followers.
+        """
+        metadata = self.fetch((artist_id for df in frames.values() for artist_id in df["artist_id"]), token)
+        lookup = {column: {key: meta[column] for key, meta in metadata.items() if meta is not None}
+                  for column in ARTIST_COLUMNS}
+
+        for df in frames.values():
+            for column in ARTIST_COLUMNS:
+                df[column] = df["artist_id"].map(lookup[column])
+            df["artist_followers"] = df["artist_followers"].astype("Int64")
+        return frames
+
+    def stats(self) -> dict:
+        """
+        Возвращает счётчики кэша артистов.
+
+        Returns:
+            dict: memory_hits/disk_hits — уникальные ID из LRU и из SQLite,
+                misses — запрошено в API, negative — из них неизвестных Spotify,
+                api_calls — запросов к GET /artists.
+        """
+        with self._lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "negative": self.negative,
+                "api_calls": self.api_calls,
+            }
+
+
+
+_track_enricher: Optional[TrackEnricher] = None
+_artist_enricher: Optional[ArtistEnricher] = None
+_enricher_lock = threading.Lock()
+
+
+
+def get_track_enricher() -> TrackEnricher:
+    """
+    Возвращает общий для процесса TrackEnricher.
+
+    Returns:
+        TrackEnricher: Экземпляр, создаваемый при первом вызове.
+    """
+    global _track_enricher
+    if _track_enricher is None:
+        with _enricher_lock:
+            if _track_enricher is None:
+                _track_enricher = TrackEnricher()
+    return _track_enricher
+
+
+
+def get_artist_enricher() -> ArtistEnricher:
+    """
+    Возвращает общий для процесса ArtistEnricher.
+
+    Returns:
+        ArtistEnricher: Экземпляр, создаваемый при первом вызове.
+    """
+    global _artist_enricher
+    if _artist_enricher is None:
+        with _enricher_lock:
+            if _artist_enricher is None:
+                _artist_enricher = ArtistEnricher()
+    return _artist_enricher
@@ -0,0 +1,692 @@
+"""
+Единый движок извлечения прослушиваний с подключаемыми источниками.
+
+Источник (Source) отдаёт страницы recently-played (RecentlyPlayedPage),
+а движок (Extractor) один раз реализует всё остальное: отсечение по
+отметке, удаление повторов, нарезку на пачки в формате COLUMNS и
+обогащение метаданными. Поэтому у живого запуска, воспроизведения архива
+и загрузки истории одинаковые пачки, одна обработка ошибок и одни
+таймауты (пул соединений, повторы, кэш и выключатель — в spotify_client).
+
+Источники:
+- api — Spotify API через общий клиент (get_client());
+- mock — локальный мок API (mock_spotify_api) по адресу SPOTIFY_MOCK_URL;
+- archive — архив сырых ответов API (см. raw_archive);
+- export — выгрузка данных аккаунта Spotify (JSON-файлы истории).
+
+Новый источник подключается через register_source().
+
+Пример:
+    extractor = Extractor(make_source("archive", start_date="2026-01-01"))
+    for batch in extractor.iter_batches():
+        ...
+"""
+
+from __future__ import annotations
+
+import glob
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Tuple, Type, Union
+
+from decoding import (
+    Album,
+    Artist,
+    PlayColumns,
+    PlayHistory,
+    RecentlyPlayedPage,
+    Track,
+    arrow_schema,
+    concat_frames,
+    decode_archived_page,
+    decode_export,
+    decode_export_times,
+    decode_page,
+    is_arrow,
+    item_fields,
+)
+from raw_archive import RawArchiveWriter, archive_enabled, iter_archived_lines
+from watermark import load_watermark
+
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
+
+    from spotify_client import SpotifyClient
+
+logger = logging.getLogger(__name__)
+
+RECENTLY_PLAYED_PATH = "me/player/recently-played"
+PAGE_LIMIT = 50  # Максимум элементов на страницу, который отдаёт API
+BATCH_SIZE = 50  # Размер пачки записей для следующих этапов
+COLUMNS = ["song_name", "artist_name", "played_at", "timestamp", "track_id", "artist_id"]
+EXPORT_PATTERNS = ["endsong_*.json", "Streaming_History_Audio_*.json", "StreamingHistory*.json"]
+MOCK_URL = os.getenv("SPOTIFY_MOCK_URL", "http://127.0.0.1:8765/v1")
+
+
+
+@lru_cache(maxsize=None)
+def load_settings() -> dict:
+    """
+    Читает .env и настройки извлечения при первом обращении.
+
+    Returns:
+        dict: user_id (SPOTIFY_USER_ID, может быть None), enrich_tracks
+            (SPOTIFY_ENRICH_TRACKS), enrich_artists (SPOTIFY_ENRICH_ARTISTS),
+            quality_mode (SPOTIFY_QUALITY_MODE: fail, drop или quarantine).
+    """
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    return {
+        "user_id": os.getenv("SPOTIFY_USER_ID"),
+        "enrich_tracks": os.getenv("SPOTIFY_ENRICH_TRACKS", "1").lower() not in ("0", "false", "no"),
+        "enrich_artists": os.getenv("SPOTIFY_ENRICH_ARTISTS", "1").lower() not in ("0", "false", "no"),
+        "quality_mode": os.getenv("SPOTIFY_QUALITY_MODE", "fail").lower(),
+    }
+
+
+
+def default_user_id() -> str:
+    """
+    Возвращает пользователя по умолчанию (SPOTIFY_USER_ID).
+
+    Returns:
+        str: Идентификатор пользователя.
+
+    Raises:
+        ValueError: Если не задан пользователь или его токен (SPOTIFY_TOKEN или SPOTIFY_REFRESH_TOKEN).
+    """
+    user_id = load_settings()["user_id"]
+    if not user_id or not (os.getenv("SPOTIFY_TOKEN") or os.getenv("SPOTIFY_REFRESH_TOKEN")):
+        raise ValueError("Переменные USER_ID и\\или TOKEN (REFRESH_TOKEN) не найдены в .env")
+    return user_id
+
+
+
+def _access_token(user_id: Optional[str], token: Optional[str]) -> str:
+    """
+    Возвращает токен для запроса к API.
+
+    Токен запрашивается перед каждым запросом: менеджер отдаёт его из кэша
+    и заранее обновляет истекающие (см. auth), поэтому длинный постраничный
+    обход не упирается в срок действия токена.
+
+    Args:
+        user_id (Optional[str]): Пользователь Spotify. По умолчанию — SPOTIFY_USER_ID.
+        token (Optional[str]): Явно переданный токен; используется как есть.
+
+    Returns:
+        str: Access-токен.
+    """
+    if token:
+        return token
+    from auth import get_token_manager
+
+    return get_token_manager().get_token(user_id or default_user_id())
+
+
+
+def start_after_ms(user_id: Optional[str], days_back: float = 1) -> int:
+    """
+    Возвращает нижнюю границу выборки для очередного запуска.
+
+    Args:
+        user_id (Optional[str]): Пользователь Spotify; None — отметка не читается.
+        days_back (float): Глубина первой выборки, если отметки последней загрузки нет.
+
+    Returns:
+        int: Отметка последней загрузки пользователя или момент days_back дней назад
+            (Unix-время в миллисекундах).
+    """
+    after_ms = load_watermark(user_id) if user_id else None
+    if after_ms is None:
+        after_ms = int((datetime.now() - timedelta(days=days_back)).timestamp() * 1000)
+    return after_ms
+
+
+
+def _newer_than(batch: Union[pd.DataFrame, pa.RecordBatch], after_ms: int) -> Union[pd.DataFrame, pa.RecordBatch]:
+    """
+    Отбирает строки пачки с played_at позже after_ms.
+
+    Строки без времени (NULL) сохраняются: их отклоняет проверка качества.
+    """
+    if is_arrow(batch):
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        older = pc.less_equal(batch.column("played_at"), pa.scalar(after_ms, pa.timestamp("ms", tz="UTC")))
+        return batch.filter(pc.invert(pc.fill_null(older, False)))
+
+    import pandas as pd
+
+    older = batch["played_at"] <= pd.Timestamp(after_ms, unit="ms", tz="UTC")  # NaT даёт False
+    return batch[~older].reset_index(drop=True)
+
+
+
+def iter_batches_from_pages(
+    pages: Iterable[RecentlyPlayedPage],
+    after_ms: int = 0,
+    batch_size: int = BATCH_SIZE,
+    arrow: bool = False,
+) -> Iterator[Union[pd.DataFrame, pa.RecordBatch]]:
+    """
+    Разбирает страницы ответов в пачки записей фиксированного размера.
+
+    Источник страниц не важен (см. Source), поэтому разбор выполняется одинаково.
+    Время прослушивания разбирается один раз, при сборке пачки (см.
+    decoding.parse_played_at()), и записи не новее after_ms отсекаются
+    сравнением целых миллисекунд по всей пачке. Поэтому пачка может быть
+    меньше batch_size, если в ней были такие записи.
+
+    Args:
+        pages (Iterable[RecentlyPlayedPage]): Декодированные ответы recently-played.
+        after_ms (int): Записи не новее этой отметки (в миллисекундах) отбрасываются.
+        batch_size (int): Количество записей в одной пачке.
+        arrow (bool): Отдавать пачки Arrow (схема decoding.arrow_schema()) вместо DataFrame.
+
+    Yields:
+        Union[pd.DataFrame, pa.RecordBatch]: Пачка с колонками song_name, artist_name,
+            played_at, timestamp, track_id, artist_id.
+    """
+    build = PlayColumns.to_record_batch if arrow else PlayColumns.to_frame
+
+    def emit(columns: PlayColumns) -> Iterator[Union[pd.DataFrame, pa.RecordBatch]]:
+        batch = build(columns)
+        if after_ms:
+            # Ссылка next может не сохранять after — отбрасываем старые записи
+            batch = _newer_than(batch, after_ms)
+        if len(batch):
+            yield batch
+
+    columns = PlayColumns()
+    seen = set()  # Страницы по курсорам могут пересекаться
+
+    for page in pages:
+        for item in page.items or ():
+            fields = item_fields(item)
+            if fields is None:
+                logger.warning(f"Пропущен элемент без обязательных полей: played_at={item.played_at}")
+                continue
+
+            played_at = fields[2]
+            if played_at in seen:
+                continue
+            seen.add(played_at)
+            columns.append(*fields)
+
+            if len(columns) == batch_size:
+                yield from emit(columns)
+                columns = PlayColumns()
+
+    if len(columns):
+        yield from emit(columns)
+
+
+
+class Source:
+    """
+    Источник страниц recently-played.
+
+    Подкласс реализует iter_pages(). Источник с online = True обращается
+    к API, поэтому для его записей доступно обогащение (см. Extractor).
+    """
+
+    name = "source"
+    online = False
+
+    def iter_pages(self, after_ms: int = 0) -> Iterator[RecentlyPlayedPage]:
+        """
+        Отдаёт страницы с прослушиваниями.
+
+        Источник может отдавать и записи не новее after_ms: они отсекаются
+        в iter_batches_from_pages().
+
+        Args:
+            after_ms (int): Нижняя граница выборки (Unix-время в миллисекундах).
+
+        Yields:
+            RecentlyPlayedPage: Страница ответа.
+        """
+        raise NotImplementedError
+
+    def access_token(self) -> Optional[str]:
+        """Токен для запросов обогащения; None — источник работает без API."""
+        return None
+
+
+
+class ApiSource(Source):
+    """
+    Spotify API: постраничный обход по курсорам с архивированием ответов.
+
+    Args:
+        user_id (Optional[str]): Пользователь Spotify. По умолчанию — SPOTIFY_USER_ID.
+        token (Optional[str]): Токен доступа. По умолчанию — токен пользователя из auth.
+        client (Optional[SpotifyClient]): Клиент API. По умолчанию — get_client().
+        archive (Optional[bool]): Сохранять ли страницы в архив сырых ответов.
+            По умолчанию — SPOTIFY_ARCHIVE (см. raw_archive).
+    """
+
+    name = "api"
+    online = True
+
+    def __init__(
+        self,
+        user_id: Optional[str] = None,
+        token: Optional[str] = None,
+        client: Optional[SpotifyClient] = None,
+        archive: Optional[bool] = None,
+    ):
+        self.user_id = user_id
+        self.token = token
+        self._client = client
+        self.archive = archive_enabled() if archive is None else archive
+
+    @property
+    def client(self) -> SpotifyClient:
+        """Клиент API (общий для процесса, если не передан явно)."""
+        if self._client is None:
+            from spotify_client import get_client
+
+            self._client = get_client()
+        return self._client
+
+    def access_token(self) -> str:
+        return _access_token(self.user_id, self.token)
+
+    def iter_pages(self, after_ms: int = 0) -> Iterator[RecentlyPlayedPage]:
+        """
+        Постранично запрашивает историю прослушиваний, следуя курсорам API.
+
+        Первый запрос уходит с параметром after, следующие — по ссылке из поля
+        next ответа. Перебор заканчивается, когда next пуст, страница не содержит
+        элементов или курсор повторился. Ответы 5xx и ошибки соединения клиент
+        повторяет сам (см. SpotifyClient.get_raw()); если при этом выключатель
+        разомкнулся (API деградировал), вместо ожидания таймаутов отдаются
+        страницы из архива сырых ответов (см. ArchiveSource). Архив содержит
+        только ранее полученные ответы, поэтому так восполняются лишь
+        архивированные, но ещё не загруженные прослушивания новее after_ms;
+        остальные будут извлечены из API после его восстановления. Если таких
+        страниц в архиве нет, ошибка выключателя пробрасывается.
+
+        Args:
+            after_ms (int): Нижняя граница выборки (Unix-время в миллисекундах).
+
+        Yields:
+            RecentlyPlayedPage: Декодированная страница ответа (см. decoding).
+
+        Raises:
+            CircuitOpenError: API недоступен, а в архиве нет страниц новее after_ms.
+            requests.exceptions.RequestException: Ошибка HTTP-запроса.
+        """
+        import requests
+
+        from circuit_breaker import CircuitOpenError
+
+        client = self.client
+        # Токен из менеджера можно обновить после 401, явно переданный — нет
+        owner = None if self.token else self.user_id or default_user_id()
+        archive = RawArchiveWriter(self.user_id or default_user_id()) if self.archive else None
+        url = RECENTLY_PLAYED_PATH
+        params = {"limit": PAGE_LIMIT, "after": after_ms}
+        visited = set()
+
+        try:
+            while url and url not in visited:
+                visited.add(url)
+                try:
+                    raw = client.get_raw(url, self.access_token(), params, owner)
+                except CircuitOpenError as e:
+                    logger.warning(f"{e}. Используются архивированные ответы")
+                    fallback = 0
+                    for page in ArchiveSource(user_id=self.user_id or default_user_id()).iter_pages(after_ms):
+                        fallback += 1
+                        yield page
+                    if not fallback:
+                        raise
+                    logger.info(f"Из архива получено страниц: {fallback}")
+                    return
+                except requests.exceptions.RequestException as e:
+                    logger.error(f"Ошибка при запросе к API: {e}")
+                    raise
+
+                page = decode_page(raw)
+                client.metrics.record_items(client.endpoint(client.url(url)), len(page.items or ()))
+                if not page.items:
+                    return
+                if archive is not None:
+                    archive.write_page(client.url(url), raw, [item.played_at for item in page.items if item.played_at])
+                yield page
+
+                # Ссылка next уже содержит все параметры запроса
+                url = page.next
+                params = None
+        finally:
+            if archive is not None:
+                archive.close()
+
+
+
+class MockSource(ApiSource):
+    """
+    Локальный мок Spotify API (см. mock_spotify_api).
+
+    Мок определяет пользователя по токену, поэтому токеном служит user_id.
+    Ответы мока в архив по умолчанию не попадают.
+
+    Args:
+        base_url (Optional[str]): Адрес мока. По умолчанию — SPOTIFY_MOCK_URL.
+        user_id (str): Пользователь мока.
+        archive (bool): Сохранять ли страницы в архив сырых ответов.
+    """
+
+    name = "mock"
+
+    def __init__(self, base_url: Optional[str] = None, user_id: str = "mock-user", archive: bool = False):
+        from spotify_client import SpotifyClient
+
+        super().__init__(user_id, user_id, SpotifyClient(base_url=base_url or MOCK_URL), archive)
+
+
+
+class ArchiveSource(Source):
+    """
+    Архив сырых ответов API, без обращения к сети.
+
+    Строки архива декодируются сразу в типизированные страницы. Файлы,
+    в которых нет прослушиваний нужного периода, пропускаются по индексу.
+
+    Args:
+        start_date (Optional[str]): Первая дата раздела архива (YYYY-MM-DD).
+        end_date (Optional[str]): Последняя дата раздела архива (YYYY-MM-DD).
+        user_id (Optional[str]): Только ответы этого пользователя.
+        played_from (Optional[str]): Нижняя граница played_at (ISO 8601) для выбора файлов.
+        played_to (Optional[str]): Верхняя граница played_at (ISO 8601) для выбора файлов.
+    """
+
+    name = "archive"
+
+    def __init__(
+        self,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        user_id: Optional[str] = None,
+        played_from: Optional[str] = None,
+        played_to: Optional[str] = None,
+    ):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.user_id = user_id
+        self.played_from = played_from
+        self.played_to = played_to
+
+    def iter_pages(self, after_ms: int = 0) -> Iterator[RecentlyPlayedPage]:
+        played_from = self.played_from
+        if after_ms and played_from is None:
+            played_from = datetime.fromtimestamp(after_ms / 1000, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+        for line in iter_archived_lines(self.start_date, self.end_date, self.user_id, played_from=played_from, played_to=self.played_to):
+            yield decode_archived_page(line).page
+
+
+
+class ExportSource(Source):
+    """
+    Выгрузка данных аккаунта Spotify (расширенная или базовая история).
+
+    Записи выгрузки переводятся в элементы страниц recently-played, поэтому
+    дальше проходят тот же разбор, что и ответы API. Записи без названия
+    трека или артиста (подкасты, аудиокниги) пропускаются.
+
+    Args:
+        path (Union[str, List[str]]): JSON-файл выгрузки, каталог с ними
+            (endsong_*.json, Streaming_History_Audio_*.json, StreamingHistory*.json)
+            или список файлов.
+        page_size (int): Количество записей в одной странице.
+    """
+
+    name = "export"
+
+    def __init__(self, path: Union[str, List[str]], page_size: int = PAGE_LIMIT):
+        self.path = path
+        self.page_size = page_size
+
+    def files(self) -> List[str]:
+        """Файлы выгрузки в порядке имён."""
+        if isinstance(self.path, list):
+            return list(self.path)
+        if not os.path.isdir(self.path):
+            return [self.path]
+        return sorted({
+            f for pattern in EXPORT_PATTERNS
+            for f in glob.glob(os.path.join(self.path, "**", pattern), recursive=True)
+        })
+
+    def time_ranges(self) -> List[Tuple[str, str, str]]:
+        """
+        Возвращает период записей каждого файла выгрузки.
+
+        Из файлов разбирается только время записей (см. decoding.decode_export_times()),
+        поэтому проход по выгрузке заметно дешевле полного чтения.
+
+        Returns:
+            List[Tuple[str, str, str]]: (файл, первое, последнее время) — время
+                в ISO 8601 без зоны (YYYY-MM-DDTHH:MM:SS, UTC). Файлы без записей пропускаются.
+        """
+        ranges = []
+        for file_path in self.files():
+            with open(file_path, "rb") as f:
+                times = [
+                    record.ts if record.ts is not None else f"{record.endTime.replace(' ', 'T')}:00"
+                    for record in decode_export_times(f.read())
+                    if record.ts is not None or record.endTime is not None
+                ]
+            if times:
+                ranges.append((file_path, min(times)[:19], max(times)[:19]))
+        return ranges
+
+    def iter_pages(self, after_ms: int = 0) -> Iterator[RecentlyPlayedPage]:
+        items = []
+        for file_path in self.files():
+            with open(file_path, "rb") as f:
+                records = decode_export(f.read())
+            for record in records:
+                if record.ts is not None:
+                    song, artist, played_at = record.master_metadata_track_name, record.master_metadata_album_artist_name, record.ts
+                elif record.endTime is not None:
+                    # Базовая история хранит время с точностью до минуты: "YYYY-MM-DD HH:MM"
+                    song, artist, played_at = record.trackName, record.artistName, f"{record.endTime.replace(' ', 'T')}:00Z"
+                else:
+                    continue
+                if not song or not artist:
+                    continue
+                uri = record.spotify_track_uri
+                track = Track(id=uri.rsplit(":", 1)[-1] if uri else None, name=song, album=Album([Artist(name=artist)]))
+                items.append(PlayHistory(played_at, track))
+                if len(items) == self.page_size:
+                    yield RecentlyPlayedPage(items)
+                    items = []
+        if items:
+            yield RecentlyPlayedPage(items)
+
+
+
+SOURCES: Dict[str, Type[Source]] = {
+    "api": ApiSource,
+    "mock": MockSource,
+    "archive": ArchiveSource,
+    "export": ExportSource,
+}
+
+
+
+def register_source(name: str, source_class: Type[Source]) -> None:
+    """
+    Подключает новый тип источника.
+
+    Args:
+        name (str): Имя источника для make_source().
+        source_class (Type[Source]): Класс источника.
+    """
+    SOURCES[name] = source_class
+
+
+
+def make_source(name: str, **options) -> Source:
+    """
+    Создаёт источник по имени.
+
+    Args:
+        name (str): api, mock, archive, export или имя из register_source().
+        **options: Параметры конструктора источника.
+
+    Returns:
+        Source: Источник страниц.
+
+    Raises:
+        ValueError: Если источник с таким именем не зарегистрирован.
+    """
+    if name not in SOURCES:
+        raise ValueError(f"Неизвестный источник: {name}. Доступны: {', '.join(sorted(SOURCES))}")
+    return SOURCES[name](**options)
+
+
+
+class Extractor:
+    """
+    Движок извлечения: страницы источника -> пачки записей -> обогащение.
+
+    Пачки имеют колонки COLUMNS (и колонки обогащения): DataFrame или, при
+    arrow, пачки Apache Arrow с типизированными колонками (время —
+    timestamp[ms, UTC], строки — словарём; см. decoding.arrow_schema()).
+    Обогащение применяется только к источникам, которые обращаются к API.
+
+    Args:
+        source (Source): Источник страниц.
+        batch_size (int): Количество записей в одной пачке.
+        enrich_tracks (Optional[bool]): Дополнять ли пачки метаданными треков.
+            По умолчанию — SPOTIFY_ENRICH_TRACKS для источников API, иначе нет.
+        enrich_artists (Optional[bool]): Дополнять ли пачки метаданными артистов.
+            По умолчанию — SPOTIFY_ENRICH_ARTISTS для источников API, иначе нет.
+        arrow (bool): Отдавать пачки pa.RecordBatch вместо DataFrame.
+    """
+
+    def __init__(
+        self,
+        source: Source,
+        batch_size: int = BATCH_SIZE,
+        enrich_tracks: Optional[bool] = None,
+        enrich_artists: Optional[bool] = None,
+        arrow: bool = False,
+    ):
+        self.source = source
+        self.batch_size = batch_size
+        self.arrow = arrow
+        settings = load_settings() if source.online else {"enrich_tracks": False, "enrich_artists": False}
+        self.enrich_tracks = settings["enrich_tracks"] if enrich_tracks is None else enrich_tracks
+        self.enrich_artists = settings["enrich_artists"] if enrich_artists is None else enrich_artists
+        self.pages = 0
+        self.rows = 0
+        self.seconds = 0.0
+
+    def _counted_pages(self, after_ms: int) -> Iterator[RecentlyPlayedPage]:
+        for page in self.source.iter_pages(after_ms):
+            self.pages += 1
+            yield page
+
+    def iter_batches(self, after_ms: int = 0) -> Iterator[Union[pd.DataFrame, pa.RecordBatch]]:
+        """
+        Потоково отдаёт пачки записей новее after_ms.
+
+        В памяти одновременно находятся только текущая страница и одна пачка,
+        поэтому следующие этапы могут начинать работу до окончания извлечения.
+        Последняя пачка может быть меньше batch_size.
+
+        Args:
+            after_ms (int): Нижняя граница выборки (Unix-время в миллисекундах); 0 — без границы.
+
+        Yields:
+            Union[pd.DataFrame, pa.RecordBatch]: Пачка с колонками COLUMNS
+                (и колонками обогащения).
+
+        Raises:
+            requests.exceptions.RequestException: Ошибка HTTP-запроса (источники API).
+        """
+        if self.enrich_tracks or self.enrich_artists:
+            from enrichment import get_artist_enricher, get_track_enricher
+
+        started = time.perf_counter()
+        try:
+            for batch in iter_batches_from_pages(self._counted_pages(after_ms), after_ms, self.batch_size, self.arrow):
+                if self.enrich_tracks or self.enrich_artists:
+                    batch = self._enrich(batch, get_track_enricher(), get_artist_enricher())
+                self.rows += len(batch)
+                yield batch
+        finally:
+            self.seconds += time.perf_counter() - started
+
+    def _enrich(self, batch, track_enricher, artist_enricher):
+        """Дополняет пачку метаданными; пачка Arrow обогащается через DataFrame."""
+        frame = batch.to_pandas() if self.arrow else batch
+        if self.enrich_tracks:
+            frame = track_enricher.enrich(frame, self.source.access_token())
+        if self.enrich_artists:
+            frame = artist_enricher.enrich(frame, self.source.access_token())
+        if not self.arrow:
+            return frame
+        import pyarrow as pa
+
+        # Исходные колонки остаются как есть, из DataFrame берутся только новые
+        added = [column for column in frame.columns if column not in batch.schema.names]
+        return pa.RecordBatch.from_arrays(
+            batch.columns + [pa.array(frame[column], from_pandas=True) for column in added],
+            names=batch.schema.names + added,
+        )
+
+    def collect(self, after_ms: int = 0) -> Union[pd.DataFrame, pa.Table]:
+        """
+        Собирает все пачки в одну таблицу.
+
+        Args:
+            after_ms (int): Нижняя граница выборки (Unix-время в миллисекундах); 0 — без границы.
+
+        Returns:
+            Union[pd.DataFrame, pa.Table]: Таблица с колонками COLUMNS (пустая,
+                если записей нет). Пачки Arrow объединяются без копирования,
+                пачки pandas — с общими категориями (см. concat_frames()).
+        """
+        if self.arrow:
+            import pyarrow as pa
+
+            tables = [pa.Table.from_batches([batch]) for batch in self.iter_batches(after_ms)]
+            if not tables:
+                return arrow_schema().empty_table()
+            # Колонки обогащения без значений в одной пачке имеют тип null
+            return pa.concat_tables(tables, promote_options="default")
+
+        import pandas as pd
+
+        batches = list(self.iter_batches(after_ms))
+        if not batches:
+            return pd.DataFrame(columns=COLUMNS)
+        return concat_frames(batches)  # Общий словарь строк вместо перехода в object
+
+    def stats(self) -> dict:
+        """
+        Возвращает счётчики извлечения.
+
+        Returns:
+            dict: source, pages, rows, seconds, rows_per_second.
+        """
+        return {
+            "source": self.source.name,
+            "pages": self.pages,
+            "rows": self.rows,
+            "seconds": round(self.seconds, 3),
+            "rows_per_second": round(self.rows / self.seconds) if self.seconds else 0,
+        }
@@ -0,0 +1,287 @@
+"""
+Постоянный индекс загруженных прослушиваний для отсева повторов между запусками.
+
+Проверка качества ищет повторы played_at только внутри текущей пачки.
+Повтор уже загруженной строки (перекрытие окон backfill, повторный запуск
+после потери отметки, воспроизведение архива) раньше обнаруживался только
+на загрузке — нарушением первичного ключа, из-за которого падала вся пачка.
+
+KeyIndex хранит played_at загруженных строк пользователя как
+отсортированный массив int64 (Unix-время в миллисекундах, 8 байт на ключ)
+в файле <SPOTIFY_KEY_INDEX_DIR>/<user>.npy. Проверка пачки — один
+np.searchsorted по массиву, O(m log n) без обращения к БД.
+
+Индекс — только предварительный фильтр перед загрузкой: источник истины —
+первичный ключ my_played_tracks (загрузка через db.upsert_plays() с
+ON CONFLICT DO NOTHING). Таблица не хранит пользователя, поэтому индекс
+ведётся только для её владельца (SPOTIFY_USER_ID, см. table_owner());
+для другого пользователя load() поднимает ValueError. При загрузке с БД
+индекс сверяется с таблицей (число строк и последний played_at): если
+файла нет или он расходится с таблицей (другой воркер, удалённые строки,
+устаревшая копия), индекс строится заново по my_played_tracks.
+
+Файл перезаписывается атомарно через временный файл, как отметка
+последней загрузки (см. watermark). Замер: benchmarks/bench_key_index.py.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+from typing import TYPE_CHECKING, Optional, Tuple, Union
+
+import numpy as np
+
+from decoding import is_arrow
+
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_KEY_INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "state", "keys")
+DEFAULT_USER = "default"
+
+
+
+def index_path(user_id: Optional[str]) -> str:
+    """
+    Возвращает путь к файлу индекса пользователя.
+
+    Args:
+        user_id (Optional[str]): Идентификатор пользователя Spotify.
+
+    Returns:
+        str: Путь в каталоге SPOTIFY_KEY_INDEX_DIR.
+    """
+    directory = os.getenv("SPOTIFY_KEY_INDEX_DIR", DEFAULT_KEY_INDEX_DIR)
+    return os.path.join(directory, f"{user_id or DEFAULT_USER}.npy")
+
+
+
+def table_owner() -> str:
+    """
+    Возвращает пользователя, чьи прослушивания хранит my_played_tracks.
+
+    Returns:
+        str: SPOTIFY_USER_ID или пользователь по умолчанию.
+    """
+    from extractor import load_settings
+
+    return load_settings()["user_id"] or DEFAULT_USER
+
+
+
+def played_at_keys(data: Union[pd.DataFrame, pa.RecordBatch, pa.Table]) -> np.ndarray:
+    """
+    Переводит колонку played_at в ключи индекса.
+
+    Args:
+        data (Union[pd.DataFrame, pa.RecordBatch, pa.Table]): Прослушивания.
+
+    Returns:
+        np.ndarray: Unix-время в миллисекундах (int64) в порядке строк.
+    """
+    import pandas as pd
+
+    if is_arrow(data):
+        import pyarrow as pa
+
+        column = data.column("played_at")
+        if pa.types.is_timestamp(column.type):
+            # timestamp[ms] хранится как int64: перевод без разбора строк
+            return column.cast(pa.timestamp("ms", tz="UTC")).cast(pa.int64()).to_numpy()
+        column = column.to_pandas()
+    else:
+        column = data["played_at"]
+        if isinstance(column.dtype, pd.DatetimeTZDtype):  # Время уже разобрано при извлечении
+            return column.values.astype("datetime64[ms]").astype(np.int64)
+    # Строки ISO 8601: прочитанные из БД до перехода на TIMESTAMPTZ или из внешних таблиц
+    parsed = pd.to_datetime(column, utc=True, format="ISO8601")
+    return parsed.values.astype("datetime64[ms]").astype(np.int64)  # values — UTC без зоны
+
+
+
+def _keys_from_db(engine) -> np.ndarray:
+    """Читает played_at всех загруженных прослушиваний из my_played_tracks."""
+    import pandas as pd
+    from sqlalchemy import text
+
+    with engine.connect() as conn:
+        df = pd.read_sql(text("SELECT played_at FROM my_played_tracks"), conn)
+    return np.unique(played_at_keys(df)) if len(df) else np.empty(0, dtype=np.int64)
+
+
+
+def _table_summary(engine) -> Tuple[int, Optional[int]]:
+    """Число строк my_played_tracks и последний played_at (мс) для сверки индекса."""
+    import pandas as pd
+    from sqlalchemy import text
+
+    with engine.connect() as conn:
+        count, latest = conn.execute(text("SELECT count(*), max(played_at) FROM my_played_tracks")).one()
+    if latest is None:
+        return int(count), None
+    return int(count), int(played_at_keys(pd.DataFrame({"played_at": [latest]}))[0])
+
+
+
+class KeyIndex:
+    """
+    Отсортированный массив ключей (played_at в миллисекундах) загруженных строк.
+
+    Args:
+        user_id (Optional[str]): Идентификатор пользователя Spotify.
+        keys (Optional[np.ndarray]): Отсортированные уникальные ключи.
+    """
+
+    def __init__(self, user_id: Optional[str] = None, keys: Optional[np.ndarray] = None):
+        self.user_id = user_id or DEFAULT_USER
+        self.keys = keys if keys is not None else np.empty(0, dtype=np.int64)
+
+    @classmethod
+    def load(cls, user_id: Optional[str] = None, engine=None) -> "KeyIndex":
+        """
+        Загружает индекс владельца my_played_tracks с диска.
+
+        Args:
+            user_id (Optional[str]): Идентификатор пользователя Spotify.
+            engine (Optional[sqlalchemy.engine.Engine]): БД для сверки индекса
+                с таблицей и его построения. Без неё индекс берётся из файла как
+                есть, а отсутствующий считается пустым.
+
+        Returns:
+            KeyIndex: Индекс с ключами всех загруженных строк.
+
+        Raises:
+            ValueError: Если user_id — не владелец my_played_tracks.
+        """
+        owner = table_owner()
+        if (user_id or DEFAULT_USER) != owner:
+            raise ValueError(
+                f"my_played_tracks хранит прослушивания одного пользователя ({owner}): "
+                f"индекс ключей для {user_id} не ведётся"
+            )
+
+        path = index_path(user_id)
+        keys = np.load(path) if os.path.exists(path) else None
+        if engine is None:
+            return cls(user_id, keys)
+
+        try:
+            count, latest = _table_summary(engine)
+            if keys is not None and len(keys) == count and (count == 0 or keys[-1] == latest):
+                return cls(user_id, keys)
+            if keys is not None:
+                logger.warning(
+                    f"Индекс ключей для {owner} расходится с my_played_tracks "
+                    f"({len(keys)} ключей, в таблице {count} строк): строится заново"
+                )
+            keys = _keys_from_db(engine)
+        except Exception as e:
+            # Например, таблицы ещё нет: отсеивать нечего, повторы отсечёт первичный ключ
+            logger.warning(f"Не удалось сверить индекс ключей с БД: {e}")
+            return cls(user_id)
+        index = cls(user_id, keys)
+        index.save()
+        logger.info(f"Индекс ключей для {index.user_id} построен по БД: {len(keys)} ключей")
+        return index
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def contains(self, keys: np.ndarray) -> np.ndarray:
+        """
+        Проверяет, какие ключи уже есть в индексе.
+
+        Args:
+            keys (np.ndarray): Ключи в любом порядке.
+
+        Returns:
+            np.ndarray: Булева маска той же длины.
+        """
+        if not len(self.keys):
+            return np.zeros(len(keys), dtype=bool)
+        positions = np.searchsorted(self.keys, keys)
+        found = np.zeros(len(keys), dtype=bool)
+        inside = positions < len(self.keys)
+        found[inside] = self.keys[positions[inside]] == keys[inside]
+        return found
+
+    def between(self, low_ms: int, high_ms: int) -> "KeyIndex":
+        """
+        Часть индекса с ключами из [low_ms, high_ms) — для передачи в процесс окна.
+
+        Returns:
+            KeyIndex: Индекс того же пользователя (срез без копирования).
+        """
+        low, high = np.searchsorted(self.keys, [low_ms, high_ms])
+        return KeyIndex(self.user_id, self.keys[low:high])
+
+    def filter_new(
+        self,
+        data: Union[pd.DataFrame, pa.RecordBatch, pa.Table],
+    ) -> Union[pd.DataFrame, pa.RecordBatch, pa.Table]:
+        """
+        Отбрасывает строки, чей played_at уже загружен.
+
+        Args:
+            data (Union[pd.DataFrame, pa.RecordBatch, pa.Table]): Прослушивания.
+
+        Returns:
+            Union[pd.DataFrame, pa.RecordBatch, pa.Table]: Только новые строки в том же формате.
+        """
+        if len(data) == 0 or not len(self.keys):
+            return data
+        loaded = self.contains(played_at_keys(data))
+        if not loaded.any():
+            return data
+        logger.info(f"Отброшено уже загруженных строк: {int(loaded.sum())} из {len(data)}")
+        if is_arrow(data):
+            return data.filter(~loaded)
+        return data[~loaded].reset_index(drop=True)
+
+    def add(self, data: Union[pd.DataFrame, pa.RecordBatch, pa.Table, np.ndarray]) -> None:
+        """
+        Добавляет в индекс ключи загруженных строк.
+
+        Args:
+            data (Union[pd.DataFrame, pa.RecordBatch, pa.Table, np.ndarray]): Загруженные
+                прослушивания или их ключи.
+        """
+        keys = np.unique(data if isinstance(data, np.ndarray) else played_at_keys(data))
+        keys = keys[~self.contains(keys)]
+        if len(keys):
+            # Слияние отсортированных массивов за O(n + m): индекс не пересортировывается
+            self.keys = np.insert(self.keys, np.searchsorted(self.keys, keys), keys)
+
+    def save(self) -> None:
+        """Атомарно записывает индекс в файл через временный файл."""
+        path = index_path(self.user_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, self.keys)
+        os.replace(tmp_path, path)
+
+
+
+def drop_key_indexes() -> int:
+    """
+    Удаляет индексы всех пользователей (вместе с таблицей my_played_tracks).
+
+    Иначе индекс продолжит отсеивать строки, которых в БД уже нет.
+
+    Returns:
+        int: Число удалённых файлов.
+    """
+    directory = os.getenv("SPOTIFY_KEY_INDEX_DIR", DEFAULT_KEY_INDEX_DIR)
+    if not os.path.isdir(directory):
+        return 0
+    removed = 0
+    for name in os.listdir(directory):
+        if name.endswith(".npy"):
+            os.remove(os.path.join(directory, name))
+            removed += 1
+    return removed
@@ -0,0 +1,397 @@
+"""
+Метрики запросов к Spotify API: гистограммы задержек, размеров и счётчики.
+
+Для каждого эндпоинта собираются:
+- длительности фаз запроса: dns, connect (TCP), tls, ttfb (от отправки до
+  заголовков ответа без установки соединения) и total (с чтением тела);
+- размер тела ответа в байтах и число элементов в ответе;
+- число ответов по статусам (error — запрос завершился исключением).
+
+Фазы dns/connect/tls есть только у запросов, открывших новое соединение;
+запросы по keep-alive соединению их не пишут.
+
+Значения хранятся в гистограммах с логарифмически-линейными корзинами, как
+в HdrHistogram: относительная погрешность не больше 2**-SUB_BUCKET_BITS при
+памяти O(число занятых корзин), поэтому перцентили хвоста (p99) точны и для
+миллионов запросов. В конце запуска метрики выгружаются в формате
+textfile collector Prometheus и/или JSON (см. RequestMetrics.export()).
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_METRICS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "state", "metrics")
+METRICS_FORMATS = os.getenv("SPOTIFY_METRICS_FORMATS", "prom,json")  # Пусто — не выгружать
+SUB_BUCKET_BITS = 5  # 32 линейные корзины на каждую степень двойки, погрешность ~3%
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+PHASES = ("dns", "connect", "tls", "ttfb", "total")
+
+
+
+class Histogram:
+    """
+    Гистограмма неотрицательных целых значений с логарифмически-линейными корзинами.
+
+    Значения меньше 2**sub_bucket_bits хранятся точно, большие — в корзинах
+    шириной 2**k внутри каждого диапазона [2**n, 2**(n+1)).
+
+    Args:
+        sub_bucket_bits (int): Число бит линейной части (точность).
+    """
+
+    __slots__ = ("sub_bits", "sub_count", "counts", "count", "sum", "min", "max")
+
+    def __init__(self, sub_bucket_bits: int = SUB_BUCKET_BITS):
+        self.sub_bits = sub_bucket_bits
+        self.sub_count = 1 << sub_bucket_bits
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.sum = 0
+        self.min: Optional[int] = None
+        self.max: Optional[int] = None
+
+    def _index(self, value: int) -> int:
+        if value < self.sub_count:
+            return value
+        shift = value.bit_length() - self.sub_bits - 1
+        return (shift + 1) * self.sub_count + (value >> shift) - self.sub_count
+
+    def _value(self, index: int) -> int:
+        """Середина корзины."""
+        if index < self.sub_count:
+            return index
+        shift = index // self.sub_count - 1
+        lower = (index % self.sub_count + self.sub_count) << shift
+        return lower + ((1 << shift) - 1) // 2
+
+    def record(self, value: int) -> None:
+        """
+        Добавляет значение.
+
+        Args:
+            value (int): Неотрицательное значение (отрицательные считаются нулём).
+        """
+        value = max(int(value), 0)
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, quantile: float) -> int:
+        """
+        Возвращает значение квантиля.
+
+        Args:
+            quantile (float): Квантиль от 0 до 1.
+
+        Returns:
+            int: Значение с точностью корзины (0 для пустой гистограммы).
+        """
+        if not self.count:
+            return 0
+        rank = max(int(quantile * self.count + 0.999999), 1)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(max(self._value(index), self.min), self.max)
+        return self.max
+
+    def summary(self, scale: float = 1.0) -> dict:
+        """
+        Возвращает сводку гистограммы.
+
+        Args:
+            scale (float): Множитель для перевода единиц (например, мкс -> с).
+
+        Returns:
+            dict: count, sum, min, max, p50, p90, p95, p99.
+        """
+        result = {
+            "count": self.count,
+            "sum": round(self.sum * scale, 6),
+            "min": round((self.min or 0) * scale, 6),
+            "max": round((self.max or 0) * scale, 6),
+        }
+        for quantile in QUANTILES:
+            result[f"p{int(quantile * 100)}"] = round(self.percentile(quantile) * scale, 6)
+        return result
+
+
+
+class RequestMetrics:
+    """
+    Потокобезопасный набор метрик запросов по эндпоинтам.
+
+    Длительности хранятся в микросекундах, в выгрузке переводятся в секунды.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, dict] = {}
+
+    def _endpoint(self, endpoint: str) -> dict:
+        data = self._endpoints.get(endpoint)
+        if data is None:
+            data = self._endpoints[endpoint] = {
+                "phases": {phase: Histogram() for phase in PHASES},
+                "bytes": Histogram(),
+                "items": Histogram(),
+                "status": {},
+            }
+        return data
+
+    def record_request(
+        self,
+        endpoint: str,
+        status: str,
+        phases: Dict[str, float],
+        size: Optional[int] = None,
+    ) -> None:
+        """
+        Учитывает один HTTP-запрос.
+
+        Args:
+            endpoint (str): Эндпоинт (например, tracks).
+            status (str): Код ответа или error.
+            phases (Dict[str, float]): Длительности фаз в секундах (отсутствующие не пишутся).
+            size (Optional[int]): Размер тела ответа в байтах.
+        """
+        with self._lock:
+            data = self._endpoint(endpoint)
+            data["status"][status] = data["status"].get(status, 0) + 1
+            for phase, seconds in phases.items():
+                data["phases"][phase].record(seconds * 1_000_000)
+            if size is not None:
+                data["bytes"].record(size)
+
+    def record_items(self, endpoint: str, items: int) -> None:
+        """
+        Учитывает число элементов в разобранном ответе.
+
+        Args:
+            endpoint (str): Эндпоинт.
+            items (int): Число элементов (записей истории, треков, артистов).
+        """
+        with self._lock:
+            self._endpoint(endpoint)["items"].record(items)
+
+    def to_dict(self) -> dict:
+        """
+        Возвращает сводку метрик.
+
+        Returns:
+            dict: {endpoint: {"status": {...}, "seconds": {phase: summary},
+                "response_bytes": summary, "items": summary}}.
+        """
+        with self._lock:
+            return {
+                endpoint: {
+                    "status": dict(data["status"]),
+                    "seconds": {
+                        phase: histogram.summary(1e-6)
+                        for phase, histogram in data["phases"].items() if histogram.count
+                    },
+                    "response_bytes": data["bytes"].summary(),
+                    "items": data["items"].summary(),
+                }
+                for endpoint, data in self._endpoints.items()
+            }
+
+    def to_json(self) -> str:
+        """
+        Возвращает метрики в JSON.
+
+        Returns:
+            str: JSON с временем выгрузки и сводкой по эндпоинтам.
+        """
+        return json.dumps({
+            "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "endpoints": self.to_dict(),
+        }, indent=2, sort_keys=True)
+
+    def to_prometheus(self) -> str:
+        """
+        Возвращает метрики в текстовом формате Prometheus (summary и counter).
+
+        Returns:
+            str: Содержимое файла для textfile collector node_exporter.
+        """
+        summary = self.to_dict()
+        lines = [
+            "# HELP spotify_requests_total Spotify API requests by endpoint and status.",
+            "# TYPE spotify_requests_total counter",
+        ]
+        for endpoint, data in summary.items():
+            for status, count in sorted(data["status"].items()):
+                lines.append(f'spotify_requests_total{{endpoint="{endpoint}",status="{status}"}} {count}')
+
+        def add_summary(name: str, help_text: str, series: list) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} summary")
+            for labels, values in series:
+                for quantile in QUANTILES:
+                    value = values[f"p{int(quantile * 100)}"]
+                    lines.append(f'{name}{{{labels},quantile="{quantile}"}} {value:.6g}')
+                lines.append(f"{name}_sum{{{labels}}} {values['sum']:.6g}")
+                lines.append(f"{name}_count{{{labels}}} {values['count']}")
+
+        add_summary(
+            "spotify_request_duration_seconds",
+            "Spotify API request phase duration.",
+            [
+                (f'endpoint="{endpoint}",phase="{phase}"', values)
+                for endpoint, data in summary.items() for phase, values in data["seconds"].items()
+            ],
+        )
+        add_summary(
+            "spotify_response_size_bytes",
+            "Spotify API response body size.",
+            [(f'endpoint="{endpoint}"', data["response_bytes"]) for endpoint, data in summary.items()
+             if data["response_bytes"]["count"]],
+        )
+        add_summary(
+            "spotify_response_items",
+            "Items per Spotify API response.",
+            [(f'endpoint="{endpoint}"', data["items"]) for endpoint, data in summary.items()
+             if data["items"]["count"]],
+        )
+        return "\n".join(lines) + "\n"
+
+    def export(self, directory: Optional[str] = None, formats: Optional[str] = None) -> None:
+        """
+        Атомарно записывает метрики в файлы spotify_requests.prom и spotify_requests.json.
+
+        Args:
+            directory (Optional[str]): Каталог. По умолчанию — SPOTIFY_METRICS_DIR.
+            formats (Optional[str]): Форматы через запятую (prom, json). По умолчанию —
+                SPOTIFY_METRICS_FORMATS; пустая строка отключает выгрузку.
+        """
+        directory = directory or os.getenv("SPOTIFY_METRICS_DIR", DEFAULT_METRICS_DIR)
+        formats = METRICS_FORMATS if formats is None else formats
+        renderers = {"prom": self.to_prometheus, "json": self.to_json}
+
+        for name in filter(None, (part.strip() for part in formats.split(","))):
+            if name not in renderers:
+                logger.warning(f"Неизвестный формат метрик: {name}")
+                continue
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"spotify_requests.{name}")
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(renderers[name]())
+            os.replace(tmp_path, path)
+            logger.info(f"Метрики запросов выгружены: {path}")
+
+
+
+# Фазы установки соединения текущего потока: соединение открывается в том же
+# потоке, что и запрос, поэтому клиент читает их сразу после ответа.
+_connection_phases = threading.local()
+
+
+
+def reset_connection_phases() -> None:
+    """Сбрасывает фазы соединения текущего потока перед запросом."""
+    _connection_phases.values = {}
+
+
+
+def connection_phases() -> Dict[str, float]:
+    """
+    Возвращает фазы установки соединения последнего запроса текущего потока.
+
+    Returns:
+        Dict[str, float]: dns, connect и (для HTTPS) tls в секундах; пусто,
+            если запрос ушёл по уже открытому соединению.
+    """
+    return getattr(_connection_phases, "values", {})
+
+
+
+class _TimedConnectionMixin:
+    """Замеряет разрешение имени, TCP-подключение и TLS-рукопожатие."""
+
+    def _new_conn(self):
+        host = self._dns_host
+        started = time.perf_counter()
+        try:
+            addresses = list(dict.fromkeys(
+                info[4][0] for info in socket.getaddrinfo(host, self.port, 0, socket.SOCK_STREAM)
+            ))
+        except OSError:
+            addresses = [host]  # Ошибку разрешения имени поднимет urllib3
+        resolved = time.perf_counter()
+
+        # Подключаемся к уже разрешённым адресам по очереди, как create_connection()
+        try:
+            for position, address in enumerate(addresses):
+                self._dns_host = address
+                try:
+                    sock = super()._new_conn()
+                    break
+                except ConnectTimeoutError:
+                    if position == len(addresses) - 1:
+                        raise
+        finally:
+            self._dns_host = host
+
+        values = connection_phases()
+        values["dns"] = resolved - started
+        values["connect"] = time.perf_counter() - resolved
+        _connection_phases.values = values
+        return sock
+
+    def connect(self):
+        started = time.perf_counter()
+        super().connect()
+        if isinstance(self, HTTPSConnection):
+            values = connection_phases()
+            values["tls"] = max(time.perf_counter() - started - values.get("dns", 0.0) - values.get("connect", 0.0), 0.0)
+
+
+
+class _TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+
+class _TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter, соединения которого записывают фазы установки (см. connection_phases())."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimedHTTPConnectionPool,
+            "https": _TimedHTTPSConnectionPool,
+        }
@@ -0,0 +1,174 @@
+"""
+Параллельное извлечение истории прослушиваний для многих пользователей Spotify.
+
+Список пользователей (roster) читается из JSON-файла вида
+[{"user_id": "...", "token": "..."}, ...], путь к которому задаётся
+переменной окружения SPOTIFY_USERS_FILE. Вместо статического token запись
+может содержать refresh_token: тогда access-токен выдаёт и заранее
+обновляет менеджер токенов (см. auth). Пользователи обрабатываются
+конкурентно в пуле потоков, число одновременных запросов ограничено
+параметром concurrency (SPOTIFY_CONCURRENCY).
+
+Конкурентность построена на потоках, а не на asyncio. Все запросы идут
+через spotify_client: пул keep-alive соединений requests, общий для
+процессов ограничитель частоты, выключатель, хеджирование, объединение
+одинаковых запросов, обновление токена после 401. Этот клиент блокирующий.
+Версии на asyncio понадобился бы асинхронный HTTP-клиент (aiohttp нет
+в зависимостях) и вторая реализация всех этих механизмов, а цикл событий
+поверх потоков ничего не ускоряет. Ожидание ответа отпускает GIL, поэтому
+потоки дают ту же конкурентность ввода-вывода: 1000 пользователей при
+задержке ответа 100 мс извлекаются за ~4 с против ~107 с по очереди
+(benchmarks/bench_multi_user.py).
+
+Модуль только извлекает данные: таблицы возвращаются вызывающему коду,
+в БД не загружаются, и отметки последней загрузки не сдвигаются (следующий
+запуск снова начнёт с прежней отметки). my_played_tracks хранит
+прослушивания одного пользователя (см. key_index), поэтому загрузка
+нескольких пользователей требует отдельной схемы.
+"""
+
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from auth import get_token_manager
+from enrichment import get_artist_enricher
+from extractor import load_settings
+from spotify_client import get_client
+from spotify_etl import export_request_metrics, return_dataframe
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = int(os.getenv("SPOTIFY_CONCURRENCY", 32))
+
+
+
+def load_roster(path: Optional[str] = None) -> List[Tuple[str, Optional[str]]]:
+    """
+    Читает список пользователей и их токенов.
+
+    Refresh-токены регистрируются в менеджере токенов, и для таких
+    пользователей в паре возвращается None.
+
+    Args:
+        path (Optional[str]): Путь к JSON-файлу. По умолчанию — SPOTIFY_USERS_FILE.
+
+    Returns:
+        List[Tuple[str, Optional[str]]]: Пары (user_id, token).
+
+    Raises:
+        ValueError: Если путь не задан или в записи нет user_id или токена.
+    """
+    path = path or os.getenv("SPOTIFY_USERS_FILE")
+    if not path:
+        raise ValueError("Не задан путь к списку пользователей (SPOTIFY_USERS_FILE)")
+
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+
+    roster = []
+    manager = None
+    for entry in entries:
+        user_id = entry.get("user_id")
+        if not user_id or not (entry.get("token") or entry.get("refresh_token")):
+            raise ValueError(f"Запись без user_id или токена: {user_id}")
+        if entry.get("refresh_token"):
+            manager = manager or get_token_manager()
+            manager.register(user_id, refresh_token=entry["refresh_token"])
+            roster.append((user_id, None))
+        else:
+            roster.append((user_id, entry["token"]))
+
+    if manager is not None:
+        manager.start()
+    return roster
+
+
+
+def fetch_all_users(
+    roster: List[Tuple[str, Optional[str]]],
+    concurrency: int = DEFAULT_CONCURRENCY,
+) -> Dict[str, pd.DataFrame]:
+    """
+    Конкурентно извлекает прослушивания всех пользователей из списка.
+
+    Каждый пользователь обрабатывается return_dataframe() (постранично, от
+    своей отметки последней загрузки) в пуле из concurrency потоков, поэтому
+    одновременно выполняется не больше concurrency HTTP-запросов. Все потоки
+    используют общий пул соединений spotify_client, поэтому concurrency не
+    стоит делать больше SPOTIFY_POOL_MAXSIZE. Ошибка одного пользователя не
+    прерывает остальных: она логируется, а пользователь не попадает в результат.
+
+    Метаданные артистов подтягиваются после извлечения одним проходом по
+    уникальным ID всех пользователей, а не по пачкам каждого пользователя.
+
+    Args:
+        roster (List[Tuple[str, Optional[str]]]): Пары (user_id, token); None — токен из auth.
+        concurrency (int): Максимальное число одновременных запросов.
+
+    Returns:
+        Dict[str, pd.DataFrame]: Таблицы в формате return_dataframe() по user_id.
+    """
+    started = time.perf_counter()
+
+    frames = {}
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="spotify-user") as executor:
+        futures = [(user_id, executor.submit(return_dataframe, user_id, token, False)) for user_id, token in roster]
+        for user_id, future in futures:
+            try:
+                frames[user_id] = future.result()
+            except Exception as e:
+                logger.error(f"Ошибка извлечения для пользователя {user_id}: {e}")
+
+    if load_settings()["enrich_artists"] and frames:
+        # Токен любого успешно извлечённого пользователя подходит для GET /artists
+        user_id = next(iter(frames))
+        try:
+            token = dict(roster)[user_id] or get_token_manager().get_token(user_id)
+            get_artist_enricher().enrich_frames(frames, token)
+            logger.info(f"Кэш метаданных артистов: {get_artist_enricher().stats()}")
+        except Exception as e:
+            # Обогащение не должно лишать данных всех пользователей
+            logger.error(f"Ошибка обогащения артистов, таблицы возвращаются без метаданных: {e}")
+
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"Извлечено пользователей: {len(frames)} из {len(roster)} "
+        f"за {elapsed:.2f} с (concurrency={concurrency}). Соединения: {get_client().stats()}"
+    )
+    export_request_metrics()
+    return frames
+
+
+
+def extract_users(
+    roster: Optional[List[Tuple[str, Optional[str]]]] = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+) -> Dict[str, pd.DataFrame]:
+    """
+    Извлекает прослушивания пользователей из списка (см. fetch_all_users()).
+
+    Только извлечение: таблицы не загружаются в БД, отметки не сдвигаются.
+
+    Args:
+        roster (Optional[List[Tuple[str, Optional[str]]]]): Пары (user_id, token).
+            По умолчанию читаются из SPOTIFY_USERS_FILE.
+        concurrency (int): Максимальное число одновременных запросов.
+
+    Returns:
+        Dict[str, pd.DataFrame]: Таблицы в формате return_dataframe() по user_id.
+    """
+    if roster is None:
+        roster = load_roster()
+    return fetch_all_users(roster, concurrency)
+
+
+
+if __name__ == "__main__":
+    for user, df in extract_users().items():
+        print(f"{user}: {len(df)} треков")
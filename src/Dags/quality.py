@@ -0,0 +1,502 @@
+"""
+Проверка качества таблиц пайплайна по декларативным контрактам.
+
+Контракт (Contract) описывает колонки таблицы: тип, допустимость NULL,
+уникальность, диапазон значений и регулярное выражение. При первом
+использовании контракт компилируется в список векторных предикатов
+на колонку; каждая колонка один раз переводится в массив Arrow, и все
+её предикаты выполняются в pyarrow.compute (регулярные выражения — RE2),
+без Python-объекта на значение. Поэтому DataFrame и таблицы Arrow
+проверяются одним кодом.
+
+check_quality() проверяет все правила и возвращает отчёт QualityReport:
+сколько строк нарушает каждое правило и их номера. Что делать
+с нарушениями, решает вызывающий код (apply_quality()):
+- fail — поднять ValueError с перечнем всех нарушений;
+- drop — отбросить строки с нарушениями;
+- quarantine — отбросить их и передать обработчику вместе с причиной.
+
+Правила (по колонке <c>):
+- missing_<c> — обязательной колонки нет (нарушают все строки);
+- type_<c> — значение не того типа;
+- null_<c> — NULL в колонке, где он запрещён;
+- duplicate_<c> — повтор непустого значения уникальной колонки (первое вхождение
+  корректно);
+- range_<c> — значение вне [min, max];
+- pattern_<c> — строка не соответствует регулярному выражению;
+- <c> — значение в колонке-флаге (forbidden), где допустим только NULL:
+  например, bad_played_at — исходная строка played_at, которую не удалось
+  разобрать (см. decoding.parse_played_at()).
+Пустая таблица отмечается в отчёте (empty), но нарушением строки не является.
+
+Контракты таблиц: PLAYS_CONTRACT (my_played_tracks, пачки извлечения)
+и FAV_ARTIST_CONTRACT (fav_artist, результат transform_df). Замер:
+benchmarks/bench_contracts.py.
+"""
+
+from __future__ import annotations
+
+import logging
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from decoding import BAD_PLAYED_AT, is_arrow
+
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+ON_ERROR = ("fail", "drop", "quarantine")
+REASON_COLUMN = "reason"
+DATE_PATTERN = r"^\d{4}-\d{2}-\d{2}$"
+
+
+
+class QualityReport:
+    """
+    Результат проверки качества.
+
+    Args:
+        rows (int): Число проверенных строк.
+        violations (Dict[str, np.ndarray]): Правило -> номера строк (по порядку
+            в таблице), которые его нарушают. Правила без нарушений не хранятся.
+    """
+
+    def __init__(self, rows: int, violations: Dict[str, np.ndarray]):
+        self.rows = rows
+        self.violations = violations
+
+    @property
+    def empty(self) -> bool:
+        """Таблица не содержит строк."""
+        return self.rows == 0
+
+    @property
+    def ok(self) -> bool:
+        """Таблица не пуста и ни одно правило не нарушено."""
+        return not self.empty and not self.violations
+
+    def counts(self) -> Dict[str, int]:
+        """Число нарушений по правилам."""
+        return {rule: len(rows) for rule, rows in self.violations.items()}
+
+    def invalid_rows(self) -> np.ndarray:
+        """Номера строк, нарушающих хотя бы одно правило (по возрастанию)."""
+        if not self.violations:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(list(self.violations.values())))
+
+    def reasons(self, rows: np.ndarray) -> np.ndarray:
+        """
+        Перечисляет нарушенные правила для каждой из строк rows.
+
+        Args:
+            rows (np.ndarray): Номера строк из invalid_rows().
+
+        Returns:
+            np.ndarray: Строки вида "null_song_name,duplicate_played_at".
+        """
+        reasons = np.full(len(rows), "", dtype=object)
+        for rule, rule_rows in self.violations.items():
+            positions = np.searchsorted(rows, rule_rows)
+            reasons[positions] = np.where(reasons[positions] == "", rule, reasons[positions] + "," + rule)
+        return reasons
+
+    def to_dict(self) -> dict:
+        """
+        Возвращает отчёт для логов и метрик.
+
+        Returns:
+            dict: rows, empty, invalid (число строк с нарушениями), counts.
+        """
+        return {"rows": self.rows, "empty": self.empty, "invalid": len(self.invalid_rows()), "counts": self.counts()}
+
+    def message(self) -> str:
+        """Описание всех нарушений одной строкой."""
+        if self.empty:
+            return "DataFrame пуст"
+        parts = []
+        nulls = {rule[len("null_"):]: count for rule, count in self.counts().items() if rule.startswith("null_")}
+        for rule, count in self.counts().items():
+            if rule.startswith("duplicate_"):
+                parts.append(f"Обнаружены дубликаты в колонке '{rule[len('duplicate_'):]}': {count}")
+            elif not rule.startswith("null_"):
+                parts.append(f"Нарушено правило {rule}: {count}")
+        if nulls:
+            parts.append(f"Обнаружены NULL-значения: {nulls}")
+        return "; ".join(parts)
+
+    def __repr__(self) -> str:
+        return f"QualityReport({self.to_dict()})"
+
+
+
+def _type_matches(dtype: str, arrow_type: pa.DataType) -> bool:
+    """Проверяет, что тип колонки Arrow допустим для типа контракта."""
+    import pyarrow as pa
+
+    if pa.types.is_null(arrow_type):  # Колонка из одних NULL
+        return True
+    if pa.types.is_dictionary(arrow_type):
+        arrow_type = arrow_type.value_type
+    text = pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type)
+    if dtype == "string":
+        return text
+    if dtype == "int":
+        # pandas хранит целые с NULL как float64
+        return pa.types.is_integer(arrow_type) or pa.types.is_floating(arrow_type)
+    if dtype == "timestamp":
+        return pa.types.is_timestamp(arrow_type) or text  # Строка проверяется pattern
+    if dtype == "date":
+        return pa.types.is_date(arrow_type) or text
+    raise ValueError(f"Неизвестный тип колонки контракта: {dtype}")
+
+
+
+def _rows(mask) -> np.ndarray:
+    """Номера строк, где булев массив Arrow истинен (NULL — ложь)."""
+    import pyarrow.compute as pc
+
+    return np.flatnonzero(pc.fill_null(mask, False).to_numpy(zero_copy_only=False))
+
+
+
+class Column:
+    """
+    Описание колонки в контракте таблицы.
+
+    Args:
+        name (str): Имя колонки.
+        dtype (str): string, int, timestamp или date. Для timestamp и date
+            допускается и строковое представление (его формат задаёт pattern).
+        nullable (bool): Допустим ли NULL.
+        unique (bool): Должны ли значения быть уникальными.
+        min (Optional[float]): Наименьшее допустимое значение.
+        max (Optional[float]): Наибольшее допустимое значение.
+        pattern (Optional[str]): Регулярное выражение (RE2) для строковых значений.
+        optional (bool): Может ли колонки не быть в таблице (например, колонки обогащения).
+        forbidden (bool): Колонка-флаг: любое значение, кроме NULL, — нарушение
+            (правило называется именем колонки).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        dtype: str,
+        nullable: bool = True,
+        unique: bool = False,
+        min: Optional[float] = None,
+        max: Optional[float] = None,
+        pattern: Optional[str] = None,
+        optional: bool = False,
+        forbidden: bool = False,
+    ):
+        self.name = name
+        self.dtype = dtype
+        self.nullable = nullable
+        self.unique = unique
+        self.min = min
+        self.max = max
+        self.pattern = pattern
+        self.optional = optional
+        self.forbidden = forbidden
+
+    def compile(self) -> List[Tuple[str, Callable]]:
+        """
+        Компилирует ограничения колонки в векторные предикаты.
+
+        Каждый предикат получает массив Arrow и возвращает номера строк
+        с нарушениями или None. Дорогая часть (маска) строится только
+        после дешёвой проверки на всю колонку (null_count, min_max, all).
+
+        Returns:
+            List[Tuple[str, Callable]]: Пары (правило, предикат).
+        """
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        checks = []
+        if self.forbidden:
+            def flagged_rows(values):
+                if values.null_count == len(values):
+                    return None
+                return _rows(values.is_valid())
+            checks.append((self.name, flagged_rows))
+
+        if not self.nullable:
+            def null_rows(values):
+                if values.null_count == 0:  # Число NULL хранится в метаданных
+                    return None
+                return _rows(values.is_null())
+            checks.append((f"null_{self.name}", null_rows))
+
+        if self.unique:
+            def duplicate_rows(values):
+                # NULL — не повтор: пропуски отмечает null_<c> (и bad_played_at)
+                if pc.count_distinct(values, mode="only_valid").as_py() == len(values) - values.null_count:
+                    return None
+                if isinstance(values, pa.ChunkedArray):
+                    values = values.combine_chunks()
+                if pa.types.is_dictionary(values.type):
+                    values = values.cast(values.type.value_type)
+                # Повторы ищутся по целым кодам значений, а не по самим значениям
+                codes = pc.fill_null(pc.dictionary_encode(values).indices, -1).to_numpy()
+                _, first = np.unique(codes, return_index=True)
+                mask = np.ones(len(codes), dtype=bool)
+                mask[first] = False
+                mask[codes == -1] = False
+                return np.flatnonzero(mask)
+            checks.append((f"duplicate_{self.name}", duplicate_rows))
+
+        if self.min is not None or self.max is not None:
+            low, high = self.min, self.max
+
+            def range_rows(values):
+                if not (pa.types.is_integer(values.type) or pa.types.is_floating(values.type)) or values.null_count == len(values):
+                    return None
+                bounds = pc.min_max(values).as_py()
+                if (low is None or bounds["min"] >= low) and (high is None or bounds["max"] <= high):
+                    return None
+                if low is None:
+                    return _rows(pc.greater(values, high))
+                if high is None:
+                    return _rows(pc.less(values, low))
+                return _rows(pc.or_(pc.less(values, low), pc.greater(values, high)))
+            checks.append((f"range_{self.name}", range_rows))
+
+        if self.pattern is not None:
+            pattern = self.pattern
+
+            def pattern_rows(values):
+                value_type = values.type.value_type if pa.types.is_dictionary(values.type) else values.type
+                if not (pa.types.is_string(value_type) or pa.types.is_large_string(value_type)):
+                    return None  # Типизированное значение (timestamp, date) формат не проверяет
+                if pa.types.is_dictionary(values.type):
+                    # Выражение проверяется по словарю, строки получают результат по коду
+                    chunks = values.chunks if isinstance(values, pa.ChunkedArray) else [values]
+                    matches = pa.chunked_array(
+                        [pc.take(pc.match_substring_regex(chunk.dictionary, pattern), chunk.indices) for chunk in chunks],
+                        pa.bool_(),
+                    )
+                else:
+                    matches = pc.match_substring_regex(values, pattern)
+                if pc.all(matches).as_py() is not False:
+                    return None
+                return _rows(pc.invert(matches))
+            checks.append((f"pattern_{self.name}", pattern_rows))
+
+        return checks
+
+
+
+class Contract:
+    """
+    Декларативный контракт таблицы: набор описаний колонок.
+
+    Предикаты компилируются один раз при первой проверке и переиспользуются.
+
+    Args:
+        table (str): Имя таблицы (для логов).
+        columns (List[Column]): Описания колонок.
+    """
+
+    def __init__(self, table: str, columns: List[Column]):
+        self.table = table
+        self.columns = columns
+        self._compiled: Optional[List[Tuple[Column, List[Tuple[str, Callable]]]]] = None
+
+    def compiled(self) -> List[Tuple[Column, List[Tuple[str, Callable]]]]:
+        """Колонки с их скомпилированными предикатами."""
+        if self._compiled is None:
+            self._compiled = [(column, column.compile()) for column in self.columns]
+        return self._compiled
+
+    def check(self, data: Union[pd.DataFrame, pa.RecordBatch, pa.Table]) -> QualityReport:
+        """
+        Проверяет все правила контракта (не поднимает исключений).
+
+        Args:
+            data (Union[pd.DataFrame, pa.RecordBatch, pa.Table]): Проверяемые строки.
+
+        Returns:
+            QualityReport: Нарушения по правилам.
+        """
+        rows = len(data)
+        violations = {}
+        if rows == 0:
+            return QualityReport(0, violations)
+
+        arrow = is_arrow(data)
+        names = set(data.schema.names if arrow else data.columns)
+        for column, checks in self.compiled():
+            if column.name not in names:
+                if not column.optional:
+                    violations[f"missing_{column.name}"] = np.arange(rows)
+                continue
+
+            values, bad_type = _column_values(data[column.name], column.dtype, arrow)
+            if bad_type is not None:
+                violations[f"type_{column.name}"] = bad_type
+                if values is None:
+                    continue  # Весь столбец не того типа: остальные правила не применимы
+            for rule, predicate in checks:
+                found = predicate(values)
+                if found is not None and len(found):
+                    violations[rule] = found
+
+        return QualityReport(rows, violations)
+
+
+
+def _column_values(column, dtype: str, arrow: bool):
+    """
+    Переводит колонку в массив Arrow и проверяет её тип.
+
+    Returns:
+        tuple: (массив Arrow или None, номера строк не того типа или None).
+            Массив None — не того типа вся колонка.
+    """
+    import pyarrow as pa
+
+    if not arrow:
+        try:
+            column = pa.array(column, from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Смешанные типы в object-колонке: ищем неподходящие значения поштучно
+            expected = str if dtype in ("string", "timestamp", "date") else (int, float)
+            wrong = column.map(lambda value: value is not None and value == value and not isinstance(value, expected))
+            bad = np.flatnonzero(wrong.to_numpy())
+            return pa.array(column.where(~wrong, None), from_pandas=True), bad
+
+    if not _type_matches(dtype, column.type):
+        return None, np.arange(len(column))
+    return column, None
+
+
+
+PLAYS_CONTRACT = Contract("my_played_tracks", [
+    Column("song_name", "string", nullable=False),
+    Column("artist_name", "string", nullable=False),
+    Column(BAD_PLAYED_AT, "string", optional=True, forbidden=True),
+    Column("played_at", "timestamp", nullable=False, unique=True),
+    Column("timestamp", "date", nullable=False, pattern=DATE_PATTERN),
+    Column("track_id", "string", optional=True),  # ID пусты у локальных файлов
+    Column("artist_id", "string", optional=True),
+    Column("album_name", "string", optional=True),
+    Column("duration_ms", "int", min=0, optional=True),
+    Column("popularity", "int", min=0, max=100, optional=True),
+    Column("artist_genres", "string", optional=True),
+    Column("artist_followers", "int", min=0, optional=True),
+])
+
+FAV_ARTIST_CONTRACT = Contract("fav_artist", [
+    Column("ID", "string", nullable=False, unique=True),
+    Column("timestamp", "date", nullable=False, pattern=DATE_PATTERN),
+    Column("artist_name", "string", nullable=False),
+    Column("count", "int", nullable=False, min=1),
+])
+
+
+
+def check_quality(
+    data: Union[pd.DataFrame, pa.RecordBatch, pa.Table],
+    contract: Contract = PLAYS_CONTRACT,
+) -> QualityReport:
+    """
+    Проверяет все правила контракта и возвращает отчёт (не поднимает исключений).
+
+    Args:
+        data (Union[pd.DataFrame, pa.RecordBatch, pa.Table]): Проверяемые записи.
+        contract (Contract): Контракт таблицы. По умолчанию — прослушивания.
+
+    Returns:
+        QualityReport: Нарушения по правилам.
+    """
+    return contract.check(data)
+
+
+
+def _take(data, rows: np.ndarray):
+    """Строки с номерами rows в том же формате."""
+    if is_arrow(data):
+        return data.take(rows)
+    return data.iloc[rows].reset_index(drop=True)
+
+
+
+def _drop(data, rows: np.ndarray):
+    """Таблица без строк с номерами rows."""
+    keep = np.ones(len(data), dtype=bool)
+    keep[rows] = False
+    if is_arrow(data):
+        return data.filter(keep)
+    return data[keep].reset_index(drop=True)
+
+
+
+def with_reasons(data, report: QualityReport, rows: np.ndarray):
+    """
+    Возвращает строки rows с колонкой reason — перечнем нарушенных правил.
+
+    Args:
+        data (Union[pd.DataFrame, pa.RecordBatch, pa.Table]): Проверенные записи.
+        report (QualityReport): Отчёт check_quality() для data.
+        rows (np.ndarray): Номера строк.
+
+    Returns:
+        Union[pd.DataFrame, pa.RecordBatch, pa.Table]: Строки с колонкой reason.
+    """
+    rejected = _take(data, rows)
+    reasons = report.reasons(rows)
+    if is_arrow(rejected):
+        import pyarrow as pa
+
+        return rejected.append_column(REASON_COLUMN, pa.array(reasons, pa.string()))
+    return rejected.assign(**{REASON_COLUMN: reasons})
+
+
+
+def apply_quality(
+    data: Union[pd.DataFrame, pa.RecordBatch, pa.Table],
+    report: QualityReport,
+    on_error: str = "fail",
+    quarantine: Optional[Callable] = None,
+) -> Union[pd.DataFrame, pa.RecordBatch, pa.Table]:
+    """
+    Обрабатывает нарушения из отчёта выбранным способом.
+
+    Args:
+        data (Union[pd.DataFrame, pa.RecordBatch, pa.Table]): Проверенные записи.
+        report (QualityReport): Отчёт check_quality() для data.
+        on_error (str): fail, drop или quarantine.
+        quarantine (Optional[Callable]): Обработчик отклонённых строк (с колонкой
+            reason) для режима quarantine.
+
+    Returns:
+        Union[pd.DataFrame, pa.RecordBatch, pa.Table]: Корректные строки в том же формате.
+
+    Raises:
+        ValueError: В режиме fail — если таблица пуста или есть нарушения;
+            если режим неизвестен или для quarantine не задан обработчик.
+    """
+    if on_error not in ON_ERROR:
+        raise ValueError(f"Неизвестный режим обработки ошибок качества: {on_error}. Доступны: {', '.join(ON_ERROR)}")
+    if on_error == "quarantine" and quarantine is None:
+        raise ValueError("Для режима quarantine нужен обработчик отклонённых строк")
+
+    if on_error == "fail":
+        if not report.ok:
+            raise ValueError(report.message())
+        return data
+
+    if not report.violations:
+        return data
+
+    rows = report.invalid_rows()
+    if on_error == "quarantine":
+        quarantine(with_reasons(data, report, rows))
+    logger.warning(f"Отклонено строк: {len(rows)} из {report.rows} ({on_error}): {report.counts()}")
+    return _drop(data, rows)
@@ -0,0 +1,157 @@
+"""
+Карантин строк, не прошедших проверку качества.
+
+В режиме quarantine (SPOTIFY_QUALITY_MODE=quarantine, см. quality.apply_quality())
+строки с нарушениями не прерывают запуск: они отделяются от корректных
+одной операцией на пачку и передаются обработчику вместе с колонкой reason
+(перечень нарушенных правил). Корректные строки проходят transform_df и
+загрузку как обычно.
+
+QuarantineSink — такой обработчик: он накапливает отклонённые строки
+в памяти (пачками, без копирования по строкам) и в конце запуска
+записывает их одной загрузкой в таблицу quarantine_plays (см. db) или,
+если БД недоступна, в CSV-файл в каталоге SPOTIFY_QUARANTINE_DIR.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, List, Optional, Union
+
+from decoding import BAD_PLAYED_AT, is_arrow
+
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUARANTINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "state", "quarantine")
+
+
+
+class QuarantineSink:
+    """
+    Накопитель отклонённых строк для apply_quality(..., "quarantine", sink).
+
+    Потокобезопасен: один экземпляр можно передавать нескольким run_etl().
+    """
+
+    def __init__(self):
+        self.frames: List[Union[pd.DataFrame, pa.Table, pa.RecordBatch]] = []
+        self._lock = threading.Lock()
+
+    def __call__(self, rejected: Union[pd.DataFrame, pa.Table, pa.RecordBatch]) -> None:
+        """
+        Принимает отклонённые строки с колонкой reason.
+
+        Args:
+            rejected (Union[pd.DataFrame, pa.Table, pa.RecordBatch]): Результат quality.with_reasons().
+        """
+        if len(rejected) == 0:
+            return
+        with self._lock:
+            self.frames.append(rejected)
+
+    @property
+    def rows(self) -> int:
+        """Число накопленных строк."""
+        return sum(len(frame) for frame in self.frames)
+
+    def frame(self) -> pd.DataFrame:
+        """
+        Объединяет накопленные строки в одну таблицу для загрузки.
+
+        Время прослушивания переводится в строку ISO 8601 (колонки карантина
+        текстовые), остальные значения — как есть (в том числе некорректные:
+        ради них строка и попала в карантин). Если время не удалось разобрать,
+        в played_at записывается исходная строка из bad_played_at.
+
+        Returns:
+            pd.DataFrame: Строки всех пачек; пустая таблица, если ничего не накоплено.
+        """
+        import pandas as pd
+
+        from db import _arrow_text_columns
+
+        frames = []
+        for frame in self.frames:
+            if is_arrow(frame):
+                import pyarrow as pa
+
+                table = frame if isinstance(frame, pa.Table) else pa.Table.from_batches([frame])
+                frame = _arrow_text_columns(table).to_pandas()
+            for name in frame.columns:
+                if isinstance(frame[name].dtype, pd.DatetimeTZDtype):
+                    text = frame[name].dt.strftime("%Y-%m-%dT%H:%M:%S.%f").str[:-3] + "Z"
+                    frame = frame.assign(**{name: text})
+            if BAD_PLAYED_AT in frame.columns:
+                raw = frame[BAD_PLAYED_AT]
+                frame = frame.drop(columns=[BAD_PLAYED_AT]).assign(played_at=raw.where(raw.notna(), frame["played_at"]))
+            frames.append(frame)
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+    def latest_played_at_ms(self) -> Optional[int]:
+        """
+        Самое позднее корректное время прослушивания среди отклонённых строк.
+
+        Нужна, чтобы отметка последней загрузки сдвигалась и за отклонённые
+        строки: иначе следующий запуск снова извлечёт их и отправит в карантин.
+
+        Returns:
+            Optional[int]: Unix-время в миллисекундах или None, если ни одно
+                время не удалось разобрать.
+        """
+        import pandas as pd
+
+        df = self.frame()
+        if df.empty or "played_at" not in df.columns:
+            return None
+        played_at = pd.to_datetime(df["played_at"], errors="coerce", utc=True, format="ISO8601").max()
+        if pd.isna(played_at):
+            return None
+        return int(played_at.value // 1_000_000)
+
+    def to_db(self, engine) -> int:
+        """
+        Записывает накопленные строки в таблицу quarantine_plays и очищает накопитель.
+
+        Args:
+            engine (sqlalchemy.engine.Engine): Движок SQLAlchemy.
+
+        Returns:
+            int: Число записанных строк.
+        """
+        from db import insert_quarantine
+
+        written = insert_quarantine(engine, self.frame())
+        self.frames = []
+        logger.warning(f"В карантин (quarantine_plays) записано строк: {written}")
+        return written
+
+    def to_file(self, directory: Optional[str] = None) -> Optional[str]:
+        """
+        Записывает накопленные строки в CSV-файл и очищает накопитель.
+
+        Args:
+            directory (Optional[str]): Каталог. По умолчанию — SPOTIFY_QUARANTINE_DIR.
+
+        Returns:
+            Optional[str]: Путь к файлу или None, если записывать нечего.
+        """
+        df = self.frame()
+        if df.empty:
+            return None
+        directory = directory or os.getenv("SPOTIFY_QUARANTINE_DIR", DEFAULT_QUARANTINE_DIR)
+        os.makedirs(directory, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+        path = os.path.join(directory, f"quarantine_plays-{stamp}-{os.getpid()}.csv")
+        df.assign(quarantined_at=datetime.now(timezone.utc).isoformat()).to_csv(path, index=False)
+        self.frames = []
+        logger.warning(f"В карантин записано строк: {len(df)} ({path})")
+        return path
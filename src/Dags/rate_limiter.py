@@ -0,0 +1,176 @@
+"""
+Ограничитель частоты запросов к Spotify API.
+
+Token bucket общий для всех потоков процесса: каждый запрос забирает один
+токен, токены пополняются со скоростью rate в секунду до capacity. Ответ 429
+ставит на паузу весь bucket на время из заголовка Retry-After, чтобы
+конкурентные запросы не продолжали расходовать квоту.
+
+С path состояние bucket (запас токенов, время пополнения, конец паузы)
+хранится в файле под блокировкой fcntl.flock, поэтому квоту и паузу после
+429 разделяют все процессы хоста, открывшие тот же файл (воркеры Airflow,
+backfill, многопользовательское извлечение). Процессы на разных хостах
+файл не разделяют, и у каждого хоста своя квота.
+"""
+
+import os
+import random
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+DEFAULT_STATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "state", "rate_limit.bin")
+STATE = struct.Struct("<ddd")  # Запас токенов, время пополнения, конец паузы (Unix-время)
+
+
+
+def rate_limit_file() -> Optional[str]:
+    """
+    Возвращает файл общего состояния квоты.
+
+    Returns:
+        Optional[str]: SPOTIFY_RATE_LIMIT_FILE или файл в каталоге state;
+            None, если переменная задана пустой (квота на процесс).
+    """
+    path = os.getenv("SPOTIFY_RATE_LIMIT_FILE", DEFAULT_STATE_FILE)
+    return path or None
+
+
+
+class TokenBucket:
+    """
+    Потокобезопасный token bucket с глобальной паузой.
+
+    Args:
+        rate (float): Скорость пополнения, токенов в секунду.
+        capacity (int): Максимальный запас токенов (допустимый всплеск).
+        path (Optional[str]): Файл состояния, общий для процессов; None — квота
+            только для текущего процесса.
+    """
+
+    def __init__(self, rate: float, capacity: int, path: Optional[str] = None):
+        self.rate = rate
+        self.capacity = capacity
+        self.path = path
+        # Файл читают разные процессы, поэтому время в нём — общее Unix-время
+        self._clock = time.monotonic if path is None else time.time
+        self._tokens = float(capacity)
+        self._updated = self._clock()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        if path is not None:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self.throttled_seconds = 0.0  # Суммарное время ожидания всех потоков
+        self.throttle_events = 0  # Сколько раз пришлось ждать
+
+    @contextmanager
+    def _state(self) -> Iterator[List[float]]:
+        """
+        Отдаёт состояние [tokens, updated, paused_until] под блокировкой и сохраняет изменения.
+
+        Файл открывается на каждую операцию: после fork процессы не должны
+        делить один дескриптор, иначе flock не разделяет их.
+        """
+        with self._lock:
+            if self.path is None:
+                state = [self._tokens, self._updated, self._paused_until]
+                yield state
+                self._tokens, self._updated, self._paused_until = state
+                return
+
+            import fcntl
+
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                data = os.pread(fd, STATE.size, 0)
+                state = list(STATE.unpack(data)) if len(data) == STATE.size else [float(self.capacity), self._clock(), 0.0]
+                yield state
+                os.pwrite(fd, STATE.pack(*state), 0)
+            finally:
+                os.close(fd)  # Закрытие снимает блокировку
+
+    def _refill(self, state: List[float], now: float) -> None:
+        state[0] = min(self.capacity, state[0] + max(now - state[1], 0.0) * self.rate)
+        state[1] = now
+
+    def acquire(self) -> float:
+        """
+        Забирает один токен, при необходимости ожидая его появления или конца паузы.
+
+        Returns:
+            float: Время ожидания в секундах.
+        """
+        waited = 0.0
+        while True:
+            with self._state() as state:
+                now = self._clock()
+                self._refill(state, now)
+                granted = now >= state[2] and state[0] >= 1
+                if granted:
+                    state[0] -= 1
+                else:
+                    delay = max(state[2] - now, (1 - state[0]) / self.rate)
+            if granted:
+                if waited:
+                    with self._lock:
+                        self.throttled_seconds += waited
+                        self.throttle_events += 1
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    def pause(self, seconds: float) -> None:
+        """
+        Приостанавливает выдачу токенов всем потокам (и процессам, разделяющим path).
+
+        Args:
+            seconds (float): Длительность паузы от текущего момента.
+        """
+        with self._state() as state:
+            now = self._clock()
+            state[1] = now
+            state[2] = max(state[2], now + seconds)
+            state[0] = 0.0
+
+    def stats(self) -> dict:
+        """
+        Возвращает счётчики ожидания.
+
+        Returns:
+            dict: throttled_seconds — суммарное время ожидания, throttle_events — число ожиданий.
+        """
+        with self._lock:
+            return {
+                "throttled_seconds": round(self.throttled_seconds, 3),
+                "throttle_events": self.throttle_events,
+            }
+
+
+
+def retry_delay(attempt: int, retry_after: Optional[str], base: float = 1.0, cap: float = 60.0) -> float:
+    """
+    Вычисляет паузу перед повтором запроса после ответа 429.
+
+    Если сервер прислал Retry-After, ждём указанное время плюс небольшой
+    случайный разброс, чтобы потоки не вернулись одновременно. Иначе —
+    экспоненциальная задержка с jitter.
+
+    Args:
+        attempt (int): Номер попытки, начиная с 0.
+        retry_after (Optional[str]): Значение заголовка Retry-After в секундах.
+        base (float): Базовая задержка экспоненциального отката.
+        cap (float): Максимальная задержка.
+
+    Returns:
+        float: Задержка в секундах.
+    """
+    if retry_after is not None:
+        try:
+            return float(retry_after) + random.uniform(0, base)
+        except ValueError:
+            pass
+    return min(cap, base * 2 ** attempt) * random.uniform(0.5, 1.5)
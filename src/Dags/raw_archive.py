@@ -0,0 +1,238 @@
+"""
+Архив сырых ответов Spotify API в сжатом JSONL.
+
+Каждая полученная страница ответа сохраняется целиком, до разбора, чтобы
+историю можно было переобработать без повторных запросов к API (которое
+хранит только последние 50 прослушиваний).
+
+Структура каталога (SPOTIFY_ARCHIVE_DIR):
+    dt=YYYY-MM-DD/<user_id>/<HHMMSS>-<id>.jsonl.zst — страницы одного запуска;
+    index.jsonl — по строке на файл: путь, пользователь, дата, число страниц
+    и элементов, диапазон played_at. По индексу нужные файлы выбираются без
+    чтения самих архивов.
+
+Одна строка архива — {"user_id", "fetched_at", "url", "page"}, где page —
+исходное тело ответа (без переводов строк, которые в JSON вне строк
+незначимы). Архивирование отключается переменной SPOTIFY_ARCHIVE_ENABLED=0.
+"""
+
+import io
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, Optional
+
+import zstandard
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive")
+INDEX_FILE = "index.jsonl"
+COMPRESSION_LEVEL = 3
+
+_index_lock = threading.Lock()
+
+
+
+def archive_dir() -> str:
+    """
+    Возвращает корневой каталог архива.
+
+    Returns:
+        str: Путь из SPOTIFY_ARCHIVE_DIR или путь по умолчанию.
+    """
+    return os.getenv("SPOTIFY_ARCHIVE_DIR", DEFAULT_ARCHIVE_DIR)
+
+
+
+def archive_enabled() -> bool:
+    """
+    Проверяет, включено ли архивирование сырых ответов.
+
+    Returns:
+        bool: False, если SPOTIFY_ARCHIVE_ENABLED равна 0/false/no.
+    """
+    return os.getenv("SPOTIFY_ARCHIVE_ENABLED", "1").lower() not in ("0", "false", "no")
+
+
+
+class RawArchiveWriter:
+    """
+    Пишет страницы ответов одного запуска в один сжатый файл архива.
+
+    Используется как контекстный менеджер: при закрытии файл дописывается,
+    а в index.jsonl добавляется его описание. Файл без страниц не создаётся.
+
+    Args:
+        user_id (str): Пользователь, чьи ответы архивируются.
+        root (Optional[str]): Корневой каталог архива. По умолчанию — archive_dir().
+    """
+
+    def __init__(self, user_id: str, root: Optional[str] = None):
+        self.user_id = user_id
+        self.root = root or archive_dir()
+        self.started_at = datetime.now(timezone.utc)
+
+        partition = f"dt={self.started_at:%Y-%m-%d}"
+        name = f"{self.started_at:%H%M%S}-{uuid.uuid4().hex[:8]}.jsonl.zst"
+        self.relative_path = os.path.join(partition, user_id, name)
+        self.path = os.path.join(self.root, self.relative_path)
+
+        self._file = None
+        self._writer = None
+        self.pages = 0
+        self.items = 0
+        self.min_played_at = None
+        self.max_played_at = None
+
+    def write_page(self, url: str, raw: bytes, played_at: Iterable[str] = ()) -> None:
+        """
+        Добавляет страницу ответа в архив.
+
+        Тело ответа не разбирается повторно: строка архива собирается из
+        заголовка записи и исходных байтов.
+
+        Args:
+            url (str): URL, по которому получена страница.
+            raw (bytes): Тело JSON-ответа API без изменений.
+            played_at (Iterable[str]): Значения played_at страницы для индекса.
+        """
+        if self._writer is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = open(self.path, "wb")
+            self._writer = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL).stream_writer(self._file)
+
+        header = json.dumps({
+            "user_id": self.user_id,
+            "fetched_at": datetime.now(timezone.utc).isoformat(),
+            "url": url,
+        }, ensure_ascii=False).encode("utf-8")
+        # Управляющие символы внутри строк JSON всегда экранированы,
+        # поэтому удаление \r и \n не меняет содержимое ответа
+        body = raw.replace(b"\r", b"").replace(b"\n", b"")
+        self._writer.write(header[:-1] + b', "page": ' + body + b"}\n")
+
+        self.pages += 1
+        for value in played_at:
+            self.items += 1
+            if self.min_played_at is None or value < self.min_played_at:
+                self.min_played_at = value
+            if self.max_played_at is None or value > self.max_played_at:
+                self.max_played_at = value
+
+    def close(self) -> None:
+        """Завершает сжатый поток и регистрирует файл в индексе."""
+        if self._writer is None:
+            return
+        self._writer.close()  # Закрывает и исходный файл
+        self._writer = None
+
+        entry = {
+            "path": self.relative_path,
+            "user_id": self.user_id,
+            "date": f"{self.started_at:%Y-%m-%d}",
+            "started_at": self.started_at.isoformat(),
+            "pages": self.pages,
+            "items": self.items,
+            "min_played_at": self.min_played_at,
+            "max_played_at": self.max_played_at,
+            "bytes": os.path.getsize(self.path),
+        }
+        with _index_lock:
+            with open(os.path.join(self.root, INDEX_FILE), "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        logger.info(f"Архивировано страниц: {self.pages}, элементов: {self.items} -> {self.relative_path}")
+
+    def __enter__(self) -> "RawArchiveWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+
+def read_index(root: Optional[str] = None) -> list:
+    """
+    Читает индекс архива.
+
+    Args:
+        root (Optional[str]): Корневой каталог архива. По умолчанию — archive_dir().
+
+    Returns:
+        list: Записи индекса в порядке добавления.
+    """
+    path = os.path.join(root or archive_dir(), INDEX_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+
+def iter_archived_lines(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    user_id: Optional[str] = None,
+    root: Optional[str] = None,
+    played_from: Optional[str] = None,
+    played_to: Optional[str] = None,
+) -> Iterator[bytes]:
+    """
+    Последовательно читает строки архива, выбирая файлы по индексу.
+
+    Args:
+        start_date (Optional[str]): Первая дата раздела (YYYY-MM-DD), включительно.
+        end_date (Optional[str]): Последняя дата раздела (YYYY-MM-DD), включительно.
+        user_id (Optional[str]): Только файлы этого пользователя.
+        root (Optional[str]): Корневой каталог архива. По умолчанию — archive_dir().
+        played_from (Optional[str]): Только файлы с прослушиваниями не раньше
+            этого времени (ISO 8601), по диапазону played_at из индекса.
+        played_to (Optional[str]): Только файлы с прослушиваниями раньше этого времени.
+
+    Yields:
+        bytes: Строки JSONL в порядке записи.
+    """
+    root = root or archive_dir()
+    decompressor = zstandard.ZstdDecompressor()
+
+    for entry in read_index(root):
+        if start_date and entry["date"] < start_date:
+            continue
+        if end_date and entry["date"] > end_date:
+            continue
+        if user_id and entry["user_id"] != user_id:
+            continue
+        if played_from and (entry["max_played_at"] or "") < played_from:
+            continue
+        if played_to and (entry["min_played_at"] or "") >= played_to:
+            continue
+
+        with open(os.path.join(root, entry["path"]), "rb") as f:
+            with decompressor.stream_reader(f) as reader:
+                yield from io.BufferedReader(reader)
+
+
+
+def iter_archived_records(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    user_id: Optional[str] = None,
+    root: Optional[str] = None,
+) -> Iterator[dict]:
+    """
+    Последовательно читает записи архива как словари.
+
+    Args:
+        start_date (Optional[str]): Первая дата раздела (YYYY-MM-DD), включительно.
+        end_date (Optional[str]): Последняя дата раздела (YYYY-MM-DD), включительно.
+        user_id (Optional[str]): Только файлы этого пользователя.
+        root (Optional[str]): Корневой каталог архива. По умолчанию — archive_dir().
+
+    Yields:
+        dict: Записи {"user_id", "fetched_at", "url", "page"} в порядке записи.
+    """
+    for line in iter_archived_lines(start_date, end_date, user_id, root):
+        yield json.loads(line)
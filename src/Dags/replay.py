@@ -0,0 +1,126 @@
+"""
+Воспроизведение архива сырых ответов Spotify API без обращения к сети.
+
+Страницы из архива (см. raw_archive) проходят тот же путь, что и при живом
+запуске: разбор -> data_quality -> transform_df -> загрузка. Используется
+для пересборки fav_artist после изменения логики трансформации и для
+прогона пайплайна со скоростью диска в бенчмарках.
+
+Пример:
+    python replay.py --start 2026-01-01 --end 2026-01-31 --user <user_id> --load
+"""
+
+import argparse
+import logging
+import time
+from typing import Iterator, Optional, Tuple
+
+import pandas as pd
+from sqlalchemy import create_engine
+
+from db import create_tables, db_url_from_env, load_plays
+from extractor import BATCH_SIZE, ArchiveSource, Extractor
+from key_index import KeyIndex, table_owner
+from spotify_etl import run_etl
+
+logger = logging.getLogger(__name__)
+
+
+
+def iter_replay_batches(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    user_id: Optional[str] = None,
+    batch_size: int = BATCH_SIZE,
+) -> Iterator[pd.DataFrame]:
+    """
+    Отдаёт пачки записей из архива в формате iter_track_batches().
+
+    Args:
+        start_date (Optional[str]): Первая дата раздела архива (YYYY-MM-DD).
+        end_date (Optional[str]): Последняя дата раздела архива (YYYY-MM-DD).
+        user_id (Optional[str]): Только ответы этого пользователя.
+        batch_size (int): Количество записей в одной пачке.
+
+    Yields:
+        pd.DataFrame: Пачка с колонками song_name, artist_name, played_at, timestamp.
+    """
+    yield from Extractor(ArchiveSource(start_date, end_date, user_id), batch_size).iter_batches()
+
+
+
+def replay_etl(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    user_id: Optional[str] = None,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Прогоняет архивированные ответы через проверку и трансформацию.
+
+    Args:
+        start_date (Optional[str]): Первая дата раздела архива (YYYY-MM-DD).
+        end_date (Optional[str]): Последняя дата раздела архива (YYYY-MM-DD).
+        user_id (Optional[str]): Только ответы этого пользователя.
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame]: Исходные записи и результат transform_df().
+    """
+    started = time.perf_counter()
+    raw_df, transformed_df = run_etl(iter_replay_batches(start_date, end_date, user_id))
+    elapsed = time.perf_counter() - started
+
+    rate = len(raw_df) / elapsed if elapsed else 0.0
+    logger.info(f"Воспроизведено записей: {len(raw_df)} за {elapsed:.2f} с ({rate:.0f} записей/с)")
+    return raw_df, transformed_df
+
+
+
+def load_replay(engine, raw_df: pd.DataFrame, user_id: Optional[str] = None) -> None:
+    """
+    Догружает воспроизведённые прослушивания и пересобирает fav_artist за их даты.
+
+    my_played_tracks не очищается: прослушивания, которых нет в архиве
+    (загруженные из выгрузки, до появления архива или вне --start/--end),
+    сохраняются, а повторы пропускает первичный ключ. fav_artist за
+    воспроизведённые даты удаляется и считается заново по my_played_tracks
+    в той же транзакции (см. db.load_plays()), поэтому при сбое таблицы
+    остаются в прежнем состоянии. Индекс загруженных ключей (см. key_index)
+    сверяется с таблицей и при расхождении строится заново.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Движок SQLAlchemy.
+        raw_df (pd.DataFrame): Исходные записи.
+        user_id (Optional[str]): Воспроизведённый пользователь; по умолчанию
+            владелец my_played_tracks.
+
+    Raises:
+        ValueError: Если user_id — не владелец my_played_tracks.
+    """
+    owner = table_owner()
+    user_id = user_id or owner
+    if user_id != owner:
+        raise ValueError(f"my_played_tracks хранит прослушивания {owner}: загрузить в неё архив {user_id} нельзя")
+
+    create_tables(engine)
+    plays, artists = load_plays(engine, raw_df)
+    index = KeyIndex.load(user_id, engine)
+    logger.info(
+        f"Загружено новых прослушиваний: {plays}, пересобрано строк fav_artist: {artists}, "
+        f"ключей в индексе {len(index.keys)}"
+    )
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Воспроизведение архива ответов Spotify API")
+    parser.add_argument("--start", help="Первая дата архива (YYYY-MM-DD)")
+    parser.add_argument("--end", help="Последняя дата архива (YYYY-MM-DD)")
+    parser.add_argument("--user", help="Идентификатор пользователя (с --load — по умолчанию SPOTIFY_USER_ID)")
+    parser.add_argument("--load", action="store_true", help="Загрузить прослушивания и пересобрать fav_artist в БД")
+    args = parser.parse_args()
+
+    user = args.user or (table_owner() if args.load else None)
+    raw, transformed = replay_etl(args.start, args.end, user)
+    print(transformed)
+    if args.load and not raw.empty:
+        load_replay(create_engine(db_url_from_env()), raw, user)
@@ -0,0 +1,511 @@
+"""
+Общий HTTP-клиент для всех запросов к Spotify API.
+
+Клиент держит одну requests.Session с пулом keep-alive соединений, поэтому
+повторные запросы (страницы, пользователи, эндпоинты) не платят за новое
+TCP+TLS-соединение. Все запросы проходят через token bucket, общий для
+процессов хоста (см. rate_limiter), а ответ 429 повторяется только для
+самого запроса после паузы из Retry-After. Ответы 5xx, таймауты и обрывы
+соединения повторяются с экспоненциальной паузой (SPOTIFY_SERVER_RETRIES,
+SPOTIFY_RETRY_BASE_DELAY).
+Одинаковые одновременные запросы (тот же URL, параметры и токен) объединяются:
+HTTP-запрос выполняет первый поток, остальные получают его результат
+(single-flight). Это срабатывает при пересекающихся запусках DAG и общих
+запросах обогащения. Размеры пула, таймауты и квота настраиваются переменными
+окружения, счётчики соединений, времени ожидания квоты и сэкономленных
+запросов доступны через SpotifyClient.stats().
+
+Для ограничения хвостовых задержек клиент может хеджировать запросы
+(SPOTIFY_HEDGE): если ответа нет дольше p95 недавних запросов, отправляется
+дубликат и используется первый ответ. Выключатель (см. circuit_breaker)
+при всплеске ошибок отклоняет запросы сразу, чтобы задача не ждала таймаутов.
+Фазы, размеры и статусы каждого запроса пишутся в SpotifyClient.metrics
+(см. metrics).
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, Optional, TypeVar
+from urllib.parse import urlparse
+
+import requests
+
+from circuit_breaker import CircuitBreaker
+from metrics import RequestMetrics, TimedHTTPAdapter, connection_phases, reset_connection_phases
+from rate_limiter import TokenBucket, rate_limit_file, retry_delay
+
+logger = logging.getLogger(__name__)
+
+API_BASE_URL = os.getenv("SPOTIFY_API_BASE_URL", "https://api.spotify.com/v1")
+POOL_CONNECTIONS = int(os.getenv("SPOTIFY_POOL_CONNECTIONS", 4))  # Число хостов в кэше пулов
+POOL_MAXSIZE = int(os.getenv("SPOTIFY_POOL_MAXSIZE", 32))  # Соединений на хост
+CONNECT_TIMEOUT = float(os.getenv("SPOTIFY_CONNECT_TIMEOUT", 3.05))
+READ_TIMEOUT = float(os.getenv("SPOTIFY_READ_TIMEOUT", 10))
+# Запросов в секунду на все процессы хоста, разделяющие SPOTIFY_RATE_LIMIT_FILE.
+# Spotify не публикует число: лимит считается по скользящему 30-секундному окну
+# на приложение, и настоящий сигнал — 429 с Retry-After (пауза тоже общая)
+RATE_LIMIT = float(os.getenv("SPOTIFY_RATE_LIMIT", 10))
+RATE_BURST = int(os.getenv("SPOTIFY_RATE_BURST", 20))
+MAX_RETRIES = int(os.getenv("SPOTIFY_MAX_RETRIES", 5))  # Повторов одного запроса после 429
+SERVER_RETRIES = int(os.getenv("SPOTIFY_SERVER_RETRIES", 3))  # Повторов после 5xx и ошибок соединения
+RETRY_BASE_DELAY = float(os.getenv("SPOTIFY_RETRY_BASE_DELAY", 1.0))  # Первая пауза отката, с
+COALESCE = os.getenv("SPOTIFY_COALESCE", "1").lower() not in ("0", "false", "no")
+HEDGE = os.getenv("SPOTIFY_HEDGE", "0").lower() not in ("0", "false", "no")
+HEDGE_QUANTILE = float(os.getenv("SPOTIFY_HEDGE_QUANTILE", 0.95))
+HEDGE_DEFAULT_DELAY = float(os.getenv("SPOTIFY_HEDGE_DEFAULT_DELAY", 1.0))  # Пока замеров мало
+HEDGE_MIN_DELAY = float(os.getenv("SPOTIFY_HEDGE_MIN_DELAY", 0.05))
+HEDGE_MIN_SAMPLES = 20
+LATENCY_SAMPLES = 256  # Окно замеров для расчёта задержки хеджирования
+BREAKER_FAILURE_RATIO = float(os.getenv("SPOTIFY_BREAKER_FAILURE_RATIO", 0.5))
+BREAKER_WINDOW = int(os.getenv("SPOTIFY_BREAKER_WINDOW", 20))
+# Запуск DAG делает единицы запросов: выключатель должен успеть разомкнуться
+# на повторах одной страницы (SERVER_RETRIES + 1 попыток)
+BREAKER_MIN_REQUESTS = int(os.getenv("SPOTIFY_BREAKER_MIN_REQUESTS", 3))
+BREAKER_RESET_TIMEOUT = float(os.getenv("SPOTIFY_BREAKER_RESET_TIMEOUT", 30))
+
+T = TypeVar("T")
+
+
+
+class SpotifyClient:
+    """
+    HTTP-клиент Spotify API с пулом соединений.
+
+    Экземпляр потокобезопасен для GET-запросов и рассчитан на совместное
+    использование всеми потоками процесса (см. get_client()).
+
+    Args:
+        base_url (str): Базовый URL API (для тестов — адрес локального мока).
+        pool_connections (int): Число хостов, для которых хранятся пулы.
+        pool_maxsize (int): Максимум keep-alive соединений на хост.
+        timeout (tuple): Таймауты (подключение, чтение) в секундах.
+        limiter (Optional[TokenBucket]): Ограничитель частоты запросов. По умолчанию —
+            общий для процессов хоста (см. rate_limiter.rate_limit_file()).
+        max_retries (int): Число повторов запроса после ответа 429.
+        server_retries (int): Число повторов после ответа 5xx, таймаута или обрыва соединения.
+        retry_base (float): Базовая пауза экспоненциального отката для таких повторов.
+        coalesce (bool): Объединять ли одинаковые одновременные запросы.
+        hedge (bool): Отправлять ли дубликат медленного запроса.
+        breaker (Optional[CircuitBreaker]): Выключатель. По умолчанию — из SPOTIFY_BREAKER_*.
+    """
+
+    def __init__(
+        self,
+        base_url: str = API_BASE_URL,
+        pool_connections: int = POOL_CONNECTIONS,
+        pool_maxsize: int = POOL_MAXSIZE,
+        timeout: tuple = (CONNECT_TIMEOUT, READ_TIMEOUT),
+        limiter: Optional[TokenBucket] = None,
+        max_retries: int = MAX_RETRIES,
+        server_retries: int = SERVER_RETRIES,
+        retry_base: float = RETRY_BASE_DELAY,
+        coalesce: bool = COALESCE,
+        hedge: bool = HEDGE,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.limiter = limiter or TokenBucket(RATE_LIMIT, RATE_BURST, rate_limit_file())
+        self.max_retries = max_retries
+        self.server_retries = server_retries
+        self.retry_base = retry_base
+        self.coalesce = coalesce
+        self.hedge = hedge
+        self.breaker = breaker or CircuitBreaker(
+            BREAKER_FAILURE_RATIO, BREAKER_WINDOW, BREAKER_MIN_REQUESTS, BREAKER_RESET_TIMEOUT
+        )
+        self._pool_maxsize = pool_maxsize
+
+        self.metrics = RequestMetrics()
+        self.adapter = TimedHTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=0,  # Повторы решаются выше, а не внутри urllib3
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+        self.session.headers.update({
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip, deflate",
+            "Connection": "keep-alive",
+        })
+
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._rate_limited = 0
+        self._backoff_seconds = 0.0
+        self._server_retried = 0
+        self._inflight: Dict[tuple, Future] = {}
+        self._coalesced = 0
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._hedge_executor: Optional[ThreadPoolExecutor] = None
+        self._hedged = 0
+        self._hedge_wins = 0
+
+    def url(self, path: str) -> str:
+        """
+        Собирает полный URL эндпоинта.
+
+        Args:
+            path (str): Путь относительно базового URL или полный URL.
+
+        Returns:
+            str: Полный URL.
+        """
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def endpoint(self, url: str) -> str:
+        """
+        Возвращает имя эндпоинта для метрик.
+
+        Args:
+            url (str): Полный URL запроса.
+
+        Returns:
+            str: Путь относительно базового URL без параметров; ID в пути
+                заменяется на {id} (tracks/{id}).
+        """
+        path = urlparse(url).path
+        base_path = urlparse(self.base_url).path
+        if path.startswith(base_path):
+            path = path[len(base_path):]
+        parts = path.strip("/").split("/")
+        if len(parts) == 2 and parts[0] in ("tracks", "artists", "albums"):
+            return f"{parts[0]}/{{id}}"
+        return "/".join(parts)
+
+    def _single_flight(self, key: tuple, fetch: Callable[[], T]) -> T:
+        """
+        Выполняет fetch() один раз для всех потоков, одновременно запросивших key.
+
+        Первый поток становится ведущим и выполняет запрос, остальные ждут его
+        результат или исключение. После завершения ключ освобождается, поэтому
+        следующий запрос снова идёт в API (это не кэш).
+
+        Args:
+            key (tuple): Ключ запроса.
+            fetch (Callable[[], T]): Функция, выполняющая запрос.
+
+        Returns:
+            T: Результат fetch() ведущего потока.
+        """
+        if not self.coalesce:
+            return fetch()
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self._coalesced += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            result = fetch()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def _request_key(self, url: str, token: str, params: Optional[dict]) -> tuple:
+        """Ключ запроса для объединения: URL, параметры без учёта порядка и токен."""
+        return url, tuple(sorted((params or {}).items())), token
+
+    def get_raw(
+        self,
+        path: str,
+        token: str,
+        params: Optional[dict] = None,
+        user_id: Optional[str] = None,
+    ) -> bytes:
+        """
+        Выполняет GET-запрос к эндпоинту и возвращает тело ответа без разбора.
+
+        Перед отправкой забирает токен из общего bucket. На ответ 429 ставит
+        bucket на паузу по Retry-After и повторяет только этот запрос, не
+        более max_retries раз. Ответ 5xx, таймаут или обрыв соединения
+        повторяются не более server_retries раз с экспоненциальной паузой;
+        каждая неудача учитывается выключателем, поэтому при отказе API он
+        размыкается на повторах и следующая попытка получает CircuitOpenError.
+        Если передан user_id, на ответ 401 токен пользователя помечается
+        истёкшим в менеджере токенов (см. auth), и запрос один раз
+        повторяется со свежим токеном. Одинаковые одновременные вызовы
+        разделяют один HTTP-запрос.
+
+        Args:
+            path (str): Путь эндпоинта (например, me/player/recently-played)
+                или полный URL (например, ссылка next из ответа).
+            token (str): Токен доступа пользователя.
+            params (Optional[dict]): Параметры запроса.
+            user_id (Optional[str]): Владелец токена для обновления после 401.
+
+        Returns:
+            bytes: Тело ответа (уже распакованное из gzip).
+
+        Raises:
+            CircuitOpenError: Выключатель разомкнут (см. circuit_breaker).
+            requests.exceptions.RequestException: Ошибка HTTP-запроса или статус не 2xx.
+        """
+        url = self.url(path)
+        return self._single_flight(
+            self._request_key(url, token, params), lambda: self._fetch(url, token, params, user_id)
+        )
+
+    def _fetch(self, url: str, token: str, params: Optional[dict], user_id: Optional[str] = None) -> bytes:
+        """Выполняет GET-запрос с повторами после 429, 401, 5xx и ошибок соединения (см. get_raw())."""
+        headers = {"Authorization": f"Bearer {token}"}
+        rate_limited = 0
+        failures = 0
+        reauthorized = False
+
+        while True:
+            self.breaker.before_request()
+            self.limiter.acquire()
+            with self._lock:
+                self._requests += 1
+
+            try:
+                response = self._send(url, params, headers)
+            except requests.exceptions.RequestException as e:
+                if failures == self.server_retries:
+                    raise
+                error = f"{type(e).__name__}: {e}"
+            else:
+                if response.status_code == 429 and rate_limited < self.max_retries:
+                    delay = retry_delay(rate_limited, response.headers.get("Retry-After"))
+                    rate_limited += 1
+                    logger.warning(f"429 от Spotify API, повтор через {delay:.1f} с: {url}")
+                    with self._lock:
+                        self._rate_limited += 1
+                        self._backoff_seconds += delay
+                    self.limiter.pause(delay)
+                    continue
+                if response.status_code == 401 and user_id is not None and not reauthorized:
+                    from auth import get_token_manager
+
+                    manager = get_token_manager()
+                    manager.invalidate(user_id)
+                    headers = {"Authorization": f"Bearer {manager.get_token(user_id)}"}
+                    reauthorized = True
+                    logger.warning(f"401 от Spotify API, повтор с обновлённым токеном {user_id}: {url}")
+                    continue
+                if response.status_code < 500 or failures == self.server_retries:
+                    break
+                error = f"{response.status_code} от Spotify API"
+
+            delay = retry_delay(failures, None, self.retry_base)
+            failures += 1
+            logger.warning(f"{error}, повтор {failures}/{self.server_retries} через {delay:.1f} с: {url}")
+            with self._lock:
+                self._server_retried += 1
+                self._backoff_seconds += delay
+            time.sleep(delay)
+
+        response.raise_for_status()
+        return response.content
+
+    def _timed_get(self, url: str, params: Optional[dict], headers: dict) -> requests.Response:
+        """Один GET-запрос с учётом задержки и исхода в выключателе и метриках."""
+        endpoint = self.endpoint(url)
+        reset_connection_phases()
+        started = time.perf_counter()
+        try:
+            response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+        except requests.exceptions.RequestException:
+            self.breaker.record(failed=True)
+            self.metrics.record_request(endpoint, "error", {**connection_phases(), "total": time.perf_counter() - started})
+            raise
+        total = time.perf_counter() - started
+
+        self.breaker.record(failed=response.status_code >= 500)
+        if response.status_code < 500:
+            with self._lock:
+                self._latencies.append(total)
+
+        # response.elapsed — от отправки до разбора заголовков, включая установку соединения
+        phases = dict(connection_phases())
+        phases["ttfb"] = max(response.elapsed.total_seconds() - sum(phases.values()), 0.0)
+        phases["total"] = total
+        self.metrics.record_request(endpoint, str(response.status_code), phases, len(response.content))
+        return response
+
+    def hedge_delay(self) -> float:
+        """
+        Возвращает задержку перед отправкой дубликата.
+
+        Returns:
+            float: Квантиль HEDGE_QUANTILE задержек последних запросов, не меньше
+                HEDGE_MIN_DELAY; HEDGE_DEFAULT_DELAY, пока замеров мало.
+        """
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return max(samples[min(int(len(samples) * HEDGE_QUANTILE), len(samples) - 1)], HEDGE_MIN_DELAY)
+
+    def _send(self, url: str, params: Optional[dict], headers: dict) -> requests.Response:
+        """
+        Отправляет запрос, при включённом хеджировании — с дубликатом после hedge_delay().
+
+        Проигравший запрос не прерывается (requests не поддерживает отмену),
+        его ответ отбрасывается. Дубликат тоже забирает токен из bucket.
+        """
+        if not self.hedge:
+            return self._timed_get(url, params, headers)
+
+        with self._lock:
+            if self._hedge_executor is None:
+                self._hedge_executor = ThreadPoolExecutor(self._pool_maxsize, thread_name_prefix="spotify-hedge")
+            executor = self._hedge_executor
+
+        primary = executor.submit(self._timed_get, url, params, headers)
+        try:
+            return primary.result(timeout=self.hedge_delay())
+        except FutureTimeoutError:
+            pass
+
+        self.limiter.acquire()
+        with self._lock:
+            self._requests += 1
+            self._hedged += 1
+        backup = executor.submit(self._timed_get, url, params, headers)
+
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is backup:
+                        with self._lock:
+                            self._hedge_wins += 1
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def get_decoded(
+        self,
+        path: str,
+        token: str,
+        params: Optional[dict] = None,
+        decoder: Callable[[bytes], T] = json.loads,
+        user_id: Optional[str] = None,
+    ) -> T:
+        """
+        Выполняет GET-запрос и декодирует ответ.
+
+        Одинаковые одновременные вызовы с тем же декодером разделяют и
+        HTTP-запрос, и результат разбора, поэтому вызывающий код не должен
+        изменять возвращённый объект.
+
+        Args:
+            path (str): Путь эндпоинта или полный URL.
+            token (str): Токен доступа пользователя.
+            params (Optional[dict]): Параметры запроса.
+            decoder (Callable[[bytes], T]): Функция разбора тела ответа (например, decode_tracks).
+            user_id (Optional[str]): Владелец токена для обновления после 401 (см. get_raw()).
+
+        Returns:
+            T: Разобранный ответ.
+
+        Raises:
+            requests.exceptions.RequestException: Ошибка HTTP-запроса или статус не 2xx.
+        """
+        url = self.url(path)
+        key = (*self._request_key(url, token, params), decoder)
+        return self._single_flight(key, lambda: decoder(self.get_raw(url, token, params, user_id)))
+
+    def stats(self) -> dict:
+        """
+        Возвращает счётчики использования соединений и квоты.
+
+        Returns:
+            dict: requests — отправлено запросов, connections — открыто новых
+                соединений, reused — запросов по уже открытому соединению,
+                reuse_ratio — доля таких запросов, rate_limited — получено
+                ответов 429, server_retries — повторов после 5xx и ошибок
+                соединения, backoff_seconds — суммарная пауза перед повторами,
+                throttled_seconds/throttle_events — ожидание токенов всеми потоками,
+                coalesced — вызовов, получивших результат чужого запроса
+                (сэкономлено запросов), inflight — запросов в работе,
+                hedged/hedge_wins — отправлено дубликатов и сколько из них
+                ответили первыми, hedge_delay — текущая задержка хеджирования,
+                breaker_* — состояние выключателя.
+        """
+        pools = self.adapter.poolmanager.pools
+        connections = 0
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                connections += pool.num_connections
+
+        with self._lock:
+            sent = self._requests
+            rate_limited = self._rate_limited
+            backoff_seconds = self._backoff_seconds
+            server_retried = self._server_retried
+            coalesced = self._coalesced
+            inflight = len(self._inflight)
+            hedged = self._hedged
+            hedge_wins = self._hedge_wins
+        reused = max(sent - connections, 0)
+        return {
+            "requests": sent,
+            "connections": connections,
+            "reused": reused,
+            "reuse_ratio": round(reused / sent, 3) if sent else 0.0,
+            "rate_limited": rate_limited,
+            "server_retries": server_retried,
+            "backoff_seconds": round(backoff_seconds, 3),
+            "coalesced": coalesced,
+            "inflight": inflight,
+            "hedged": hedged,
+            "hedge_wins": hedge_wins,
+            "hedge_delay": round(self.hedge_delay(), 3),
+            **self.breaker.stats(),
+            **self.limiter.stats(),
+        }
+
+    def close(self) -> None:
+        """Закрывает все соединения пула."""
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False)
+        self.session.close()
+
+
+
+_client: Optional[SpotifyClient] = None
+_client_lock = threading.Lock()
+
+
+
+def get_client() -> SpotifyClient:
+    """
+    Возвращает общий для процесса экземпляр SpotifyClient.
+
+    Returns:
+        SpotifyClient: Клиент, создаваемый при первом вызове.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = SpotifyClient()
+    return _client
@@ -2,107 +2,166 @@
 ETL-модуль для извлечения данных о прослушанных треках из Spotify API.
 
 Функции:
-- Извлечение последних 50 треков за последние 24 часа.
-- Проверка качества данных (пустота, дубликаты, NULL).
+- Постраничное извлечение треков за последние 24 часа пачками.
+- Проверка качества данных по контракту; строки с нарушениями либо
+  прерывают запуск, либо отбрасываются или уходят в карантин (SPOTIFY_QUALITY_MODE).
 - Трансформация: агрегация по артистам и датам.
 - Возврат готового DataFrame.
+
+Импорт модуля не читает .env, не проверяет учётные данные и не загружает
+pandas, requests и сетевые модули пайплайна: всё это происходит при первом
+вызове функций задачи. Поэтому парсинг DAG планировщиком Airflow не платит
+за тяжёлые импорты и не падает без учётных данных (замер:
+benchmarks/bench_import.py).
 """
 
-import pandas as pd
-import requests
-from datetime import datetime, timedelta
-import logging
-from dotenv import load_dotenv
-import os 
+from __future__ import annotations
 
-load_dotenv()
-USER_ID = os.getenv("SPOTIFY_USER_ID")
-TOKEN = os.getenv("SPOTIFY_TOKEN")
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, Optional, Tuple, Union
+import logging
+from decoding import BAD_PLAYED_AT, concat_frames, is_arrow
+from extractor import BATCH_SIZE, COLUMNS, ApiSource, Extractor, default_user_id, load_settings, start_after_ms
+from quality import FAV_ARTIST_CONTRACT, apply_quality, check_quality
+from watermark import save_watermark
 
-if not USER_ID or not TOKEN:
-    raise ValueError("Переменные USER_ID и\или TOKEN не найдены в .env")
+if TYPE_CHECKING:
+    import pandas as pd
+    import pyarrow as pa
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+def iter_track_batches(
+    after_ms: Optional[int] = None,
+    batch_size: int = BATCH_SIZE,
+    user_id: Optional[str] = None,
+    token: Optional[str] = None,
+    enrich_artists: Optional[bool] = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Потоково извлекает прослушивания и отдаёт их пачками фиксированного размера.
+
+    В памяти одновременно находятся только текущая страница ответа и одна
+    пачка записей, поэтому следующие этапы (проверка, загрузка) могут начинать
+    работу до окончания извлечения. Последняя пачка может быть меньше batch_size.
+    Сырые страницы ответа сохраняются в архив (см. raw_archive). Если
+    SPOTIFY_ENRICH_TRACKS не отключена, каждая пачка дополняется метаданными
+    треков (album_name, duration_ms, popularity; см. enrichment), а при
+    enrich_artists — жанрами и подписчиками артистов.
+
+    Args:
+        after_ms (Optional[int]): Нижняя граница выборки в миллисекундах.
+            По умолчанию — отметка последней загрузки пользователя, а если
+            её ещё нет — 24 часа назад.
+        batch_size (int): Количество записей в одной пачке.
+        user_id (Optional[str]): Пользователь Spotify. По умолчанию — SPOTIFY_USER_ID.
+        token (Optional[str]): Токен доступа. По умолчанию — токен пользователя из auth.
+        enrich_artists (Optional[bool]): Обогащать ли пачки метаданными артистов.
+            По умолчанию — SPOTIFY_ENRICH_ARTISTS. Отключается, когда артисты
+            обогащаются сразу для всех пользователей (см. multi_user_extractor).
+
+    Yields:
+        pd.DataFrame: Пачка с колонками song_name, artist_name, played_at, timestamp,
+            track_id, artist_id (и колонками обогащения).
+
+    Raises:
+        requests.exceptions.RequestException: Ошибка HTTP-запроса.
+    """
+    user_id = user_id or default_user_id()
+    if after_ms is None:
+        after_ms = start_after_ms(user_id)
 
+    extractor = Extractor(ApiSource(user_id, token), batch_size, enrich_artists=enrich_artists)
+    yield from extractor.iter_batches(after_ms)
+    logger.info(f"Извлечение завершено: {extractor.stats()}")
 
-def return_dataframe() -> pd.DataFrame:
+
+
+def return_dataframe(
+    user_id: Optional[str] = None,
+    token: Optional[str] = None,
+    enrich_artists: Optional[bool] = None,
+) -> pd.DataFrame:
     """
     Извлекает данные о последних прослушанных треках из Spotify API.
 
+    Собирает в одну таблицу все пачки из iter_track_batches().
+
+    Args:
+        user_id (Optional[str]): Пользователь Spotify. По умолчанию — SPOTIFY_USER_ID.
+        token (Optional[str]): Токен доступа. По умолчанию — токен пользователя из auth.
+        enrich_artists (Optional[bool]): Обогащать ли таблицу метаданными артистов.
+            По умолчанию — SPOTIFY_ENRICH_ARTISTS.
+
     Returns:
         pd.DataFrame: Таблица с колонками:
-            - song_name: название трека
-            - artist_name: имя артиста
-            - played_at: дата и время прослушивания (ISO 8601)
-            - timestamp: дата в формате YYYY-MM-DD (без времени)
+            - song_name: название трека (category)
+            - artist_name: имя артиста (category)
+            - played_at: время прослушивания (datetime64[ms, UTC])
+            - timestamp: дата в формате YYYY-MM-DD (без времени, category)
+            - track_id: ID трека Spotify
+            - artist_id: ID первого артиста альбома
+            - album_name, duration_ms, popularity: метаданные трека (при обогащении)
+            - artist_genres, artist_followers: метаданные артиста (при обогащении)
 
     Raises:
         requests.exceptions.RequestException: Ошибка HTTP-запроса.
-        KeyError: Отсутствие ожидаемых ключей в JSON-ответе.
     """
+    import pandas as pd
+
+    from enrichment import get_artist_enricher, get_track_enricher
+    from spotify_client import get_client
+
     logger.info("Начало извлечения данных из Spotify API")
+    settings = load_settings()
+    if enrich_artists is None:
+        enrich_artists = settings["enrich_artists"]
+
+    batches = list(iter_track_batches(user_id=user_id, token=token, enrich_artists=enrich_artists))
+    if batches:
+        df = concat_frames(batches)
+    else:
+        df = pd.DataFrame(columns=COLUMNS)
+
+    logger.info(f"Извлечено {len(df)} треков. Соединения: {get_client().stats()}")
+    if settings["enrich_tracks"]:
+        logger.info(f"Кэш метаданных треков: {get_track_enricher().stats()}")
+    if enrich_artists:
+        logger.info(f"Кэш метаданных артистов: {get_artist_enricher().stats()}")
+    return df
 
-    # Формирование заголовков запроса
-    headers = {
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {TOKEN}"
-    }
 
-    # Расчёт временной метки (24 часа назад в миллисекундах)
-    yesterday = datetime.now() - timedelta(days=1)
-    yesterday_unix_ms = int(yesterday.timestamp() * 1000)
 
-    # URL запроса к Spotify API
-    url = (
-        "https://api.spotify.com/v1/me/player/recently-played"
-        f"?limit=50&after={yesterday_unix_ms}"
-    )
+def update_watermark(df: Union[pd.DataFrame, pa.Table], user_id: Optional[str] = None) -> None:
+    """
+    Сдвигает отметку последней загрузки до самого нового трека в таблице.
 
-    try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()  # Проверяет статус 2xx
-        data = response.json()
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Ошибка при запросе к API: {e}")
-        raise
+    Вызывается после успешной загрузки в БД, чтобы следующий запуск
+    запрашивал только новые прослушивания.
 
-    # Извлечение данных из JSON
-    song_names = []
-    artist_names = []
-    played_at_list = []
-    timestamps = []
-
-    for item in data.get("items", []):
-        try:
-            song_names.append(item["track"]["name"])
-            artist_names.append(item["track"]["album"]["artists"][0]["name"])
-            played_at = item["played_at"]
-            played_at_list.append(played_at)
-            timestamps.append(played_at[:10])  # Дата в формате YYYY-MM-DD
-        except KeyError as e:
-            logger.warning(f"Пропущен элемент из-за отсутствующего ключа: {e}")
-
-    df = pd.DataFrame({
-        "song_name": song_names,
-        "artist_name": artist_names,
-        "played_at": played_at_list,
-        "timestamp": timestamps
-    })
-
-    logger.info(f"Извлечено {len(df)} треков")
-    return df
+    Args:
+        df (Union[pd.DataFrame, pa.Table]): Загруженные данные с колонкой played_at.
+        user_id (Optional[str]): Пользователь Spotify. По умолчанию — SPOTIFY_USER_ID.
+    """
+    from key_index import played_at_keys
 
+    if len(df) == 0:
+        return
+    latest_ms = int(played_at_keys(df).max())  # played_at хранится как int64 (мс)
+    save_watermark(user_id or default_user_id(), latest_ms)
 
 
-def data_quality(df: pd.DataFrame) -> bool:
+
+def data_quality(df: Union[pd.DataFrame, pa.RecordBatch, pa.Table]) -> bool:
     """
     Проверяет качество данных.
 
+    Все правила проверяются за один проход (см. quality.check_quality()),
+    поэтому сообщение об ошибке перечисляет все нарушения сразу. Данные
+    Arrow проверяются без преобразования в pandas.
+
     Args:
-        df (pd.DataFrame): Входной DataFrame.
+        df (Union[pd.DataFrame, pa.RecordBatch, pa.Table]): Входные данные.
 
     Returns:
         bool: True, если данные корректны.
@@ -111,28 +170,36 @@ def data_quality(df: pd.DataFrame) -> bool:
         ValueError: Если данные не соответствуют требованиям.
     """
     logger.info("Проверка качества данных")
+    apply_quality(df, check_quality(df), "fail")
+    logger.info("Проверка качества данных пройдена успешно")
+    return True
 
-    if df.empty:
-        raise ValueError("DataFrame пуст")
 
-    if not df['played_at'].is_unique:
-        raise ValueError("Обнаружены дубликаты в колонке 'played_at'")
 
-    if df.isnull().values.any():
-        null_counts = df.isnull().sum()
-        raise ValueError(f"Обнаружены NULL-значения: {null_counts.to_dict()}")
+def _arrow_counts(data: Union[pa.RecordBatch, pa.Table]) -> pd.DataFrame:
+    """Считает прослушивания по датам и артистам в Arrow; в pandas переходят только группы."""
+    import pyarrow as pa
 
-    logger.info("Проверка качества данных пройдена успешно")
-    return True
+    table = data if isinstance(data, pa.Table) else pa.Table.from_batches([data])
+    # У каждой пачки свой словарь строк; группировка требует общего
+    groups = table.unify_dictionaries().group_by(["timestamp", "artist_name"]).aggregate([("played_at", "count")])
+    return pa.table({
+        "timestamp": groups["timestamp"].cast(pa.string()),
+        "artist_name": groups["artist_name"].cast(pa.string()),
+        "count": groups["played_at_count"],
+    }).to_pandas().sort_values(["timestamp", "artist_name"], ignore_index=True)
 
 
 
-def transform_df(df: pd.DataFrame) -> pd.DataFrame:
+def transform_df(df: Union[pd.DataFrame, pa.RecordBatch, pa.Table]) -> pd.DataFrame:
     """
     Трансформирует данные: агрегирует количество прослушиваний по артистам и датам.
 
+    Данные Arrow группируются в pyarrow; результат (по строке на дату и
+    артиста) всегда возвращается как DataFrame.
+
     Args:
-        df (pd.DataFrame): Входной DataFrame.
+        df (Union[pd.DataFrame, pa.RecordBatch, pa.Table]): Входные данные.
 
     Returns:
         pd.DataFrame: Трансформированный DataFrame с колонками:
@@ -141,11 +208,26 @@ def transform_df(df: pd.DataFrame) -> pd.DataFrame:
             - artist_name: артист
             - count: количество прослушиваний
     """
+    import pandas as pd
+
     logger.info("Начало трансформации данных")
 
     # Группировка и подсчёт
-    transformed = df.groupby(['timestamp', 'artist_name'], as_index=False).size()
-    transformed.rename(columns={'size': 'count'}, inplace=True)
+    if is_arrow(df):
+        transformed = _arrow_counts(df)
+    else:
+        # Категориальные ключи группируются по целочисленным кодам; observed=True —
+        # только встретившиеся сочетания, а не декартово произведение категорий
+        transformed = df.groupby(['timestamp', 'artist_name'], as_index=False, observed=True, sort=False).size()
+        transformed.rename(columns={'size': 'count'}, inplace=True)
+        # Категории идут в порядке появления: упорядочиваем словари (групп немного),
+        # чтобы сортировка по кодам совпала со строковой, как в Arrow
+        for key in ('timestamp', 'artist_name'):
+            if isinstance(transformed[key].dtype, pd.CategoricalDtype):
+                categories = transformed[key].cat.categories
+                transformed[key] = transformed[key].cat.reorder_categories(categories.sort_values())
+        transformed = transformed.sort_values(['timestamp', 'artist_name'], ignore_index=True)
+        transformed = transformed.astype({'timestamp': str, 'artist_name': str})
 
     # Создание уникального ID
     transformed['ID'] = transformed['timestamp'] + '-' + transformed['artist_name']
@@ -158,40 +240,134 @@ def transform_df(df: pd.DataFrame) -> pd.DataFrame:
 
 
 
-def spotify_etl() -> pd.DataFrame:
+def run_etl(
+    batches: Iterable[Union[pd.DataFrame, pa.RecordBatch, pa.Table]],
+    on_error: str = "fail",
+    quarantine: Optional[Callable] = None,
+) -> Tuple[Union[pd.DataFrame, pa.Table], pd.DataFrame]:
     """
-    Основной ETL-процесс: извлечение, проверка, трансформация данных.
+    Проверяет и трансформирует поток пачек записей.
+
+    Общий путь для живого запуска и воспроизведения архива. Пачки Arrow
+    объединяются в pa.Table без копирования. В режиме fail каждая пачка
+    проверяется по мере поступления, чтобы запуск прерывался до конца
+    извлечения. В режимах drop и quarantine нарушения ищутся один раз
+    по итоговой таблице (включая повторы между пачками): строки с
+    нарушениями отбрасываются, остальные трансформируются.
+
+    Args:
+        batches (Iterable[Union[pd.DataFrame, pa.RecordBatch, pa.Table]]): Пачки
+            в формате iter_track_batches() или Extractor(arrow=True).
+        on_error (str): fail, drop или quarantine (см. quality.apply_quality()).
+        quarantine (Optional[Callable]): Обработчик отклонённых строк для режима quarantine.
 
     Returns:
-        pd.DataFrame: Исходный DataFrame с треками (до трансформации).
+        Tuple[Union[pd.DataFrame, pa.Table], pd.DataFrame]: Корректные исходные записи
+            (в формате пачек) и результат transform_df(). Обе таблицы пусты,
+            если пачек (или корректных строк) не было.
 
     Raises:
-        Exception: Если на любом этапе произошла ошибка.
+        ValueError: В режиме fail — если данные не прошли проверку качества.
     """
-    logger.info("Запуск ETL-процесса")
+    import pandas as pd
+
+    if on_error == "quarantine" and quarantine is None:
+        raise ValueError("Для режима quarantine нужен обработчик отклонённых строк")
+
+    # Шаг 1: Извлечение данных пачками (в режиме fail — с проверкой каждой пачки)
+    collected = []
+    for batch in batches:
+        if on_error == "fail":
+            data_quality(batch)
+        collected.append(batch)
+    if not collected:
+        logger.info("Новых прослушиваний нет. ETL завершён без изменений")
+        return pd.DataFrame(columns=COLUMNS), pd.DataFrame()
+    if is_arrow(collected[0]):
+        import pyarrow as pa
+
+        raw_df = pa.concat_tables(
+            [batch if isinstance(batch, pa.Table) else pa.Table.from_batches([batch]) for batch in collected],
+            promote_options="default",  # Колонка bad_played_at есть только в пачках с ошибками
+        )
+    else:
+        raw_df = concat_frames(collected)
+
+    # Шаг 2: Проверка качества итоговой таблицы, все правила за один проход
+    report = check_quality(raw_df)
+    logger.info(f"Отчёт о качестве данных: {report.to_dict()}")
+    raw_df = apply_quality(raw_df, report, on_error, quarantine)
+    if BAD_PLAYED_AT in (raw_df.column_names if is_arrow(raw_df) else raw_df.columns):
+        # В корректных строках флаг пуст, в таблицах БД такой колонки нет
+        raw_df = raw_df.drop_columns([BAD_PLAYED_AT]) if is_arrow(raw_df) else raw_df.drop(columns=[BAD_PLAYED_AT])
+    if len(raw_df) == 0:
+        logger.warning("После проверки качества не осталось корректных записей")
+        return raw_df, pd.DataFrame()
+
+    # Шаг 3: Трансформация и проверка агрегатов по контракту fav_artist
+    transformed_df = transform_df(raw_df)
+    apply_quality(transformed_df, check_quality(transformed_df, FAV_ARTIST_CONTRACT), "fail")
+
+    # Логирование результата
+    logger.info(f"ETL завершён. Исходные записи: {len(raw_df)}, трансформированные: {len(transformed_df)}")
+    return raw_df, transformed_df
+
+
+
+def export_request_metrics() -> None:
+    """
+    Выгружает метрики запросов клиента за запуск (см. metrics).
+
+    Ошибка записи только логируется, чтобы не влиять на результат запуска.
+    """
+    from spotify_client import get_client
 
     try:
-        # Шаг 1: Извлечение данных
-        raw_df = return_dataframe()
+        get_client().metrics.export()
+    except OSError as e:
+        logger.warning(f"Не удалось выгрузить метрики запросов: {e}")
 
-        # Шаг 2: Проверка качества
-        if not data_quality(raw_df):
-            logger.error("ETL прерван из-за некачественных данных")
-            return pd.DataFrame()  # Возвращаем пустой DataFrame
 
-        # Шаг 3: Трансформация
-        transformed_df = transform_df(raw_df)
 
-        # Логирование результата
-        logger.info(f"ETL завершён. Исходные записи: {len(raw_df)}, трансформированные: {len(transformed_df)}")
-        print(transformed_df)  # Вывод результата
+def spotify_etl(
+    batches: Optional[Iterable[pd.DataFrame]] = None,
+    on_error: Optional[str] = None,
+    quarantine: Optional[Callable] = None,
+) -> pd.DataFrame:
+    """
+    Основной ETL-процесс: извлечение, проверка, трансформация данных.
+
+    Args:
+        batches (Optional[Iterable[pd.DataFrame]]): Источник пачек записей.
+            По умолчанию — живой API через iter_track_batches().
+        on_error (Optional[str]): Что делать со строками, не прошедшими проверку:
+            fail, drop или quarantine. По умолчанию — SPOTIFY_QUALITY_MODE (fail).
+        quarantine (Optional[Callable]): Обработчик отклонённых строк для режима
+            quarantine (например, quarantine.QuarantineSink).
 
+    Returns:
+        pd.DataFrame: Исходный DataFrame с корректными треками (до трансформации).
+
+    Raises:
+        Exception: Если на любом этапе произошла ошибка.
+    """
+    logger.info("Запуск ETL-процесса")
+
+    try:
+        on_error = on_error or load_settings()["quality_mode"]
+        raw_df, transformed_df = run_etl(iter_track_batches() if batches is None else batches, on_error, quarantine)
+        if not transformed_df.empty:
+            print(transformed_df)  # Вывод результата
         return raw_df
 
     except Exception as e:
         logger.exception(f"Ошибка в ETL-процессе: {e}")
         raise
 
+    finally:
+        if batches is None:
+            export_request_metrics()
+
 
 
 if __name__ == "__main__":
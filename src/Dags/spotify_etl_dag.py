@@ -1,22 +1,25 @@
 """
 DAG Airflow для регулярного ETL-процесса:
 - Извлечение данных о прослушанных треках из Spotify API.
-- Проверка качества данных.
+- Проверка качества данных (строки с нарушениями — в карантин, см. quarantine).
 - Загрузка в PostgreSQL.
 
 Зависимости:
 - spotify_etl.py (основной ETL-модуль)
 - Соединение Airflow 'postgre_sql' (настроено в UI)
+
+Планировщик постоянно перечитывает этот файл, поэтому на верхнем уровне
+импортируются только Airflow и DDL; ETL-модуль, pandas и SQLAlchemy
+загружаются внутри задачи.
 """
 
-from datetime import datetime as dt
+import datetime as dt
 from airflow import DAG
 from airflow.operators.python import PythonOperator
 from airflow.providers.postgres.operators.postgres import PostgresOperator
 from airflow.providers.postgres.hooks.postgres import PostgresHook
-from sqlalchemy import create_engine
 from airflow.utils.dates import days_ago
-from spotify_etl import spotify_etl
+from db import MY_PLAYED_TRACKS_DDL, QUARANTINE_PLAYS_DDL
 
 
 
@@ -48,17 +51,39 @@ def etl_process():
     Основной ETL-процесс:
     1. Извлечение данных через spotify_etl().
     2. Подключение к PostgreSQL через Airflow Connection.
-    3. Загрузка DataFrame в таблицу.
+    3. Отсев уже загруженных строк по индексу ключей (см. key_index), загрузка
+       DataFrame в таблицу через db.upsert_plays() и сдвиг отметки последней
+       загрузки.
+    4. Запись строк, не прошедших проверку качества, в quarantine_plays.
+
+    Режим проверки качества задаёт SPOTIFY_QUALITY_MODE: fail (по умолчанию)
+    прерывает запуск при любом нарушении; drop и quarantine отбрасывают
+    только строки с нарушениями, и корректные строки загружаются. Карантин
+    записывается после загрузки, чтобы повтор упавшей задачи не дублировал
+    его; если БД недоступна, отклонённые строки сохраняются в CSV-файл.
+
+    Если новых прослушиваний нет, подключение к БД не открывается.
 
     Raises:
         Exception: При ошибках извлечения или загрузки данных.
     """
+    from sqlalchemy import create_engine
+
+    from db import upsert_plays
+    from extractor import default_user_id, load_settings
+    from key_index import KeyIndex
+    from quarantine import QuarantineSink
+    from spotify_etl import spotify_etl, update_watermark
+    from watermark import save_watermark
+
     print("Запуск ETL-процесса...")
 
     # Шаг 1: Извлечение и проверка данных
+    mode = load_settings()["quality_mode"]
+    sink = QuarantineSink()
     try:
-        df = spotify_etl()  # Вызов из spotify_etl.py
-        if df.empty:
+        df = spotify_etl(on_error=mode, quarantine=sink if mode == "quarantine" else None)
+        if df.empty and not sink.rows:
             print("Данные отсутствуют. Пропуск загрузки.")
             return
     except Exception as e:
@@ -75,36 +100,42 @@ def etl_process():
             f"postgresql+psycopg2://{connection.login}:{connection.password}"
             f"@{connection.host}:{connection.port}/{connection.schema}"
         )
-        engine = create_engine(db_url)
-
-        # Шаг 3: Загрузка в БД
-        df.to_sql(
-            name="my_played_tracks",
-            con=engine,
-            if_exists="replace",  # Заменяем таблицу целиком
-            index=False,
-            method="multi",  # Ускоряет загрузку больших объёмов
-        )
-        print(f"Данные успешно загружены. Количество строк: {len(df)}")
+        engine = create_engine(db_url)  # Соединение откроется только при обращении к БД
+
+        # Шаг 3: Загрузка в БД только новых строк. Индекс ключей отсеивает
+        # известные played_at до обращения к БД, а повторы, которых он не знает,
+        # пропускает первичный ключ (ON CONFLICT DO NOTHING)
+        index = KeyIndex.load(default_user_id(), engine)
+        df = index.filter_new(df)
+        inserted = 0
+        if not df.empty:
+            inserted = upsert_plays(engine, df)
+            update_watermark(df)
+            index.add(df)
+            index.save()
+        print(f"Данные успешно загружены. Количество строк: {inserted}")
     except Exception as e:
         print(f"Ошибка при загрузке в БД: {e}")
         raise
 
+    # Шаг 4: Карантин отклонённых строк
+    if sink.rows:
+        latest_ms = sink.latest_played_at_ms()
+        try:
+            sink.to_db(engine)
+        except Exception as e:
+            print(f"Не удалось записать карантин в БД: {e}")
+            print(f"Отклонённые строки сохранены в файл: {sink.to_file()}")
+        if latest_ms is not None:
+            save_watermark(default_user_id(), latest_ms)  # Не извлекать отклонённые строки повторно
+
 
 
 with dag:
     create_table = PostgresOperator(
         task_id="create_table",
         postgres_conn_id="postgre_sql",
-        sql="""
-            CREATE TABLE IF NOT EXISTS my_played_tracks (
-                song_name VARCHAR(200),
-                artist_name VARCHAR(200),
-                played_at VARCHAR(200),
-                timestamp VARCHAR(200),
-                CONSTRAINT primary_key_constraint PRIMARY KEY (played_at)
-            );
-        """,
+        sql=[MY_PLAYED_TRACKS_DDL, QUARANTINE_PLAYS_DDL],
 
         database="demo",
     )
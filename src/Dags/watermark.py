@@ -0,0 +1,111 @@
+"""
+Хранение отметки последней загрузки (high-water mark) для инкрементального извлечения.
+
+Для каждого пользователя сохраняется played_at последнего загруженного
+прослушивания (Unix-время в миллисекундах). Следующий запуск использует его
+как курсор after и запрашивает у API только новые прослушивания.
+
+Состояние хранится в локальном JSON-файле, поэтому его можно прочитать без
+подключения к БД. Путь задаётся переменной окружения SPOTIFY_STATE_FILE.
+"""
+
+import json
+import logging
+import os
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "state", "watermarks.json")
+DEFAULT_USER = "default"
+
+
+
+def _state_file() -> str:
+    """
+    Возвращает путь к файлу состояния.
+
+    Returns:
+        str: Путь из SPOTIFY_STATE_FILE или путь по умолчанию.
+    """
+    return os.getenv("SPOTIFY_STATE_FILE", DEFAULT_STATE_FILE)
+
+
+
+def _read_state(path: str) -> dict:
+    """
+    Читает файл состояния.
+
+    Args:
+        path (str): Путь к файлу.
+
+    Returns:
+        dict: Отметки по пользователям; пустой словарь, если файла нет.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+
+def load_watermark(user_id: Optional[str]) -> Optional[int]:
+    """
+    Возвращает отметку последней загрузки пользователя.
+
+    Args:
+        user_id (Optional[str]): Идентификатор пользователя Spotify.
+
+    Returns:
+        Optional[int]: played_at последнего загруженного трека в миллисекундах
+            или None, если пользователь ещё не загружался.
+    """
+    value = _read_state(_state_file()).get(user_id or DEFAULT_USER)
+    return int(value) if value is not None else None
+
+
+
+def save_watermark(user_id: Optional[str], played_at_ms: int) -> None:
+    """
+    Сохраняет отметку последней загрузки пользователя.
+
+    Отметка только сдвигается вперёд. Файл перезаписывается атомарно через
+    временный файл, чтобы прерванный запуск не повредил состояние.
+
+    Args:
+        user_id (Optional[str]): Идентификатор пользователя Spotify.
+        played_at_ms (int): played_at последнего загруженного трека в миллисекундах.
+    """
+    path = _state_file()
+    state = _read_state(path)
+    key = user_id or DEFAULT_USER
+
+    current = state.get(key)
+    if current is not None and int(current) >= played_at_ms:
+        return
+
+    state[key] = int(played_at_ms)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+    logger.info(f"Отметка загрузки для {key} сдвинута до {played_at_ms}")
+
+
+
+def drop_watermarks() -> bool:
+    """
+    Удаляет отметки всех пользователей (вместе с таблицей my_played_tracks).
+
+    Иначе следующий запуск запросит у API только прослушивания после
+    отметки, и удалённая история не будет загружена заново.
+
+    Returns:
+        bool: Был ли удалён файл состояния.
+    """
+    path = _state_file()
+    if not os.path.exists(path):
+        return False
+    os.remove(path)
+    return True
@@ -0,0 +1,94 @@
+"""
+Бенчмарк формата пачек между этапами: pandas (строки — Python-объекты)
+против Apache Arrow (timestamp[ms, UTC], строки словарём).
+
+Синтетическая выгрузка истории (endsong_*.json, как в backfill) проходит
+этапы extract (ExportSource -> пачки) -> data_quality -> transform_df
+в обоих форматах. Для каждого этапа — лучшее время из --repeat, а также
+объём итоговой таблицы в памяти.
+
+Запуск:
+    python benchmarks/bench_batches.py --items 1000000 --repeat 3
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SRC_DIR)
+sys.path.insert(0, os.path.join(SRC_DIR, "Dags"))
+
+from extractor import Extractor, ExportSource  # noqa: E402
+from mock_spotify_api import MockCatalog, MockConfig  # noqa: E402
+from spotify_etl import data_quality, transform_df  # noqa: E402
+
+
+
+def write_export(items: int, path: str) -> None:
+    """Сохраняет синтетическую расширенную выгрузку истории за год."""
+    catalog = MockCatalog(MockConfig(plays_per_user=items, history_hours=24 * 365))
+    records = []
+    for stamp, artist_index, number in catalog.history("bench-user"):
+        item = catalog.play_item(stamp, artist_index, number)
+        records.append({
+            "ts": item["played_at"],
+            "master_metadata_track_name": item["track"]["name"],
+            "master_metadata_album_artist_name": item["track"]["album"]["artists"][0]["name"],
+            "spotify_track_uri": f"spotify:track:{item['track']['id']}",
+        })
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(records, f)
+
+
+
+def best_of(func, repeat: int) -> tuple:
+    """Возвращает (лучшее время в секундах, результат последнего вызова)."""
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+
+def run(path: str, arrow: bool, batch_size: int, repeat: int) -> dict:
+    """Прогоняет этапы в одном формате."""
+    extract, data = best_of(lambda: Extractor(ExportSource(path), batch_size, arrow=arrow).collect(), repeat)
+    quality, _ = best_of(lambda: data_quality(data), repeat)
+    transform, result = best_of(lambda: transform_df(data), repeat)
+    size = data.nbytes if arrow else int(data.memory_usage(deep=True).sum())
+    return {
+        "rows": len(data), "groups": len(result), "extract": extract,
+        "quality": quality, "transform": transform, "bytes": size,
+    }
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк формата пачек")
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument("--batch-size", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    export_path = os.path.join(tempfile.mkdtemp(prefix="bench-batches-"), "endsong_0.json")
+    write_export(args.items, export_path)
+
+    results = {name: run(export_path, name == "arrow", args.batch_size, args.repeat) for name in ("pandas", "arrow")}
+
+    print(f"{'формат':<8}{'строк':>9}{'extract, с':>12}{'quality, мс':>13}{'transform, мс':>15}{'память, МиБ':>13}")
+    for name, r in results.items():
+        print(
+            f"{name:<8}{r['rows']:>9}{r['extract']:>12.2f}{r['quality'] * 1000:>13.1f}"
+            f"{r['transform'] * 1000:>15.1f}{r['bytes'] / 2**20:>13.1f}"
+        )
+    pandas, arrow = results["pandas"], results["arrow"]
+    print(
+        f"arrow: память x{pandas['bytes'] / arrow['bytes']:.1f} меньше, quality x{pandas['quality'] / arrow['quality']:.1f}, "
+        f"transform x{pandas['transform'] / arrow['transform']:.1f} быстрее"
+    )
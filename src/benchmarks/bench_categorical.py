@@ -0,0 +1,115 @@
+"""
+Бенчмарк строковых колонок пачек: object-строки против category (словарь).
+
+Пачки --users пользователей по --rows / --users прослушиваний со словарём
+из --artists артистов и --songs треков собираются в одну таблицу (как
+Extractor.collect() и run_etl()) в двух представлениях song_name,
+artist_name и timestamp:
+- object — Python-строка на каждую строку таблицы (прежний формат);
+- category — словарь на пачку и целочисленные коды, пачки объединяются
+  через decoding.concat_frames() (текущий формат PlayColumns.to_frame()).
+
+Для каждого представления измеряется:
+- память трёх колонок;
+- build — сборка колонок пачек из списков строк (буферы PlayColumns);
+- concat — объединение пачек пользователей;
+- transform — spotify_etl.transform_df() (группировка по дате и артисту).
+
+Запуск:
+    python benchmarks/bench_categorical.py --rows 3000000 --users 50 --repeat 3
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SRC_DIR, "Dags"))
+
+from decoding import concat_frames  # noqa: E402
+from spotify_etl import transform_df  # noqa: E402
+
+COLUMNS = ["song_name", "artist_name", "timestamp"]
+
+
+
+def best_ms(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+
+def user_buffers(rng, rows: int, artists: int, songs: int, days: int) -> list:
+    """Колонки одного пользователя в виде списков строк, как в буферах PlayColumns."""
+    song = rng.zipf(1.3, rows) % songs  # Популярные треки повторяются чаще
+    return [
+        [f"Song {i}" for i in song],
+        [f"Artist {i}" for i in song % artists],
+        [f"2026-01-{i + 1:02d}" for i in rng.integers(0, days, rows)],
+    ]
+
+
+
+def build(buffers: list, categorical: bool) -> pd.DataFrame:
+    if categorical:
+        # Как PlayColumns.to_frame(): словарь строится в C++ (pyarrow)
+        return pd.DataFrame({
+            name: pa.array(values, pa.dictionary(pa.int32(), pa.string())).to_pandas()
+            for name, values in zip(COLUMNS, buffers)
+        })
+    return pd.DataFrame(dict(zip(COLUMNS, buffers)))
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк категориальных строковых колонок")
+    parser.add_argument("--rows", type=int, default=3_000_000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--artists", type=int, default=5_000)
+    parser.add_argument("--songs", type=int, default=50_000)
+    parser.add_argument("--days", type=int, default=28)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)  # transform_df логирует каждый вызов
+
+    rng = np.random.default_rng(42)
+    per_user = args.rows // args.users
+    buffers = [user_buffers(rng, per_user, args.artists, args.songs, args.days) for _ in range(args.users)]
+
+    results = {}
+    for name, categorical in (("object", False), ("category", True)):
+        frames = [build(columns, categorical) for columns in buffers]
+        merge = concat_frames if categorical else (lambda parts: pd.concat(parts, ignore_index=True))
+        df = merge(frames)
+        assert all(isinstance(df[column].dtype, pd.CategoricalDtype) == categorical for column in COLUMNS)
+        results[name] = (
+            df[COLUMNS].memory_usage(deep=True, index=False).sum() / 2**20,
+            {
+                "build": best_ms(lambda: [build(columns, categorical) for columns in buffers], args.repeat),
+                "concat": best_ms(lambda: merge(frames), args.repeat),
+                "transform": best_ms(lambda: transform_df(df), args.repeat),
+            },
+            transform_df(df),
+        )
+
+    assert results["object"][2].equals(results["category"][2])
+    ops = list(results["object"][1])
+    print(f"Строк: {per_user * args.users} ({args.users} пользователей), артистов {args.artists}, треков {args.songs}")
+    print(f"{'формат':<10}{'память, МиБ':>13}" + "".join(f"{op + ', мс':>15}" for op in ops))
+    for name, (memory, timings, _) in results.items():
+        print(f"{name:<10}{memory:>13.1f}" + "".join(f"{timings[op]:>15.1f}" for op in ops))
+    old, new = results["object"], results["category"]
+    print(
+        f"category: память x{old[0] / new[0]:.1f} меньше; "
+        + ", ".join(f"{op} x{old[1][op] / new[1][op]:.1f}" for op in ops)
+    )
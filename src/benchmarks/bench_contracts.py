@@ -0,0 +1,139 @@
+"""
+Бенчмарк контрактов качества (Dags/quality) на больших пачках.
+
+Для каждого контракта (my_played_tracks, fav_artist) и формата (pandas,
+Arrow) измеряется:
+- full — проверка всего контракта;
+- по правилу — контракт из одной колонки с одним правилом (в сумме
+  это стоимость независимых проверок, каждая со своим переводом колонки);
+- baseline — прежняя проверка data_quality() с первым исключением
+  (только для my_played_tracks).
+
+Если full заметно меньше суммы по правилам, новые правила почти ничего
+не добавляют к стоимости: колонка переводится в Arrow один раз, а дорогая
+маска строится только при нарушении.
+
+Запуск:
+    python benchmarks/bench_contracts.py --rows 3000000 --repeat 3
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SRC_DIR, "Dags"))
+
+from quality import FAV_ARTIST_CONTRACT, PLAYS_CONTRACT, Column, Contract  # noqa: E402
+
+
+
+def build_plays(rows: int) -> pd.DataFrame:
+    """Пачка прослушиваний в формате return_dataframe() с обогащением."""
+    rng = np.random.default_rng(42)
+    played = pd.Series(pd.date_range("2020-01-01", periods=rows, freq="s", tz="UTC"))
+    artists = rng.integers(0, 2000, rows)
+    return pd.DataFrame({
+        "song_name": np.char.add("Song ", rng.integers(0, 40_000, rows).astype(str)).astype(object),
+        "artist_name": np.char.add("Artist ", artists.astype(str)).astype(object),
+        "played_at": played.astype("datetime64[ms, UTC]"),
+        "timestamp": played.dt.strftime("%Y-%m-%d"),
+        "track_id": np.char.add("track", rng.integers(0, 40_000, rows).astype(str)).astype(object),
+        "artist_id": np.char.add("artist", artists.astype(str)).astype(object),
+        "duration_ms": rng.integers(90_000, 360_000, rows),
+        "popularity": rng.integers(0, 101, rows),
+        "artist_followers": rng.integers(0, 10_000_000, rows),
+    })
+
+
+
+def build_fav_artist(plays: pd.DataFrame) -> pd.DataFrame:
+    """Агрегаты fav_artist для пачки прослушиваний (как transform_df)."""
+    grouped = plays.groupby(["timestamp", "artist_name"], as_index=False).size().rename(columns={"size": "count"})
+    grouped["ID"] = grouped["timestamp"] + "-" + grouped["artist_name"]
+    return grouped[["ID", "timestamp", "artist_name", "count"]]
+
+
+
+def to_arrow(df: pd.DataFrame) -> pa.Table:
+    """Та же пачка в формате Extractor(arrow=True): время — timestamp, строки — словарём."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for index, name in enumerate(table.column_names):
+        if name == "played_at":
+            table = table.set_column(index, name, table[name].cast(pa.timestamp("ms", tz="UTC")))
+        elif name in ("song_name", "artist_name"):
+            table = table.set_column(index, name, table[name].dictionary_encode())
+    return table
+
+
+
+def single_rules(contract: Contract) -> dict:
+    """Контракты из одного правила для каждой колонки контракта."""
+    contracts = {}
+    for column in contract.columns:
+        base = dict(name=column.name, dtype=column.dtype, optional=column.optional)
+        variants = {"type": {}}
+        if not column.nullable:
+            variants["null"] = {"nullable": False}
+        if column.unique:
+            variants["duplicate"] = {"unique": True}
+        if column.min is not None or column.max is not None:
+            variants["range"] = {"min": column.min, "max": column.max}
+        if column.pattern is not None:
+            variants["pattern"] = {"pattern": column.pattern}
+        for rule, options in variants.items():
+            contracts[f"{rule}_{column.name}"] = Contract(contract.table, [Column(**base, **options)])
+    return contracts
+
+
+
+def best_ms(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+
+def baseline(df: pd.DataFrame) -> None:
+    """Прежняя data_quality(): три правила, остановка на первом нарушении."""
+    if df.empty:
+        raise ValueError("DataFrame пуст")
+    if not df["played_at"].is_unique:
+        raise ValueError("Обнаружены дубликаты в колонке 'played_at'")
+    if df[["song_name", "artist_name", "played_at", "timestamp"]].isnull().values.any():
+        raise ValueError("Обнаружены NULL-значения")
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк контрактов качества")
+    parser.add_argument("--rows", type=int, default=3_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    plays = build_plays(args.rows)
+    tables = {
+        "my_played_tracks": (PLAYS_CONTRACT, plays),
+        "fav_artist": (FAV_ARTIST_CONTRACT, build_fav_artist(plays)),
+    }
+
+    for table, (contract, df) in tables.items():
+        for fmt, data in (("pandas", df), ("arrow", to_arrow(df))):
+            report = contract.check(data)
+            assert report.ok, report
+            full = best_ms(lambda: contract.check(data), args.repeat)
+            rules = {rule: best_ms(lambda c=c: c.check(data), args.repeat) for rule, c in single_rules(contract).items()}
+            line = f"{table} [{fmt}], строк {len(df)}: full {full:.0f} мс, сумма по правилам {sum(rules.values()):.0f} мс"
+            if table == "my_played_tracks" and fmt == "pandas":
+                line += f", baseline {best_ms(lambda: baseline(df), args.repeat):.0f} мс"
+            print(line)
+            slowest = sorted(rules.items(), key=lambda item: -item[1])[:5]
+            print("    самые дорогие правила: " + ", ".join(f"{rule} {ms:.0f}" for rule, ms in slowest))
@@ -0,0 +1,116 @@
+"""
+Бенчмарк разбора ответов recently-played: стоимость на 10 000 элементов.
+
+Сравниваются:
+- baseline — json.loads и обход вложенных словарей с try/except на каждый
+  элемент, как в прежнем return_dataframe();
+- typed — msgspec-декодирование в структуры decoding и колоночные буферы
+  (с track_id и artist_id: шесть колонок против четырёх у baseline).
+
+Пик памяти считает tracemalloc, то есть только объекты Python (буферы
+pyarrow в него не входят).
+
+Данные — синтетические страницы мок-сервера (mock_spotify_api), по 50
+элементов, как отдаёт API.
+
+Запуск:
+    python benchmarks/bench_decoding.py --items 10000 --repeat 5
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SRC_DIR)
+sys.path.insert(0, os.path.join(SRC_DIR, "Dags"))
+
+from decoding import PlayColumns, decode_page, item_fields  # noqa: E402
+from mock_spotify_api import MockCatalog, MockConfig  # noqa: E402
+
+PAGE_SIZE = 50
+
+
+
+def build_pages(items: int) -> list:
+    """Готовит тела ответов (bytes) с заданным общим числом элементов."""
+    catalog = MockCatalog(MockConfig(plays_per_user=items))
+    history = catalog.history("bench-user")
+    pages = []
+    for start in range(0, len(history), PAGE_SIZE):
+        body = {"items": [catalog.play_item(*play) for play in history[start:start + PAGE_SIZE]], "next": None}
+        pages.append(json.dumps(body, indent=2).encode("utf-8"))  # API отдаёт JSON с отступами
+    return pages
+
+
+
+def parse_baseline(pages: list) -> pd.DataFrame:
+    song_names, artist_names, played_at_list, timestamps = [], [], [], []
+    for raw in pages:
+        data = json.loads(raw)
+        for item in data.get("items", []):
+            try:
+                song_names.append(item["track"]["name"])
+                artist_names.append(item["track"]["album"]["artists"][0]["name"])
+                played_at = item["played_at"]
+                played_at_list.append(played_at)
+                timestamps.append(played_at[:10])
+            except KeyError:
+                pass
+    return pd.DataFrame({
+        "song_name": song_names,
+        "artist_name": artist_names,
+        "played_at": played_at_list,
+        "timestamp": timestamps,
+    })
+
+
+
+def parse_typed(pages: list) -> pd.DataFrame:
+    columns = PlayColumns()
+    for raw in pages:
+        for item in decode_page(raw).items or ():
+            fields = item_fields(item)
+            if fields is not None:
+                columns.append(*fields)
+    return columns.to_frame()
+
+
+
+def measure(func, pages: list, repeat: int) -> tuple:
+    """Возвращает (лучшее время в секундах, пик памяти в байтах, число строк)."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        df = func(pages)
+        best = min(best, time.perf_counter() - started)
+
+    tracemalloc.start()
+    func(pages)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, len(df)
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк разбора recently-played")
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    pages = build_pages(args.items)
+    results = {name: measure(func, pages, args.repeat) for name, func in
+               [("baseline", parse_baseline), ("typed", parse_typed)]}
+
+    print(f"Страниц: {len(pages)}, байт: {sum(map(len, pages))}")
+    for name, (seconds, peak, rows) in results.items():
+        per_10k = seconds / rows * 10_000 * 1000
+        print(f"{name:>8}: {per_10k:8.2f} мс на 10k элементов, пик памяти {peak / 2**20:6.2f} МиБ, строк {rows}")
+    speedup = results["baseline"][0] / results["typed"][0]
+    print(f"Ускорение: x{speedup:.1f}")
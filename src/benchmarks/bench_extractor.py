@@ -0,0 +1,93 @@
+"""
+Бенчмарк движка извлечения (Dags/extractor) на всех источниках.
+
+Одна и та же история прослушиваний извлекается:
+- mock — из локального мока API (пул соединений, пагинация по курсорам,
+  архивирование ответов — как при живом запуске);
+- archive — из архива сырых ответов, записанного на первом шаге;
+- export — из файла выгрузки данных аккаунта с теми же записями.
+
+Все источники проходят один путь разбора и нарезки на пачки, поэтому
+разница во времени — это стоимость самого источника (сеть, диск, формат).
+
+Запуск:
+    python benchmarks/bench_extractor.py --items 20000 --latency-ms 5
+
+По умолчанию ограничитель частоты клиента поднят до 1000 запросов/с, иначе
+время mock — это время ожидания ограничителя (--rate-limit 10 — как в DAG).
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SRC_DIR)
+sys.path.insert(0, os.path.join(SRC_DIR, "Dags"))
+
+from extractor import ArchiveSource, Extractor, ExportSource, MockSource  # noqa: E402
+from mock_spotify_api import MockConfig, start_server  # noqa: E402
+
+USER_ID = "bench-user"
+
+
+
+def write_export(df, path: str) -> None:
+    """Сохраняет записи в формате расширенной выгрузки (endsong_*.json)."""
+    timestamps = df["played_at"].dt.strftime("%Y-%m-%dT%H:%M:%S.%f").str[:-3] + "Z"  # Как ts в выгрузке
+    records = [
+        {
+            "ts": played_at,
+            "master_metadata_track_name": song,
+            "master_metadata_album_artist_name": artist,
+            "spotify_track_uri": f"spotify:track:{track_id}" if track_id else None,
+        }
+        for song, artist, played_at, track_id in zip(df["song_name"], df["artist_name"], timestamps, df["track_id"])
+    ]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(records, f)
+
+
+
+def run(extractor: Extractor) -> dict:
+    """Извлекает все записи источника и возвращает счётчики движка."""
+    extractor.collect()
+    return extractor.stats()
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк движка извлечения")
+    parser.add_argument("--items", type=int, default=20_000)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--rate-limit", default="1000", help="SPOTIFY_RATE_LIMIT клиента, запросов в секунду")
+    args = parser.parse_args()
+
+    # Ограничитель частоты читается при импорте spotify_client (внутри MockSource)
+    os.environ["SPOTIFY_RATE_LIMIT"] = args.rate_limit
+
+    workdir = tempfile.mkdtemp(prefix="bench-extractor-")
+    os.environ["SPOTIFY_ARCHIVE_DIR"] = os.path.join(workdir, "archive")
+    os.environ["SPOTIFY_RATE_LIMIT_FILE"] = os.path.join(workdir, "rate_limit.bin")  # Не делить квоту с DAG
+    server = start_server(MockConfig(plays_per_user=args.items, latency_ms=args.latency_ms))
+
+    try:
+        mock = Extractor(MockSource(server.base_url, USER_ID, archive=True), enrich_tracks=False, enrich_artists=False)
+        df = mock.collect()
+        results = [mock.stats()]
+        requests_stats = mock.source.client.stats()
+    finally:
+        server.shutdown()
+
+    export_path = os.path.join(workdir, "endsong_0.json")
+    write_export(df, export_path)
+    results.append(run(Extractor(ArchiveSource(user_id=USER_ID))))
+    results.append(run(Extractor(ExportSource(export_path))))
+
+    print(f"Записей: {len(df)}, каталог: {workdir}")
+    print(f"{'источник':<10}{'страниц':>9}{'строк':>9}{'секунд':>9}{'строк/с':>10}")
+    for stats in results:
+        print(f"{stats['source']:<10}{stats['pages']:>9}{stats['rows']:>9}{stats['seconds']:>9.3f}{stats['rows_per_second']:>10}")
+    print(f"Клиент (mock): {requests_stats}")
@@ -0,0 +1,102 @@
+"""
+Бенчмарк времени импорта модулей, которые загружает планировщик Airflow.
+
+Каждый замер — отдельный процесс python -X importtime без учётных данных
+Spotify в окружении (импорт не должен падать). Сравниваются:
+- lazy — импорт модуля как есть (pandas, requests и сетевые модули
+  пайплайна отложены до вызова функций);
+- eager — тот же импорт плюс всё, что раньше загружалось на верхнем уровне
+  (столько стоил импорт до переноса зависимостей внутрь функций и столько
+  задача по-прежнему платит при запуске).
+
+Запуск:
+    python benchmarks/bench_import.py --repeat 7
+
+Время указано без импортов, которые выполняет сам интерпретатор при старте.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DAGS_DIR = os.path.join(SRC_DIR, "Dags")
+
+ETL_DEPS = "import pandas, requests, dotenv, auth, circuit_breaker, enrichment, spotify_client"
+HEAVY_MODULES = ("pandas", "requests", "sqlalchemy", "dotenv")
+# Модуль -> (импорт, что раньше загружалось вместе с ним)
+TARGETS = {
+    "spotify_etl": ("import spotify_etl", ETL_DEPS),
+    "spotify_data_extractor": ("import spotify_data_extractor", ETL_DEPS),
+    "db (DDL для DAG)": ("import db", "import pandas, sqlalchemy"),
+}
+
+
+
+def clean_env() -> dict:
+    """Окружение без учётных данных Spotify и с путями к модулям пайплайна."""
+    env = {key: value for key, value in os.environ.items() if not key.startswith("SPOTIFY_")}
+    env["PYTHONPATH"] = os.pathsep.join([DAGS_DIR, SRC_DIR])
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    return env
+
+
+
+def import_ms(code: str) -> float:
+    """
+    Запускает code в новом процессе и возвращает суммарное время импорта.
+
+    Args:
+        code (str): Код с инструкциями import.
+
+    Returns:
+        float: Сумма cumulative-времени импортов верхнего уровня, миллисекунды
+            (включая модули, которые загружает сам интерпретатор при старте).
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=DAGS_DIR, env=clean_env(), capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Импорт завершился ошибкой:\n{result.stderr[-2000:]}")
+
+    total_us = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name.startswith("  "):  # Отступ имени — вложенный импорт
+            total_us += int(cumulative)
+    return total_us / 1000
+
+
+
+def loaded_heavy(code: str) -> list:
+    """Возвращает тяжёлые модули, оказавшиеся в sys.modules после code."""
+    probe = f"{code}\nimport sys\nprint(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", probe], cwd=DAGS_DIR, env=clean_env(), capture_output=True, text=True)
+    return [name for name in result.stdout.strip().split(",") if name]
+
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Время импорта модулей пайплайна")
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    # Импорты самого интерпретатора (encodings, site, ...) вычитаются из всех замеров
+    startup = statistics.median(import_ms("pass") for _ in range(args.repeat))
+
+    print(f"{'модуль':<26}{'lazy, мс':>10}{'eager, мс':>11}{'ускорение':>11}  загружено при импорте")
+    for name, (code, deps) in TARGETS.items():
+        lazy = statistics.median(import_ms(code) for _ in range(args.repeat)) - startup
+        eager = statistics.median(import_ms(f"{code}; {deps}") for _ in range(args.repeat)) - startup
+        heavy = ", ".join(loaded_heavy(code)) or "-"
+        print(f"{name:<26}{lazy:>10.1f}{eager:>11.1f}{eager / lazy:>10.1f}x  {heavy}")
+
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Бенчмарк индекса загруженных ключей (Dags/key_index).
+
+Индекс из --keys загруженных прослушиваний проверяет пачку из --batch строк,
+из которых --overlap уже загружены. Сравнение с очевидной альтернативой —
+множеством строк played_at в памяти процесса:
+- память индекса;
+- время загрузки индекса с диска;
+- время проверки пачки (DataFrame со строками и таблица Arrow с timestamp);
+- время добавления пачки в индекс и записи на диск.
+
+Запуск:
+    python benchmarks/bench_key_index.py --keys 5000000 --batch 50000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SRC_DIR, "Dags"))
+
+from key_index import KeyIndex  # noqa: E402
+
+START_MS = 1_577_836_800_000  # 2020-01-01
+
+
+
+def best_ms(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+
+def iso(keys: np.ndarray) -> np.ndarray:
+    """played_at в формате API (2020-01-01T00:00:00.000Z)."""
+    return np.char.add(np.datetime_as_string(keys.astype("datetime64[ms]"), unit="ms"), "Z").astype(object)
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк индекса загруженных ключей")
+    parser.add_argument("--keys", type=int, default=5_000_000)
+    parser.add_argument("--batch", type=int, default=50_000)
+    parser.add_argument("--overlap", type=float, default=0.1, help="Доля уже загруженных строк пачки")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ["SPOTIFY_KEY_INDEX_DIR"] = tempfile.mkdtemp(prefix="bench-keys-")
+    os.environ["SPOTIFY_USER_ID"] = "bench"  # Индекс ведётся только для владельца таблицы
+    rng = np.random.default_rng(42)
+    loaded = START_MS + np.cumsum(rng.integers(60_000, 600_000, args.keys))
+    old = rng.choice(loaded, int(args.batch * args.overlap), replace=False)
+    new = loaded[-1] + np.cumsum(rng.integers(60_000, 600_000, args.batch - len(old)))
+    batch_keys = np.concatenate([old, new])
+
+    df = pd.DataFrame({"played_at": iso(batch_keys)})
+    table = pa.table({"played_at": pa.array(batch_keys, pa.timestamp("ms", tz="UTC"))})
+
+    index = KeyIndex("bench", loaded)
+    index.save()
+    strings = set(iso(loaded))
+
+    expected = args.batch - len(old)
+    assert len(index.filter_new(df)) == len(index.filter_new(table)) == expected
+
+    set_ms = best_ms(lambda: df[~df["played_at"].isin(strings)], args.repeat)
+    load_ms = best_ms(lambda: KeyIndex.load("bench"), args.repeat)
+    frame_ms = best_ms(lambda: index.filter_new(df), args.repeat)
+    arrow_ms = best_ms(lambda: index.filter_new(table), args.repeat)
+
+    def add_and_save():
+        KeyIndex("bench", loaded).add(batch_keys[len(old):])
+        index.save()
+
+    save_ms = best_ms(add_and_save, args.repeat)
+    set_bytes = sys.getsizeof(strings) + sum(sys.getsizeof(value) for value in strings)
+
+    print(f"Ключей в индексе: {args.keys}, пачка: {args.batch} (уже загружено {len(old)})")
+    print(f"память: индекс {index.keys.nbytes / 2**20:.1f} МиБ, множество строк {set_bytes / 2**20:.1f} МиБ")
+    print(f"загрузка индекса с диска: {load_ms:.1f} мс")
+    print(
+        f"проверка пачки: DataFrame {frame_ms:.1f} мс, Arrow {arrow_ms:.1f} мс, "
+        f"множество строк (isin) {set_ms:.1f} мс"
+    )
+    print(f"добавление пачки и запись индекса: {save_ms:.1f} мс")
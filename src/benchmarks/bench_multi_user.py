@@ -0,0 +1,77 @@
+"""
+Бенчмарк многопользовательского извлечения (Dags/multi_user_extractor).
+
+Для roster из --users пользователей история каждого извлекается с мока API
+(mock_spotify_api) с задержкой ответа --latency-ms:
+- serial — пользователи по очереди (время по первым --sample пользователям,
+  пересчитанное на весь roster);
+- pool — fetch_all_users() с --concurrency потоками на общем пуле соединений.
+
+Запуск:
+    python benchmarks/bench_multi_user.py --users 1000 --latency-ms 100 --concurrency 64
+
+Ограничитель частоты клиента поднят до 100000 запросов/с, а пул соединений —
+до --concurrency, иначе время — это ожидание ограничителя или свободного
+соединения.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SRC_DIR)
+sys.path.insert(0, os.path.join(SRC_DIR, "Dags"))
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк многопользовательского извлечения")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--plays", type=int, default=50, help="Прослушиваний у пользователя (50 — одна страница)")
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--sample", type=int, default=20)
+    args = parser.parse_args()
+
+    # Настройки клиента читаются при импорте spotify_client
+    workdir = tempfile.mkdtemp(prefix="bench-multi-user-")
+    os.environ.update({
+        "SPOTIFY_RATE_LIMIT": "100000",
+        "SPOTIFY_RATE_BURST": "100000",
+        "SPOTIFY_POOL_MAXSIZE": str(args.concurrency),
+        "SPOTIFY_RATE_LIMIT_FILE": os.path.join(workdir, "rate_limit.bin"),
+        "SPOTIFY_STATE_FILE": os.path.join(workdir, "watermarks.json"),
+        "SPOTIFY_METRICS_DIR": os.path.join(workdir, "metrics"),
+        "SPOTIFY_ARCHIVE_ENABLED": "0",
+        "SPOTIFY_ENRICH_TRACKS": "0",
+        "SPOTIFY_ENRICH_ARTISTS": "0",
+    })
+
+    import spotify_client  # noqa: E402
+    from mock_spotify_api import MockConfig, start_server  # noqa: E402
+    from multi_user_extractor import fetch_all_users  # noqa: E402
+    from spotify_etl import return_dataframe  # noqa: E402
+
+    server = start_server(MockConfig(plays_per_user=args.plays, latency_ms=args.latency_ms))
+    spotify_client._client = spotify_client.SpotifyClient(base_url=server.base_url)
+    roster = [(f"user{number}", f"user{number}") for number in range(args.users)]
+
+    try:
+        started = time.perf_counter()
+        for user_id, token in roster[:args.sample]:
+            return_dataframe(user_id, token, False)
+        serial = (time.perf_counter() - started) / args.sample * args.users
+
+        started = time.perf_counter()
+        frames = fetch_all_users(roster, args.concurrency)
+        pool = time.perf_counter() - started
+    finally:
+        server.shutdown()
+
+    rows = sum(len(df) for df in frames.values())
+    print(f"Пользователей: {len(frames)} из {args.users}, строк: {rows}, задержка {args.latency_ms:.0f} мс")
+    print(f"serial: {serial:8.2f} с (оценка по {args.sample} пользователям)")
+    print(f"  pool: {pool:8.2f} с (concurrency={args.concurrency}), x{serial / pool:.0f}")
@@ -0,0 +1,99 @@
+"""
+Бенчмарк представления played_at: строка ISO 8601 против Unix-времени в мс.
+
+Одна и та же колонка из --rows прослушиваний хранится как object-строки
+(прежний формат return_dataframe()) и как datetime64[ms, UTC] (int64 внутри,
+текущий формат). Для каждого представления измеряется:
+- память колонки;
+- parse — разбор строк при извлечении (только для нового формата, один раз);
+- unique — проверка уникальности (первичный ключ, правило duplicate_played_at);
+- sort — сортировка;
+- max — самое позднее время (отметка последней загрузки);
+- date — дата прослушивания (колонка timestamp; раньше played_at[:10]);
+- window — отбор полуинтервала времени (окна backfill).
+
+Запуск:
+    python benchmarks/bench_played_at.py --rows 3000000 --repeat 3
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SRC_DIR, "Dags"))
+
+from decoding import parse_played_at  # noqa: E402
+
+START_MS = 1_577_836_800_000  # 2020-01-01
+
+
+
+def best_ms(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+
+def operations(column: pd.Series, lower, upper) -> dict:
+    """Операции пайплайна над колонкой played_at в данном представлении."""
+    text = column.dtype == object
+    return {
+        "unique": lambda: column.is_unique,
+        "sort": lambda: column.sort_values(),
+        "max": lambda: column.max(),
+        # Новый формат — как в decoding.PlayColumns.to_frame(): дата из int64 в C++ (pyarrow)
+        "date": (lambda: column.str[:10]) if text else (
+            lambda: pa.Array.from_pandas(column).cast(pa.date32()).cast(pa.string()).to_pandas()
+        ),
+        "window": lambda: column[(column >= lower) & (column < upper)],
+    }
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бенчмарк представления played_at")
+    parser.add_argument("--rows", type=int, default=3_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    stamps = START_MS + np.cumsum(rng.integers(60_000, 600_000, args.rows))
+    rng.shuffle(stamps)  # Пачки нескольких пользователей не упорядочены по времени
+    strings = pd.Series(
+        np.char.add(np.datetime_as_string(stamps.astype("datetime64[ms]"), unit="ms"), "Z").astype(object)
+    )
+    values = strings.tolist()
+
+    parse = best_ms(lambda: parse_played_at(values), args.repeat)
+    typed = parse_played_at(values).to_pandas()
+    middle = np.sort(stamps)[[args.rows // 4, args.rows // 2]]
+    bounds = {
+        "строка": [strings.sort_values().iloc[args.rows // 4], strings.sort_values().iloc[args.rows // 2]],
+        "int64 (мс)": [pd.Timestamp(int(ms), unit="ms", tz="UTC") for ms in middle],
+    }
+
+    results = {}
+    for name, column in (("строка", strings), ("int64 (мс)", typed)):
+        timings = {op: best_ms(func, args.repeat) for op, func in operations(column, *bounds[name]).items()}
+        results[name] = (column.memory_usage(deep=True) / 2**20, timings)
+
+    ops = list(results["строка"][1])
+    print(f"Строк: {args.rows}, разбор строк в int64 при извлечении: {parse:.0f} мс")
+    print(f"{'формат':<12}{'память, МиБ':>13}" + "".join(f"{op + ', мс':>12}" for op in ops))
+    for name, (memory, timings) in results.items():
+        print(f"{name:<12}{memory:>13.1f}" + "".join(f"{timings[op]:>12.1f}" for op in ops))
+    old, new = results["строка"], results["int64 (мс)"]
+    print(
+        f"int64: память x{old[0] / new[0]:.1f} меньше; "
+        + ", ".join(f"{op} x{old[1][op] / new[1][op]:.1f}" for op in ops)
+    )
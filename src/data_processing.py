@@ -1,4 +1,5 @@
 from spotify_data_extractor import get_recently_played_tracks
+from quality import check_quality  # Каталог Dags добавлен в sys.path модулем spotify_data_extractor
 import pandas as pd
 
 
@@ -7,6 +8,10 @@ def Data_Quality(load_df):
     """
     Проверяет качество входного DataFrame перед обработкой.
 
+    Правила задаёт контракт таблицы my_played_tracks (см. Dags/quality):
+    все проверяются за один проход, в сообщении исключения — число нарушений
+    по каждому правилу. ID трека и артиста могут быть пустыми (локальные файлы).
+
     Параметры:
         load_df (pd.DataFrame): входной DataFrame с данными о прослушиваниях.
 
@@ -14,19 +19,20 @@ def Data_Quality(load_df):
         bool: True, если данные корректны; False, если DataFrame пуст.
 
     Исключения:
-        Exception: если обнаружены дубликаты по первичному ключу или NULL-значения.
+        Exception: если обнаружены дубликаты по первичному ключу или другие нарушения контракта.
     """
-    if load_df.empty:
+    # Те же правила, что у DAG (контракт PLAYS_CONTRACT)
+    report = check_quality(load_df)
+    if report.empty:
         print('No Songs Extracted')
         return False
 
-    if pd.Series(load_df['played_at']).is_unique:
-        pass
-    else:
-        raise Exception("Primary Key Exception, Data Might Contain duplicates")
+    counts = report.counts()
+    if "duplicate_played_at" in counts:
+        raise Exception(f"Primary Key Exception, Data Might Contain duplicates: {counts}")
 
-    if load_df.isnull().values.any():
-        raise Exception("Null values found")
+    if counts:
+        raise Exception(f"Data contract violated: {counts}")
 
     return True
 
@@ -47,14 +53,18 @@ def Transform_df(load_df):
             - artist_name;
             - count (количество прослушиваний).
     """
-    # Группировка по 'timestamp' и 'artist_name', подсчёт количества записей
-    Transformed_df = load_df.groupby(['timestamp', 'artist_name'], as_index=False).count()
+    # Группировка по 'timestamp' и 'artist_name', подсчёт количества записей.
+    # Колонки категориальные: группировка по кодам, observed=True — только встретившиеся пары
+    Transformed_df = load_df.groupby(['timestamp', 'artist_name'], as_index=False, observed=True).count()
 
     # Переименование столбца 'played_at' в 'count' (количество прослушиваний)
     Transformed_df.rename(columns={'played_at': 'count'}, inplace=True)
 
+    # Агрегатов немного: ключи возвращаются строками
+    Transformed_df = Transformed_df.astype({'timestamp': str, 'artist_name': str})
+
     # Создание уникального ID на основе 'timestamp' и 'artist_name'
-    Transformed_df["ID"] = Transformed_df['timestamp'].astype(str) + "-" + Transformed_df["artist_name"]
+    Transformed_df["ID"] = Transformed_df['timestamp'] + "-" + Transformed_df["artist_name"]
 
     # Возврат только необходимых столбцов
     return Transformed_df[['ID', 'timestamp', 'artist_name', 'count']]
@@ -4,6 +4,12 @@ import logging
 from datetime import datetime
 from dotenv import load_dotenv
 import os
+import sys
+
+# Индекс загруженных ключей и отметки загрузки лежат рядом с DAG
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "Dags"))
+from key_index import drop_key_indexes
+from watermark import drop_watermarks
 
 load_dotenv()
 
@@ -105,6 +111,12 @@ def main():
     # Удаляем таблицы
     drop_tables(engine, TABLES_TO_DROP)
 
+    # Индекс ключей и отметки загрузки описывают удалённую my_played_tracks
+    if 'my_played_tracks' in TABLES_TO_DROP:
+        logger.info(f"Удалено индексов загруженных ключей: {drop_key_indexes()}")
+        if drop_watermarks():
+            logger.info("Отметки загрузки удалены: следующий запуск извлечёт историю заново")
+
     logger.info("Скрипт завершён.")
 
 
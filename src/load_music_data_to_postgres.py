@@ -1,4 +1,5 @@
 import os
+import sys
 import pandas as pd
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
@@ -6,6 +7,11 @@ from dotenv import load_dotenv
 import Extract
 import Transform
 
+# Схема таблиц (DDL) и индекс загруженных ключей — общие с DAG
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "Dags"))
+from db import create_tables, upsert_fav_artist, upsert_plays
+from key_index import KeyIndex
+
 
 load_dotenv()
 
@@ -30,70 +36,32 @@ def get_db_engine():
 
 
 
-def create_tables(engine):
-    """
-    Создаёт таблицы в БД, если их ещё нет.
-
-    Параметры:
-        engine (sqlalchemy.engine.Engine): Движок SQLAlchemy.
-    """
-    with engine.connect() as conn:
-        # Таблица для прослушанных треков
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS my_played_tracks (
-                song_name VARCHAR(200),
-                artist_name VARCHAR(200),
-                played_at VARCHAR(200),
-                timestamp VARCHAR(200),
-                CONSTRAINT primary_key_constraint PRIMARY KEY (played_at)
-            );
-            """
-        )
-
-        # Таблица для любимых артистов
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS fav_artist (
-                timestamp VARCHAR(200),
-                ID VARCHAR(200),
-                artist_name VARCHAR(200),
-                count VARCHAR(200),
-                CONSTRAINT primary_key_constraint PRIMARY KEY (ID)
-            );
-            """
-        )
-        print("Таблицы созданы (если не существовали).")
-
-
-
 def load_data_to_db(engine, load_df, transformed_df):
     """
     Загружает данные в таблицы БД, избегая дубликатов.
 
+    Уже загруженные прослушивания отсеиваются по индексу ключей (см. Dags/key_index)
+    до обращения к БД; повторы, которых индекс не знает, пропускает первичный
+    ключ (загрузка через db.upsert_plays() и db.upsert_fav_artist()).
+
     Параметры:
         engine (sqlalchemy.engine.Engine): Движок SQLAlchemy.
         load_df (pd.DataFrame): Данные о прослушанных треках.
         transformed_df (pd.DataFrame): Трансформированные данные о любимых артистах.
     """
+    index = KeyIndex.load(os.getenv("SPOTIFY_USER_ID"), engine)
+    load_df = index.filter_new(load_df)
+
     try:
-        load_df.to_sql(
-            "my_played_tracks",
-            engine,
-            index=False,
-            if_exists="append"
-        )
-        print("Данные загружены в таблицу my_played_tracks.")
+        inserted = upsert_plays(engine, load_df)
+        index.add(load_df)
+        index.save()
+        print(f"Данные загружены в таблицу my_played_tracks: {inserted} новых строк.")
     except Exception as e:
         print(f"Ошибка при загрузке в my_played_tracks: {e}")
 
     try:
-        transformed_df.to_sql(
-            "fav_artist",
-            engine,
-            index=False,
-            if_exists="append"
-        )
+        upsert_fav_artist(engine, transformed_df)
         print("Данные загружены в таблицу fav_artist.")
     except Exception as e:
         print(f"Ошибка при загрузке в fav_artist: {e}")
@@ -118,7 +86,8 @@ if __name__ == "__main__":
         # 4. Подключение к БД и создание таблиц
         print("Подключение к БД...")
         engine = get_db_engine()
-        create_tables(engine)
+        create_tables(engine)  # Та же схема, что у DAG (Dags/db.py)
+        print("Таблицы созданы (если не существовали).")
 
         # 5. Загрузка данных в БД
         print("Загрузка данных в БД...")
@@ -0,0 +1,415 @@
+"""
+Локальная замена Spotify Web API для нагрузочного тестирования и замеров задержек.
+
+Сервер отдаёт синтетические данные для эндпоинтов:
+- GET /v1/me/player/recently-played — история пользователя с курсорной пагинацией;
+- GET /v1/tracks?ids=... и /v1/tracks/<id> — метаданные треков;
+- GET /v1/artists?ids=... и /v1/artists/<id> — метаданные артистов;
+- POST /api/token — обновление токена (grant_type=refresh_token).
+
+Пользователь определяется по токену из заголовка Authorization, история
+каждого пользователя детерминирована (зависит от seed и токена). Артисты
+в истории распределены по закону Ципфа, как в реальном прослушивании.
+Задержка, доля ответов 429 (с Retry-After) и 5xx задаются параметрами.
+
+Запуск:
+    python mock_spotify_api.py --port 8765 --latency-ms 80 --rate-limit-ratio 0.01
+
+Экстракторы направляются на мок переменными окружения:
+    SPOTIFY_API_BASE_URL=http://127.0.0.1:8765/v1
+    SPOTIFY_TOKEN_URL=http://127.0.0.1:8765/api/token
+
+Мок выдаёт access-токен, равный refresh-токену, поэтому история
+пользователя не меняется при обновлении токена.
+"""
+
+import argparse
+import bisect
+import json
+import logging
+import random
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import accumulate
+from typing import Optional
+from urllib.parse import parse_qs, urlencode, urlparse
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+logger = logging.getLogger(__name__)
+
+RECENTLY_PLAYED_PATH = "/v1/me/player/recently-played"
+TOKEN_PATH = "/api/token"
+MAX_LIMIT = 50
+MAX_IDS = 50
+GENRES = ["pop", "rock", "indie", "hip hop", "jazz", "electronic", "metal", "folk", "r&b", "classical"]
+
+
+
+class MockConfig:
+    """
+    Параметры синтетических данных и внедряемых сбоев.
+
+    Args:
+        seed (int): Зерно генератора данных.
+        artists (int): Размер каталога артистов.
+        tracks_per_artist (int): Треков у каждого артиста.
+        plays_per_user (int): Длина истории одного пользователя.
+        history_hours (float): Период, на который растянута история.
+        zipf_s (float): Показатель распределения Ципфа по артистам.
+        latency_ms (float): Средняя задержка ответа.
+        latency_jitter_ms (float): Разброс задержки (равномерный, ±).
+        rate_limit_ratio (float): Доля запросов, получающих 429.
+        retry_after (int): Значение Retry-After для ответов 429, в секундах.
+        error_ratio (float): Доля запросов, получающих 5xx.
+        token_ttl (int): expires_in выдаваемых access-токенов, в секундах.
+    """
+
+    def __init__(
+        self,
+        seed: int = 42,
+        artists: int = 2000,
+        tracks_per_artist: int = 20,
+        plays_per_user: int = 200,
+        history_hours: float = 24,
+        zipf_s: float = 1.1,
+        latency_ms: float = 0,
+        latency_jitter_ms: float = 0,
+        rate_limit_ratio: float = 0,
+        retry_after: int = 1,
+        error_ratio: float = 0,
+        token_ttl: int = 3600,
+    ):
+        self.seed = seed
+        self.artists = artists
+        self.tracks_per_artist = tracks_per_artist
+        self.plays_per_user = plays_per_user
+        self.history_hours = history_hours
+        self.zipf_s = zipf_s
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.error_ratio = error_ratio
+        self.token_ttl = token_ttl
+
+
+
+class MockCatalog:
+    """
+    Синтетический каталог и истории прослушиваний пользователей.
+
+    Args:
+        config (MockConfig): Параметры генерации.
+    """
+
+    def __init__(self, config: MockConfig):
+        self.config = config
+        self.now = datetime.now(timezone.utc)
+        weights = [1 / (rank ** config.zipf_s) for rank in range(1, config.artists + 1)]
+        self._cum_weights = list(accumulate(weights))
+        self.history = lru_cache(maxsize=4096)(self._build_history)
+
+    def artist(self, index: int) -> dict:
+        """Возвращает объект артиста по номеру в каталоге."""
+        rng = random.Random(self.config.seed * 7919 + index)
+        return {
+            "id": f"artist{index:06d}",
+            "name": f"Artist {index}",
+            "type": "artist",
+            "genres": rng.sample(GENRES, k=rng.randint(1, 3)),
+            "popularity": max(1, 100 - index // 20),
+            "followers": {"href": None, "total": int(1e6 / (index + 1))},
+        }
+
+    def track(self, artist_index: int, number: int) -> dict:
+        """Возвращает объект трека по номеру артиста и номеру трека."""
+        rng = random.Random(self.config.seed * 104729 + artist_index * 1000 + number)
+        artist_ref = {"id": f"artist{artist_index:06d}", "name": f"Artist {artist_index}", "type": "artist"}
+        return {
+            "id": f"track{artist_index:06d}{number:03d}",
+            "name": f"Song {artist_index}-{number}",
+            "type": "track",
+            "duration_ms": rng.randint(90_000, 360_000),
+            "popularity": rng.randint(0, 100),
+            "explicit": rng.random() < 0.1,
+            "album": {
+                "id": f"album{artist_index:06d}{number // 10:02d}",
+                "name": f"Album {artist_index}-{number // 10}",
+                "artists": [artist_ref],
+            },
+            "artists": [artist_ref],
+        }
+
+    def parse_track_id(self, track_id: str) -> Optional[tuple]:
+        """Разбирает синтетический ID трека; None для неизвестных ID."""
+        if not track_id.startswith("track") or len(track_id) != 14 or not track_id[5:].isdigit():
+            return None
+        artist_index, number = int(track_id[5:11]), int(track_id[11:])
+        if artist_index >= self.config.artists or number >= self.config.tracks_per_artist:
+            return None
+        return artist_index, number
+
+    def parse_artist_id(self, artist_id: str) -> Optional[int]:
+        """Разбирает синтетический ID артиста; None для неизвестных ID."""
+        if not artist_id.startswith("artist") or not artist_id[6:].isdigit():
+            return None
+        index = int(artist_id[6:])
+        return index if index < self.config.artists else None
+
+    def _build_history(self, user: str) -> list:
+        """
+        Строит историю пользователя: список (played_at_ms, artist, track) от новых к старым.
+        """
+        rng = random.Random(self.config.seed ^ zlib.crc32(user.encode("utf-8")))
+        span_ms = int(self.config.history_hours * 3600 * 1000)
+        end_ms = int(self.now.timestamp() * 1000)
+        stamps = sorted({end_ms - rng.randrange(span_ms) for _ in range(self.config.plays_per_user)}, reverse=True)
+
+        history = []
+        for stamp in stamps:
+            artist_index = bisect.bisect_left(self._cum_weights, rng.random() * self._cum_weights[-1])
+            history.append((stamp, artist_index, rng.randrange(self.config.tracks_per_artist)))
+        return history
+
+    def play_item(self, stamp: int, artist_index: int, number: int) -> dict:
+        """Возвращает элемент recently-played."""
+        played_at = datetime.fromtimestamp(stamp / 1000, tz=timezone.utc)
+        return {
+            "track": self.track(artist_index, number),
+            "played_at": played_at.strftime("%Y-%m-%dT%H:%M:%S.") + f"{played_at.microsecond // 1000:03d}Z",
+            "context": None,
+        }
+
+
+
+class MockSpotifyHandler(BaseHTTPRequestHandler):
+    """Обработчик запросов мок-сервера (HTTP/1.1, keep-alive)."""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # Заголовки и тело пишутся отдельно: без TCP_NODELAY +40 мс на ответ
+
+    def log_message(self, format, *args):
+        pass  # Логирование каждого запроса искажает замеры
+
+    def do_GET(self):
+        server = self.server
+        server.count("requests")
+        config = server.catalog.config
+
+        # Внедряемая задержка
+        if config.latency_ms or config.latency_jitter_ms:
+            delay = config.latency_ms + server.rng_uniform(-config.latency_jitter_ms, config.latency_jitter_ms)
+            time.sleep(max(delay, 0) / 1000)
+
+        # Внедряемые сбои
+        roll = server.rng_uniform(0, 1)
+        if roll < config.rate_limit_ratio:
+            server.count("rate_limited")
+            return self._send(429, {"error": {"status": 429, "message": "API rate limit exceeded"}},
+                              {"Retry-After": str(config.retry_after)})
+        if roll < config.rate_limit_ratio + config.error_ratio:
+            server.count("errors")
+            return self._send(503, {"error": {"status": 503, "message": "Service unavailable"}})
+
+        auth = self.headers.get("Authorization", "")
+        if not auth.startswith("Bearer ") or len(auth) <= len("Bearer "):
+            return self._send(401, {"error": {"status": 401, "message": "No token provided"}})
+
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        if url.path == RECENTLY_PLAYED_PATH:
+            return self._recently_played(auth[len("Bearer "):], query)
+        if url.path == "/v1/tracks":
+            return self._many(query, server.catalog.parse_track_id, lambda key: server.catalog.track(*key), "tracks")
+        if url.path.startswith("/v1/tracks/"):
+            key = server.catalog.parse_track_id(url.path.rsplit("/", 1)[-1])
+            return self._one(key, lambda k: server.catalog.track(*k))
+        if url.path == "/v1/artists":
+            return self._many(query, server.catalog.parse_artist_id, server.catalog.artist, "artists")
+        if url.path.startswith("/v1/artists/"):
+            key = server.catalog.parse_artist_id(url.path.rsplit("/", 1)[-1])
+            return self._one(key, server.catalog.artist)
+        return self._send(404, {"error": {"status": 404, "message": "Service not found"}})
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+        if urlparse(self.path).path != TOKEN_PATH:
+            return self._send(404, {"error": {"status": 404, "message": "Service not found"}})
+
+        form = {key: values[-1] for key, values in parse_qs(body).items()}
+        if not self.headers.get("Authorization", "").startswith("Basic "):
+            return self._send(401, {"error": "invalid_client"})
+        if form.get("grant_type") != "refresh_token" or not form.get("refresh_token"):
+            return self._send(400, {"error": "invalid_grant"})
+
+        server.count("token_refreshes")
+        self._send(200, {
+            "access_token": form["refresh_token"],
+            "token_type": "Bearer",
+            "expires_in": server.catalog.config.token_ttl,
+        })
+
+    def _recently_played(self, user: str, query: dict):
+        """Отдаёт страницу истории с курсорами after/before, как Spotify."""
+        catalog = self.server.catalog
+        try:
+            limit = min(max(int(query.get("limit", 20)), 1), MAX_LIMIT)
+            after = int(query["after"]) if "after" in query else None
+            before = int(query["before"]) if "before" in query else None
+        except ValueError:
+            return self._send(400, {"error": {"status": 400, "message": "Invalid limit/after/before"}})
+
+        history = catalog.history(user)
+        window = [
+            play for play in history
+            if (after is None or play[0] > after) and (before is None or play[0] < before)
+        ]
+        page = window[:limit]
+
+        base = f"http://{self.headers.get('Host')}{RECENTLY_PLAYED_PATH}"
+        next_url = None
+        if len(window) > limit:
+            params = {"limit": limit, "before": page[-1][0]}
+            if after is not None:
+                params["after"] = after
+            next_url = f"{base}?{urlencode(params)}"
+
+        body = {
+            "href": f"{base}?{urlencode(query)}",
+            "items": [catalog.play_item(*play) for play in page],
+            "limit": limit,
+            "next": next_url,
+            "cursors": {"after": str(page[0][0]), "before": str(page[-1][0])} if page else None,
+        }
+        self._send(200, body)
+
+    def _many(self, query: dict, parse, build, key: str):
+        """Отдаёт пакетный ответ для ?ids=...; неизвестные ID — null, как в API."""
+        ids = [value for value in query.get("ids", "").split(",") if value]
+        if not ids or len(ids) > MAX_IDS:
+            return self._send(400, {"error": {"status": 400, "message": "Invalid ids"}})
+        objects = []
+        for value in ids:
+            parsed = parse(value)
+            objects.append(build(parsed) if parsed is not None else None)
+        self._send(200, {key: objects})
+
+    def _one(self, key, build):
+        """Отдаёт один объект или 404."""
+        if key is None:
+            return self._send(404, {"error": {"status": 404, "message": "Not found"}})
+        self._send(200, build(key))
+
+    def _send(self, status: int, body: dict, headers: Optional[dict] = None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+
+class MockSpotifyServer(ThreadingHTTPServer):
+    """
+    Многопоточный HTTP-сервер мока со счётчиками запросов.
+
+    Args:
+        address (tuple): Адрес (host, port); порт 0 — выбрать свободный.
+        config (MockConfig): Параметры данных и сбоев.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address: tuple, config: MockConfig):
+        super().__init__(address, MockSpotifyHandler)
+        self.catalog = MockCatalog(config)
+        self._rng = random.Random(config.seed)
+        self._lock = threading.Lock()
+        self.counters = {"requests": 0, "rate_limited": 0, "errors": 0, "token_refreshes": 0}
+
+    @property
+    def base_url(self) -> str:
+        """Базовый URL для SPOTIFY_API_BASE_URL."""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def token_url(self) -> str:
+        """URL для SPOTIFY_TOKEN_URL."""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{TOKEN_PATH}"
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def rng_uniform(self, low: float, high: float) -> float:
+        with self._lock:
+            return self._rng.uniform(low, high)
+
+
+
+def start_server(config: Optional[MockConfig] = None, host: str = "127.0.0.1", port: int = 0) -> MockSpotifyServer:
+    """
+    Запускает мок-сервер в фоновом потоке (для бенчмарков).
+
+    Args:
+        config (Optional[MockConfig]): Параметры данных и сбоев.
+        host (str): Адрес прослушивания.
+        port (int): Порт; 0 — выбрать свободный.
+
+    Returns:
+        MockSpotifyServer: Запущенный сервер; остановка — server.shutdown().
+    """
+    server = MockSpotifyServer((host, port), config or MockConfig())
+    threading.Thread(target=server.serve_forever, name="mock-spotify", daemon=True).start()
+    return server
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Локальный мок Spotify Web API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--artists", type=int, default=2000)
+    parser.add_argument("--plays-per-user", type=int, default=200)
+    parser.add_argument("--history-hours", type=float, default=24)
+    parser.add_argument("--zipf-s", type=float, default=1.1)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--latency-jitter-ms", type=float, default=0)
+    parser.add_argument("--rate-limit-ratio", type=float, default=0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--error-ratio", type=float, default=0)
+    parser.add_argument("--token-ttl", type=int, default=3600)
+    args = parser.parse_args()
+
+    mock_config = MockConfig(
+        seed=args.seed,
+        artists=args.artists,
+        plays_per_user=args.plays_per_user,
+        history_hours=args.history_hours,
+        zipf_s=args.zipf_s,
+        latency_ms=args.latency_ms,
+        latency_jitter_ms=args.latency_jitter_ms,
+        rate_limit_ratio=args.rate_limit_ratio,
+        retry_after=args.retry_after,
+        error_ratio=args.error_ratio,
+        token_ttl=args.token_ttl,
+    )
+    mock_server = MockSpotifyServer((args.host, args.port), mock_config)
+    logger.info(f"Мок Spotify API запущен: {mock_server.base_url}")
+    try:
+        mock_server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info(f"Остановка. Счётчики: {mock_server.counters}")
+        mock_server.shutdown()
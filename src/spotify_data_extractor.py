@@ -1,83 +1,68 @@
-import os
-import pandas as pd
-import requests
-from datetime import datetime, timedelta
-from dotenv import load_dotenv
+from __future__ import annotations
 
-load_dotenv()
+import os
+import sys
+from typing import TYPE_CHECKING
 
-SPOTIFY_USER_ID = os.getenv("SPOTIFY_USER_ID")
-SPOTIFY_TOKEN = os.getenv("SPOTIFY_TOKEN")
+# Общие модули пайплайна лежат рядом с DAG
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "Dags"))
+from extractor import ApiSource, Extractor, start_after_ms
 
-if not SPOTIFY_TOKEN:
-    raise ValueError("Токен Spotify не найден в .env. Проверьте переменную SPOTIFY_TOKEN.")
+# pandas, requests и .env загружаются при вызове, а не при импорте модуля
+if TYPE_CHECKING:
+    import pandas as pd
 
 
 def get_recently_played_tracks(days_back: int = 2) -> pd.DataFrame:
     """
     Запрашивает данные о недавно прослушанных треках из Spotify API и возвращает их в виде DataFrame.
 
+    Если для пользователя сохранена отметка последней загрузки, запрашиваются
+    только прослушивания после неё, а days_back не используется. Извлечение
+    выполняет общий движок (см. Dags/extractor): постраничный обход по
+    курсорам, архивирование ответов, те же таймауты и повторы, что у DAG.
+
     Параметры:
         days_back (int): количество дней назад, от которых брать данные (по умолчанию 2).
 
     Возвращает:
         pd.DataFrame: таблица с колонками:
-            - song_name (str): название трека.
-            - artist_name (str): имя исполнителя.
-            - played_at (str): ISO-формат времени воспроизведения.
-            - timestamp (str): дата в формате YYYY-MM-DD.
+            - song_name (category): название трека.
+            - artist_name (category): имя исполнителя.
+            - played_at (datetime64[ms, UTC]): время воспроизведения.
+            - timestamp (category): дата в формате YYYY-MM-DD.
+            - track_id (str): ID трека Spotify.
+            - artist_id (str): ID первого артиста альбома.
+
+    Исключения:
+        ValueError: если в .env нет SPOTIFY_TOKEN или SPOTIFY_REFRESH_TOKEN.
+        ConnectionError: если запрос к Spotify API завершился ошибкой.
+        KeyError: если в ответе API нет ожидаемого ключа или он неверного типа.
+        RuntimeError: при любой другой ошибке извлечения (в т.ч. неразборчивый JSON).
     """
-    # Формируем заголовки для запроса
-    headers = {
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {SPOTIFY_TOKEN}"
-    }
-
-    # Вычисляем временную метку (в миллисекундах)
-    today = datetime.now()
-    past_date = today - timedelta(days=days_back)
-    unix_timestamp_ms = int(past_date.timestamp()) * 1000
-
-    # URL запроса к Spotify API
-    url = f"https://api.spotify.com/v1/me/player/recently-played?after={unix_timestamp_ms}"
-
-    try:
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()  # Поднимает исключение для 4xx/5xx статусов
-
-        data = response.json()
-
-        # Проверяем наличие ключа "items"
-        if "items" not in data:
-            raise ValueError("Ответ API не содержит ключа 'items'.")
+    import msgspec
+    import requests
+    from dotenv import load_dotenv
 
-        song_names = []
-        artist_names = []
-        played_at_list = []
-        timestamps = []
+    load_dotenv()
+    SPOTIFY_USER_ID = os.getenv("SPOTIFY_USER_ID")
+    SPOTIFY_TOKEN = os.getenv("SPOTIFY_TOKEN")
 
-        for item in data["items"]:
-            song_names.append(item["track"]["name"])
-            # Берём первого артиста (может быть несколько)
-            artist_names.append(item["track"]["album"]["artists"][0]["name"])
-            played_at = item["played_at"]
-            played_at_list.append(played_at)
-            # Извлекаем дату (первые 10 символов ISO-строки)
-            timestamps.append(played_at[:10])
+    if not SPOTIFY_TOKEN and not (SPOTIFY_USER_ID and os.getenv("SPOTIFY_REFRESH_TOKEN")):
+        raise ValueError("Токен Spotify не найден в .env. Проверьте переменные SPOTIFY_TOKEN или SPOTIFY_REFRESH_TOKEN.")
 
-        df = pd.DataFrame({
-            "song_name": song_names,
-            "artist_name": artist_names,
-            "played_at": played_at_list,
-            "timestamp": timestamps
-        })
-
-        return df
+    # Без пользователя токен берётся из SPOTIFY_TOKEN, а ответы не архивируются
+    source = ApiSource(SPOTIFY_USER_ID, None if SPOTIFY_USER_ID else SPOTIFY_TOKEN, archive=None if SPOTIFY_USER_ID else False)
+    extractor = Extractor(source, enrich_tracks=False, enrich_artists=False)
 
+    try:
+        return extractor.collect(start_after_ms(SPOTIFY_USER_ID, days_back))
     except requests.exceptions.RequestException as e:
         raise ConnectionError(f"Ошибка запроса к Spotify API: {e}")
     except KeyError as e:
         raise KeyError(f"Отсутствует ожидаемый ключ в ответе API: {e}")
+    except msgspec.ValidationError as e:
+        # Ответ разобран, но не совпадает со схемой: нет ключа или он неверного типа
+        raise KeyError(f"Отсутствует ожидаемый ключ в ответе API: {e}")
     except Exception as e:
         raise RuntimeError(f"Неожиданная ошибка: {e}")
@@ -0,0 +1,93 @@
+"""
+Общие настройки тестов.
+
+Модули пайплайна лежат в src и src/Dags (как в Airflow), поэтому оба
+каталога добавляются в sys.path. Всё состояние на диске (индексы ключей,
+отметки, архив, карантин, кэши) уводится во временный каталог теста.
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, os.path.join(ROOT, "src", "Dags"))
+
+USER_ID = "test-user"
+
+
+
+@pytest.fixture(autouse=True)
+def isolated_state(tmp_path, monkeypatch):
+    """Временные каталоги состояния и пользователь по умолчанию для каждого теста."""
+    from extractor import load_settings
+
+    monkeypatch.setenv("SPOTIFY_USER_ID", USER_ID)
+    monkeypatch.setenv("SPOTIFY_TOKEN", USER_ID)
+    monkeypatch.setenv("SPOTIFY_KEY_INDEX_DIR", str(tmp_path / "key_index"))
+    monkeypatch.setenv("SPOTIFY_STATE_FILE", str(tmp_path / "watermark.json"))
+    monkeypatch.setenv("SPOTIFY_ARCHIVE_DIR", str(tmp_path / "archive"))
+    monkeypatch.setenv("SPOTIFY_QUARANTINE_DIR", str(tmp_path / "quarantine"))
+    monkeypatch.setenv("SPOTIFY_METRICS_DIR", str(tmp_path / "metrics"))
+    monkeypatch.setenv("SPOTIFY_CACHE_FILE", str(tmp_path / "enrichment_cache.sqlite"))
+    monkeypatch.setenv("SPOTIFY_TOKEN_CACHE_FILE", str(tmp_path / "token_cache.json"))
+    monkeypatch.setenv("SPOTIFY_RATE_LIMIT_FILE", str(tmp_path / "rate_limit.bin"))
+    load_settings.cache_clear()
+    yield tmp_path
+    load_settings.cache_clear()
+
+
+
+@pytest.fixture
+def mock_api():
+    """Запускает мок Spotify API (см. mock_spotify_api) с заданной конфигурацией."""
+    from mock_spotify_api import MockConfig, start_server
+
+    servers = []
+
+    def start(**config):
+        server = start_server(MockConfig(**config))
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+
+@pytest.fixture
+def plays(mock_api):
+    """Извлекает историю прослушиваний с мока Spotify API (без обогащения)."""
+    from extractor import Extractor, MockSource
+
+    def extract(count: int = 50, arrow: bool = False):
+        server = mock_api(plays_per_user=count)
+        source = MockSource(base_url=server.base_url, user_id=USER_ID)
+        return Extractor(source, enrich_tracks=False, enrich_artists=False, arrow=arrow).collect()
+
+    return extract
+
+
+
+@pytest.fixture
+def sqlite_engine(tmp_path):
+    """
+    БД SQLite с таблицами my_played_tracks и fav_artist.
+
+    db.create_tables() рассчитан на PostgreSQL (блок DO $$), поэтому берутся
+    только CREATE TABLE из DDL модуля db.
+    """
+    from sqlalchemy import create_engine, text
+
+    from db import FAV_ARTIST_DDL, MY_PLAYED_TRACKS_DDL
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'spotify.db'}")
+    with engine.begin() as conn:
+        conn.execute(text(MY_PLAYED_TRACKS_DDL.split(";")[0]))
+        conn.execute(text(FAV_ARTIST_DDL))
+    yield engine
+    engine.dispose()
@@ -0,0 +1,64 @@
+"""Обновление токенов: повтор после 401 и смена refresh-токена из окружения."""
+
+import auth
+from auth import TokenManager
+from conftest import USER_ID
+from spotify_client import SpotifyClient
+
+
+
+def test_unauthorized_request_is_retried_with_fresh_token(mock_api, monkeypatch):
+    server = mock_api()
+    manager = TokenManager("client", "secret", token_url=server.token_url)
+    manager.register(USER_ID, refresh_token=USER_ID)
+    monkeypatch.setattr(auth, "_manager", manager)
+    client = SpotifyClient(base_url=server.base_url)
+
+    # Пустой токен мок отклоняет с 401, обновлённый равен refresh-токену
+    raw = client.get_raw("me/player/recently-played", "", {"limit": 5}, USER_ID)
+
+    assert b'"items"' in raw
+    assert server.counters["token_refreshes"] == 1
+
+
+
+def test_register_replaces_changed_refresh_token():
+    manager = TokenManager()
+    manager.register(USER_ID, refresh_token="old")
+    manager._tokens[USER_ID].update(access_token="issued-for-old", expires_at=float("inf"))
+
+    manager.register(USER_ID, refresh_token="old")
+    assert manager._tokens[USER_ID]["expires_at"] == float("inf")
+
+    manager.register(USER_ID, refresh_token="new")
+    assert manager._tokens[USER_ID]["refresh_token"] == "new"
+    assert manager._tokens[USER_ID]["expires_at"] == 0.0
+
+
+
+def test_register_keeps_token_rotated_by_spotify():
+    manager = TokenManager()
+    manager.register(USER_ID, refresh_token="env")
+    manager._tokens[USER_ID]["refresh_token"] = "rotated"  # Выдан Spotify при обновлении
+
+    manager.register(USER_ID, refresh_token="env")
+    assert manager._tokens[USER_ID]["refresh_token"] == "rotated"
+
+
+
+def test_concurrent_refreshes_save_valid_cache(mock_api, isolated_state):
+    import json
+    from concurrent.futures import ThreadPoolExecutor
+
+    server = mock_api()
+    cache = isolated_state / "tokens.json"
+    manager = TokenManager("client", "secret", token_url=server.token_url, cache_path=str(cache))
+    users = [f"user{number}" for number in range(20)]
+    for user_id in users:
+        manager.register(user_id, refresh_token=user_id)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        tokens = list(pool.map(lambda user_id: manager._refresh(user_id, margin=float("inf")), users * 3))
+
+    assert tokens == users * 3
+    assert sorted(json.loads(cache.read_text())) == sorted(users)
@@ -0,0 +1,84 @@
+"""Параллельный backfill по окнам (backfill)."""
+
+import json
+from datetime import date
+
+import numpy as np
+import pytest
+from sqlalchemy import text
+
+from backfill import backfill, process_window, split_windows, window_files
+from conftest import USER_ID
+from extractor import ExportSource
+from key_index import KeyIndex
+
+WINDOW = ("2024-01-05T00:00:00", "2024-01-06T00:00:00")
+
+
+
+def write_export(path, plays: int, artist: str = "A", day: str = "2024-01-05") -> str:
+    """Пишет расширенную выгрузку: plays прослушиваний артиста за день с интервалом в минуту."""
+    records = [
+        {
+            "ts": f"{day}T10:{minute:02d}:00Z",
+            "master_metadata_track_name": f"Song {minute}",
+            "master_metadata_album_artist_name": artist,
+            "spotify_track_uri": f"spotify:track:{minute}",
+        }
+        for minute in range(plays)
+    ]
+    path.write_text(json.dumps(records))
+    return str(path)
+
+
+
+def test_reload_with_key_index_keeps_full_fav_artist_count(tmp_path, sqlite_engine):
+    db_url = str(sqlite_engine.url)
+    first = write_export(tmp_path / "Streaming_History_Audio_1.json", 6)
+    full = write_export(tmp_path / "Streaming_History_Audio_2.json", 10)
+
+    loaded = process_window(WINDOW, "export", [first], USER_ID, db_url)
+    known = KeyIndex(USER_ID, np.unique(loaded["keys"]))
+    result = process_window(WINDOW, "export", [full], USER_ID, db_url, known=known)
+
+    assert result["loaded"] == 6 and result["inserted"] == 4
+    with sqlite_engine.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM my_played_tracks")).scalar() == 10
+        assert conn.execute(text("SELECT ID, count FROM fav_artist")).all() == [("2024-01-05-A", "10")]
+
+
+
+def test_split_windows_covers_range_without_gaps():
+    windows = split_windows(date(2024, 1, 1), date(2024, 1, 8), 3)
+
+    assert windows == [
+        ("2024-01-01T00:00:00", "2024-01-04T00:00:00"),
+        ("2024-01-04T00:00:00", "2024-01-07T00:00:00"),
+        ("2024-01-07T00:00:00", "2024-01-08T00:00:00"),
+    ]
+
+
+
+def test_window_files_selects_overlapping_exports(tmp_path):
+    write_export(tmp_path / "Streaming_History_Audio_1.json", 3, day="2024-01-02")
+    write_export(tmp_path / "Streaming_History_Audio_2.json", 3, day="2024-01-05")
+    ranges = ExportSource(str(tmp_path)).time_ranges()
+
+    assert [first[:10] for _, first, _ in ranges] == ["2024-01-02", "2024-01-05"]
+    assert [len(window_files(ranges, *window)) for window in split_windows(date(2024, 1, 1), date(2024, 1, 7), 3)] == [1, 1]
+    assert window_files(ranges, "2024-01-03T00:00:00", "2024-01-05T00:00:00") == []
+
+
+
+@pytest.mark.parametrize("arrow", [False, True])
+def test_backfill_splits_export_into_parallel_windows(tmp_path, arrow):
+    write_export(tmp_path / "Streaming_History_Audio_1.json", 4, artist="A", day="2024-01-02")
+    write_export(tmp_path / "Streaming_History_Audio_2.json", 6, artist="B", day="2024-01-05")
+    write_export(tmp_path / "Streaming_History_Audio_3.json", 6, artist="B", day="2024-01-05")  # Повтор выгрузки
+
+    results = backfill("export", date(2024, 1, 1), date(2024, 1, 7), 3, workers=2, path=str(tmp_path), arrow=arrow)
+
+    assert [(result["window"], result["rows"]) for result in results] == [
+        ("2024-01-01..2024-01-04", 4),
+        ("2024-01-04..2024-01-07", 6),
+    ]
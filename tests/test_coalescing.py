@@ -0,0 +1,57 @@
+"""Объединение одинаковых одновременных запросов SpotifyClient."""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from conftest import USER_ID
+from spotify_client import SpotifyClient
+
+PATH = "me/player/recently-played"
+
+
+
+def concurrent_get(client: SpotifyClient, calls: int, token=lambda number: USER_ID) -> list:
+    """Выполняет calls одновременных get_raw() (старт по общему барьеру)."""
+    barrier = threading.Barrier(calls)
+
+    def call(number):
+        barrier.wait()
+        return client.get_raw(PATH, token(number), {"limit": 10})
+
+    with ThreadPoolExecutor(max_workers=calls) as pool:
+        return list(pool.map(call, range(calls)))
+
+
+
+def test_identical_concurrent_requests_share_one_call(mock_api):
+    server = mock_api(latency_ms=300)
+    client = SpotifyClient(base_url=server.base_url)
+
+    bodies = concurrent_get(client, 8)
+
+    assert server.counters["requests"] == 1
+    assert client.stats()["coalesced"] == 7
+    assert len(set(bodies)) == 1 and b'"items"' in bodies[0]
+
+
+
+def test_requests_with_different_tokens_are_not_shared(mock_api):
+    server = mock_api(latency_ms=200)
+    client = SpotifyClient(base_url=server.base_url)
+
+    concurrent_get(client, 4, token=lambda number: f"user{number}")
+
+    assert server.counters["requests"] == 4
+    assert client.stats()["coalesced"] == 0
+
+
+
+def test_finished_request_is_not_cached(mock_api):
+    server = mock_api()
+    client = SpotifyClient(base_url=server.base_url)
+
+    client.get_raw(PATH, USER_ID, {"limit": 10})
+    client.get_raw(PATH, USER_ID, {"limit": 10})
+
+    assert server.counters["requests"] == 2
+    assert client.stats()["inflight"] == 0
@@ -0,0 +1,63 @@
+"""Загрузка через промежуточную таблицу и INSERT ... ON CONFLICT (db._upsert)."""
+
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+from db import load_plays, upsert_fav_artist, upsert_plays
+
+
+
+def count_rows(engine, table: str) -> int:
+    with engine.connect() as conn:
+        return conn.execute(text(f"SELECT count(*) FROM {table}")).scalar()
+
+
+
+@pytest.mark.parametrize("arrow", [False, True])
+def test_upsert_plays_is_idempotent(plays, sqlite_engine, arrow):
+    df = plays(40, arrow=arrow)
+
+    assert upsert_plays(sqlite_engine, df) == 40
+    assert upsert_plays(sqlite_engine, df) == 0  # Повтор отсекает ON CONFLICT (played_at)
+    assert count_rows(sqlite_engine, "my_played_tracks") == 40
+
+
+
+def test_upsert_plays_inserts_only_new_rows(plays, sqlite_engine):
+    df = plays(40)
+
+    upsert_plays(sqlite_engine, df.iloc[:25])
+
+    assert upsert_plays(sqlite_engine, df) == 15
+    assert count_rows(sqlite_engine, "my_played_tracks") == 40
+
+
+
+def test_upsert_fav_artist_updates_count(sqlite_engine):
+    first = pd.DataFrame({"timestamp": ["2026-01-29"] * 2, "ID": ["a1", "a2"], "artist_name": ["A", "B"], "count": ["3", "1"]})
+    second = pd.DataFrame({"timestamp": ["2026-01-29"], "ID": ["a1"], "artist_name": ["A"], "count": ["5"]})
+
+    upsert_fav_artist(sqlite_engine, first)
+    assert upsert_fav_artist(sqlite_engine, second) == 1
+
+    with sqlite_engine.connect() as conn:
+        rows = dict(conn.execute(text("SELECT ID, count FROM fav_artist")).all())
+    assert rows == {"a1": "5", "a2": "1"}
+
+
+
+@pytest.mark.parametrize("arrow", [False, True])
+def test_load_plays_recounts_fav_artist_from_table(plays, sqlite_engine, arrow):
+    df = plays(40, arrow=arrow)
+    half = df.slice(0, 20) if arrow else df.iloc[:20]
+    rest = df.slice(20) if arrow else df.iloc[20:]
+
+    load_plays(sqlite_engine, half)
+    inserted, _ = load_plays(sqlite_engine, rest)  # Как после отсева индексом ключей
+    load_plays(sqlite_engine, df)  # Повторный запуск
+
+    with sqlite_engine.connect() as conn:
+        counts = conn.execute(text("SELECT sum(CAST(count AS INTEGER)) FROM fav_artist")).scalar()
+    assert inserted == 20
+    assert counts == count_rows(sqlite_engine, "my_played_tracks") == 40
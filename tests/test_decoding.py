@@ -0,0 +1,66 @@
+"""Типизированный разбор ответов recently-played (decoding)."""
+
+import json
+
+import msgspec
+import pytest
+
+from decoding import PlayColumns, decode_page, item_fields
+
+
+
+def page(*items, next_url=None) -> bytes:
+    return json.dumps({"items": list(items), "next": next_url, "cursors": {"after": "1"}}).encode()
+
+
+
+def item(played_at="2026-01-29T10:15:30.123Z", song="Song", artist="Artist", track_id="t1", artist_id="a1") -> dict:
+    return {
+        "played_at": played_at,
+        "context": None,
+        "track": {"id": track_id, "name": song, "popularity": 10, "album": {"name": "Album", "artists": [{"id": artist_id, "name": artist}]}},
+    }
+
+
+
+def test_decode_page_keeps_only_needed_fields():
+    decoded = decode_page(page(item(), next_url="https://api.spotify.com/next"))
+
+    assert decoded.next == "https://api.spotify.com/next"
+    assert item_fields(decoded.items[0]) == ("Song", "Artist", "2026-01-29T10:15:30.123Z", "t1", "a1")
+
+
+
+def test_decode_page_without_items():
+    assert decode_page(b'{"error": "x"}').items is None
+
+
+
+def test_item_fields_skips_incomplete_items():
+    broken = item()
+    broken["track"]["album"]["artists"] = []
+    items = decode_page(page(broken, item(song=None), {"played_at": "2026-01-29T10:15:30.123Z"})).items
+
+    assert [item_fields(entry) for entry in items] == [None, None, None]
+
+
+
+def test_decode_page_rejects_wrong_types():
+    with pytest.raises(msgspec.ValidationError):
+        decode_page(page({"played_at": 123}))
+    with pytest.raises(msgspec.DecodeError):
+        decode_page(b"{not json")
+
+
+
+def test_play_columns_share_repeated_strings():
+    columns = PlayColumns()
+    for number in range(3):
+        entry = decode_page(page(item(played_at=f"2026-01-29T10:15:3{number}.000Z"))).items[0]
+        columns.append(*item_fields(entry))
+
+    assert columns.artist_name[0] is columns.artist_name[2]
+    assert columns.track_id[0] is columns.track_id[1]
+    df = columns.to_frame()
+    assert list(df.columns) == ["song_name", "artist_name", "played_at", "timestamp", "track_id", "artist_id"]
+    assert df["artist_name"].dtype == "category" and str(df["played_at"].dtype) == "datetime64[ms, UTC]"
@@ -0,0 +1,46 @@
+"""Обогащение метаданными не прерывает загрузку при сбое API."""
+
+import pandas as pd
+
+from circuit_breaker import CircuitBreaker
+from conftest import USER_ID
+from enrichment import ArtistEnricher, TrackEnricher
+from spotify_client import SpotifyClient
+
+
+
+def make_client(server) -> SpotifyClient:
+    return SpotifyClient(base_url=server.base_url, retry_base=0, breaker=CircuitBreaker(0.5, 20, 3, 30))
+
+
+
+def test_track_enrichment_survives_api_errors(mock_api):
+    server = mock_api(error_ratio=1.0)
+    df = pd.DataFrame({"track_id": ["track000001000", "track000002000", None]})
+
+    enriched = TrackEnricher(client=make_client(server)).enrich(df, USER_ID)
+
+    assert enriched[["album_name", "duration_ms", "popularity"]].isna().all().all()
+    assert server.counters["errors"] > 0
+
+
+
+def test_track_enrichment_fills_metadata(mock_api):
+    server = mock_api()
+    df = pd.DataFrame({"track_id": ["track000001000", "unknown"]})
+
+    enriched = TrackEnricher(client=make_client(server)).enrich(df, USER_ID)
+
+    assert enriched.loc[0, "album_name"] == "Album 1-0"
+    assert enriched["duration_ms"].notna().tolist() == [True, False]
+
+
+
+def test_artist_enrichment_survives_api_errors(mock_api):
+    server = mock_api(error_ratio=1.0)
+    frames = {"a": pd.DataFrame({"artist_id": ["artist000001"]}), "b": pd.DataFrame({"artist_id": ["artist000002"]})}
+
+    enriched = ArtistEnricher(client=make_client(server)).enrich_frames(frames, USER_ID)
+
+    for df in enriched.values():
+        assert df[["artist_genres", "artist_followers"]].isna().all().all()
@@ -0,0 +1,89 @@
+"""Источник данных из выгрузки аккаунта Spotify."""
+
+import json
+
+import pytest
+
+from extractor import Extractor, ExportSource, make_source
+
+EXTENDED = [
+    {
+        "ts": "2023-01-02T10:00:00Z",
+        "master_metadata_track_name": "Song A",
+        "master_metadata_album_artist_name": "Artist A",
+        "spotify_track_uri": "spotify:track:abc",
+    },
+    # Подкаст: без названия трека и артиста
+    {
+        "ts": "2023-01-02T11:00:00Z",
+        "master_metadata_track_name": None,
+        "master_metadata_album_artist_name": None,
+        "episode_name": "Podcast",
+    },
+    {
+        "ts": "2023-01-03T09:00:00Z",
+        "master_metadata_track_name": "Song B",
+        "master_metadata_album_artist_name": "Artist B",
+        "spotify_track_uri": None,
+    },
+]
+BASIC = [{"endTime": "2022-12-31 23:59", "artistName": "Artist C", "trackName": "Song C", "msPlayed": 1000}]
+
+
+
+@pytest.fixture
+def export_dir(tmp_path):
+    """Каталог с расширенной и базовой выгрузкой и посторонним файлом."""
+    root = tmp_path / "export"
+    (root / "nested").mkdir(parents=True)
+    (root / "nested" / "endsong_0.json").write_text(json.dumps(EXTENDED))
+    (root / "StreamingHistory0.json").write_text(json.dumps(BASIC))
+    (root / "Userdata.json").write_text(json.dumps({"username": "test"}))
+    return root
+
+
+
+def collect(source):
+    return Extractor(source, enrich_tracks=False, enrich_artists=False).collect()
+
+
+
+def test_directory_reads_both_formats_and_skips_podcasts(export_dir):
+    df = collect(ExportSource(str(export_dir)))
+
+    assert list(df["song_name"]) == ["Song C", "Song A", "Song B"]
+    assert list(df["track_id"]) == [None, "abc", None]
+    assert list(df["timestamp"]) == ["2022-12-31", "2023-01-02", "2023-01-03"]
+
+
+
+def test_basic_history_time_has_minute_precision(export_dir):
+    df = collect(ExportSource(str(export_dir / "StreamingHistory0.json")))
+
+    assert df["played_at"].iloc[0].isoformat() == "2022-12-31T23:59:00+00:00"
+
+
+
+def test_list_of_files_keeps_order(export_dir):
+    files = [str(export_dir / "nested" / "endsong_0.json"), str(export_dir / "StreamingHistory0.json")]
+
+    df = collect(make_source("export", path=files))
+
+    assert list(df["song_name"]) == ["Song A", "Song B", "Song C"]
+
+
+
+def test_pages_split_by_page_size(export_dir):
+    pages = list(ExportSource(str(export_dir), page_size=2).iter_pages())
+
+    assert [len(page.items) for page in pages] == [2, 1]
+
+
+
+def test_time_ranges_per_file(export_dir):
+    ranges = ExportSource(str(export_dir)).time_ranges()
+
+    assert ranges == [
+        (str(export_dir / "StreamingHistory0.json"), "2022-12-31T23:59:00", "2022-12-31T23:59:00"),
+        (str(export_dir / "nested" / "endsong_0.json"), "2023-01-02T10:00:00", "2023-01-03T09:00:00"),
+    ]
@@ -0,0 +1,82 @@
+"""Индекс загруженных played_at (key_index.KeyIndex)."""
+
+import os
+
+import numpy as np
+import pytest
+
+import key_index
+from conftest import USER_ID
+from db import upsert_plays
+from key_index import KeyIndex, index_path, played_at_keys
+
+
+
+@pytest.mark.parametrize("arrow", [False, True])
+def test_filter_new_drops_loaded_rows(plays, arrow):
+    data = plays(30, arrow=arrow)
+    index = KeyIndex(USER_ID)
+    index.add(data.slice(0, 10) if arrow else data.iloc[:10])
+
+    fresh = index.filter_new(data)
+
+    assert len(fresh) == 20
+    assert not index.contains(played_at_keys(fresh)).any()
+
+
+
+def test_add_merges_keys_sorted_and_unique():
+    index = KeyIndex(USER_ID, np.array([10, 30], dtype=np.int64))
+
+    index.add(np.array([40, 20, 30, 20], dtype=np.int64))
+
+    assert index.keys.tolist() == [10, 20, 30, 40]
+
+
+
+def test_save_and_load_roundtrip(plays):
+    index = KeyIndex(USER_ID)
+    index.add(plays(20))
+    index.save()
+
+    loaded = KeyIndex.load(USER_ID)
+
+    assert os.path.exists(index_path(USER_ID))
+    assert np.array_equal(loaded.keys, index.keys)
+
+
+
+def test_load_without_file_is_empty():
+    assert len(KeyIndex.load(USER_ID)) == 0
+
+
+
+def test_load_refuses_other_user():
+    with pytest.raises(ValueError):
+        KeyIndex.load("someone-else")
+
+
+
+def test_load_rebuilds_stale_file_from_db(plays, sqlite_engine):
+    df = plays(30)
+    upsert_plays(sqlite_engine, df)
+    stale = KeyIndex(USER_ID)
+    stale.add(df.iloc[:10])
+    stale.save()
+
+    index = KeyIndex.load(USER_ID, sqlite_engine)
+
+    assert np.array_equal(index.keys, np.unique(played_at_keys(df)))
+    assert np.array_equal(KeyIndex.load(USER_ID).keys, index.keys)  # Перестроенный индекс сохранён
+
+
+
+def test_load_keeps_file_matching_db(plays, sqlite_engine, monkeypatch):
+    df = plays(30)
+    upsert_plays(sqlite_engine, df)
+    index = KeyIndex(USER_ID)
+    index.add(df)
+    index.save()
+    monkeypatch.setattr(key_index, "_keys_from_db", lambda engine: pytest.fail("индекс перестроен по БД"))
+
+    assert np.array_equal(KeyIndex.load(USER_ID, sqlite_engine).keys, index.keys)
@@ -0,0 +1,52 @@
+"""Импорт модулей пайплайна без тяжёлых зависимостей и учётных данных."""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import ROOT
+
+HEAVY_MODULES = ("pandas", "pyarrow", "requests", "sqlalchemy", "dotenv")
+
+
+
+def loaded_heavy_modules(module: str, cwd) -> list:
+    """Импортирует module в новом процессе без SPOTIFY_* и возвращает загруженные тяжёлые модули."""
+    env = {key: value for key, value in os.environ.items() if not key.startswith("SPOTIFY_")}
+    env["PYTHONPATH"] = os.pathsep.join([os.path.join(ROOT, "src", "Dags"), os.path.join(ROOT, "src")])
+    code = f"import sys, {module}; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=cwd, env=env, capture_output=True, text=True, check=True,
+    )
+    return list(filter(None, result.stdout.strip().split(",")))
+
+
+
+@pytest.mark.parametrize("module", ["spotify_etl", "spotify_data_extractor", "extractor", "db", "decoding"])
+def test_import_without_credentials_skips_heavy_modules(module, tmp_path):
+    assert loaded_heavy_modules(module, tmp_path) == []
+
+
+
+def test_missing_credentials_raise_on_first_use(monkeypatch, tmp_path):
+    from extractor import default_user_id, load_settings
+
+    monkeypatch.chdir(tmp_path)  # Без .env рядом
+    monkeypatch.delenv("SPOTIFY_TOKEN")
+    load_settings.cache_clear()
+
+    with pytest.raises(ValueError):
+        default_user_id()
+
+
+
+def test_settings_read_on_first_call(monkeypatch):
+    from extractor import load_settings
+
+    monkeypatch.setenv("SPOTIFY_ENRICH_TRACKS", "0")
+    load_settings.cache_clear()
+
+    assert load_settings()["enrich_tracks"] is False
+    assert load_settings()["enrich_artists"] is True
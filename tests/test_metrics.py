@@ -0,0 +1,111 @@
+"""Гистограммы задержек и выгрузка метрик запросов."""
+
+import json
+import os
+
+import pytest
+
+from conftest import USER_ID
+from metrics import Histogram, RequestMetrics
+from spotify_client import SpotifyClient
+
+PATH = "me/player/recently-played"
+
+
+
+def test_small_values_are_exact():
+    histogram = Histogram()
+    for value in range(1, 11):
+        histogram.record(value)
+
+    assert histogram.percentile(0.5) == 5
+    assert histogram.percentile(1.0) == 10
+    assert (histogram.count, histogram.sum, histogram.min, histogram.max) == (10, 55, 1, 10)
+
+
+
+@pytest.mark.parametrize("quantile", [0.5, 0.9, 0.99])
+def test_large_values_within_bucket_precision(quantile):
+    histogram = Histogram()
+    values = list(range(1_000, 1_000_000, 997))
+    for value in values:
+        histogram.record(value)
+
+    expected = sorted(values)[int(quantile * len(values) + 0.999999) - 1]
+    assert abs(histogram.percentile(quantile) - expected) <= expected * 2 ** -histogram.sub_bits
+
+
+
+def test_empty_and_negative_values():
+    histogram = Histogram()
+    assert histogram.percentile(0.99) == 0
+
+    histogram.record(-5)
+    assert histogram.summary()["max"] == 0
+
+
+
+def test_record_request_groups_by_endpoint():
+    metrics = RequestMetrics()
+    metrics.record_request("tracks", "200", {"ttfb": 0.01, "total": 0.02}, 1000)
+    metrics.record_request("tracks", "503", {"total": 0.5})
+    metrics.record_items("tracks", 50)
+
+    summary = metrics.to_dict()["tracks"]
+
+    assert summary["status"] == {"200": 1, "503": 1}
+    assert set(summary["seconds"]) == {"ttfb", "total"}
+    assert summary["seconds"]["total"]["count"] == 2
+    assert summary["seconds"]["total"]["max"] == pytest.approx(0.5, rel=0.05)
+    assert summary["response_bytes"]["count"] == 1
+    assert summary["items"]["p50"] == 50
+
+
+
+def test_prometheus_format():
+    metrics = RequestMetrics()
+    metrics.record_request("tracks", "200", {"total": 0.1}, 2048)
+
+    text = metrics.to_prometheus()
+
+    assert 'spotify_requests_total{endpoint="tracks",status="200"} 1' in text
+    assert 'spotify_request_duration_seconds_count{endpoint="tracks",phase="total"} 1' in text
+    assert 'spotify_response_size_bytes{endpoint="tracks",quantile="0.99"}' in text
+    # Без record_items серия числа элементов не выгружается
+    assert "spotify_response_items{" not in text
+
+
+
+def test_export_writes_requested_formats(tmp_path):
+    metrics = RequestMetrics()
+    metrics.record_request("tracks", "200", {"total": 0.1}, 10)
+
+    metrics.export(str(tmp_path), "json, unknown")
+    assert os.listdir(tmp_path) == ["spotify_requests.json"]
+    assert json.loads((tmp_path / "spotify_requests.json").read_text())["endpoints"]["tracks"]["status"] == {"200": 1}
+
+    metrics.export(str(tmp_path), "prom,json")
+    assert sorted(os.listdir(tmp_path)) == ["spotify_requests.json", "spotify_requests.prom"]
+
+
+
+def test_export_disabled_by_empty_formats(tmp_path):
+    RequestMetrics().export(str(tmp_path / "metrics"), "")
+
+    assert not (tmp_path / "metrics").exists()
+
+
+
+def test_client_records_request_metrics(mock_api):
+    server = mock_api()
+    client = SpotifyClient(base_url=server.base_url)
+
+    client.get_raw(PATH, USER_ID, {"limit": 10})
+    client.get_raw(PATH, USER_ID, {"limit": 10})
+
+    summary = client.metrics.to_dict()[PATH]
+    assert summary["status"] == {"200": 2}
+    assert summary["seconds"]["total"]["count"] == 2
+    assert summary["response_bytes"]["min"] > 0
+    # Фазы установки соединения есть только у первого запроса: второй идёт по keep-alive
+    assert summary["seconds"]["connect"]["count"] == 1
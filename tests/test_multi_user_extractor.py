@@ -0,0 +1,19 @@
+"""Многопользовательское извлечение на моке Spotify API."""
+
+import spotify_client
+from multi_user_extractor import extract_users
+from spotify_client import SpotifyClient
+
+
+
+def test_extract_users_returns_frames_without_loading(mock_api, monkeypatch, isolated_state):
+    server = mock_api(plays_per_user=60)
+    monkeypatch.setattr(spotify_client, "_client", SpotifyClient(base_url=server.base_url))
+    monkeypatch.setenv("SPOTIFY_ENRICH_ARTISTS", "0")
+    monkeypatch.setenv("SPOTIFY_ENRICH_TRACKS", "0")
+
+    frames = extract_users([("alice", "alice"), ("bob", "bob")], concurrency=2)
+
+    assert sorted(frames) == ["alice", "bob"]
+    assert all(len(df) == 60 for df in frames.values())
+    assert not (isolated_state / "watermark.json").exists()  # Только извлечение
@@ -0,0 +1,55 @@
+"""Обход recently-played по курсорам и нарезка на пачки фиксированного размера."""
+
+import pytest
+
+from conftest import USER_ID
+from extractor import Extractor, MockSource
+from key_index import played_at_keys
+
+
+
+def extractor(server, batch_size: int = 40, arrow: bool = False) -> Extractor:
+    source = MockSource(base_url=server.base_url, user_id=USER_ID)
+    return Extractor(source, batch_size, enrich_tracks=False, enrich_artists=False, arrow=arrow)
+
+
+
+@pytest.mark.parametrize("arrow", [False, True])
+def test_follows_next_cursor_through_all_pages(mock_api, arrow):
+    server = mock_api(plays_per_user=130)
+    engine = extractor(server, arrow=arrow)
+
+    keys = played_at_keys(engine.collect())
+
+    assert engine.pages == 3  # Страницы по 50 элементов
+    assert len(keys) == len(set(keys)) == 130
+
+
+
+@pytest.mark.parametrize("arrow", [False, True])
+def test_batches_have_fixed_size(mock_api, arrow):
+    server = mock_api(plays_per_user=130)
+
+    sizes = [len(batch) for batch in extractor(server, arrow=arrow).iter_batches()]
+
+    assert sizes == [40, 40, 40, 10]
+
+
+
+def test_after_cursor_limits_history(mock_api):
+    server = mock_api(plays_per_user=130)
+    everything = sorted(played_at_keys(extractor(server).collect()))
+    after_ms = int(everything[99])
+
+    engine = extractor(server)
+    keys = played_at_keys(engine.collect(after_ms))
+
+    assert sorted(keys) == everything[100:]
+    assert engine.pages == 1
+
+
+
+def test_empty_history_yields_no_batches(mock_api):
+    server = mock_api(plays_per_user=0)
+
+    assert list(extractor(server).iter_batches()) == []
@@ -0,0 +1,63 @@
+"""Разбор played_at и отклонение некорректных значений (bad_played_at)."""
+
+import pytest
+
+from decoding import PlayColumns, parse_played_at
+from quarantine import QuarantineSink
+from spotify_etl import run_etl
+
+GOOD = ["2026-01-29T10:15:30.123Z", "2026-01-29T10:15:31Z"]
+BAD = ["2026-01-29T10:15:32.123456Z", "not-a-date", "2026-13-01T00:00:00.000Z"]
+
+
+
+def columns(values) -> PlayColumns:
+    batch = PlayColumns()
+    for number, played_at in enumerate(values):
+        batch.append(f"Song {number}", "Artist", played_at, f"track{number}", "artist")
+    return batch
+
+
+
+def test_parse_played_at_keeps_milliseconds():
+    parsed = parse_played_at(GOOD)
+    assert parsed.cast("int64").to_pylist() == [1769681730123, 1769681731000]
+
+
+
+def test_parse_played_at_rejects_bad_and_sub_millisecond_values():
+    assert parse_played_at(GOOD + BAD).to_pylist()[2:] == [None, None, None]
+
+
+
+@pytest.mark.parametrize("arrow", [False, True])
+def test_bad_played_at_goes_to_quarantine(arrow):
+    batch = columns(GOOD + BAD)
+    sink = QuarantineSink()
+
+    raw, transformed = run_etl([batch.to_record_batch() if arrow else batch.to_frame()], "quarantine", sink)
+
+    assert len(raw) == 2 and "bad_played_at" not in (raw.column_names if arrow else raw.columns)
+    rejected = sink.frame()
+    assert rejected["played_at"].tolist() == BAD
+    assert all(reason.startswith("bad_played_at") for reason in rejected["reason"])
+    assert "bad_played_at" not in rejected.columns
+
+
+
+def test_bad_played_at_fails_the_run_in_fail_mode():
+    with pytest.raises(ValueError, match="bad_played_at"):
+        run_etl([columns(GOOD + BAD[:1]).to_frame()], "fail")
+
+
+
+@pytest.mark.parametrize("arrow", [False, True])
+def test_several_bad_played_at_are_not_duplicates(arrow):
+    batch = columns(GOOD + BAD[1:])
+    sink = QuarantineSink()
+
+    run_etl([batch.to_record_batch() if arrow else batch.to_frame()], "quarantine", sink)
+
+    reasons = sink.frame()["reason"].tolist()
+    assert len(reasons) == 2
+    assert all("bad_played_at" in reason and "duplicate_played_at" not in reason for reason in reasons)
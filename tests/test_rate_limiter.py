@@ -0,0 +1,40 @@
+"""Квота запросов, общая для процессов через файл состояния."""
+
+from concurrent.futures import ProcessPoolExecutor
+
+from rate_limiter import TokenBucket
+
+
+
+def drain(path: str) -> float:
+    """Забирает три токена из общего bucket и возвращает время ожидания."""
+    bucket = TokenBucket(20, 2, path)
+    return sum(bucket.acquire() for _ in range(3))
+
+
+
+def test_tokens_are_shared_between_buckets(tmp_path):
+    path = str(tmp_path / "rate_limit.bin")
+    first, second = TokenBucket(20, 2, path), TokenBucket(20, 2, path)
+
+    assert first.acquire() == first.acquire() == 0
+    assert second.acquire() > 0  # Запас исчерпан первым bucket
+
+
+
+def test_pause_is_shared_between_buckets(tmp_path):
+    path = str(tmp_path / "rate_limit.bin")
+    first, second = TokenBucket(1000, 10, path), TokenBucket(1000, 10, path)
+
+    first.pause(0.2)
+    assert second.acquire() >= 0.15
+
+
+
+def test_tokens_are_shared_between_processes(tmp_path):
+    path = str(tmp_path / "rate_limit.bin")
+    with ProcessPoolExecutor(2) as executor:
+        waited = list(executor.map(drain, [path, path]))
+
+    # Шесть запросов при запасе 2 и 20 токенах/с: не меньше 0,2 с ожидания на двоих
+    assert sum(waited) >= 0.15
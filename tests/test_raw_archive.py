@@ -0,0 +1,65 @@
+"""Архив сырых ответов в zstd JSONL и его индекс (raw_archive)."""
+
+import json
+import os
+
+from conftest import USER_ID
+from extractor import Extractor, MockSource
+from raw_archive import RawArchiveWriter, iter_archived_lines, iter_archived_records, read_index
+
+RAW = b'{\n  "items": [\n    {"played_at": "2026-01-29T10:15:30.123Z"}\n  ],\n  "next": null\n}'
+
+
+
+def write(root, user_id: str, played_at: list) -> RawArchiveWriter:
+    with RawArchiveWriter(user_id, str(root)) as writer:
+        for value in played_at:
+            writer.write_page("https://api.spotify.com/v1/me/player/recently-played", RAW, [value])
+    return writer
+
+
+
+def test_pages_are_stored_unchanged_with_index_entry(tmp_path):
+    writer = write(tmp_path, "alice", ["2026-01-29T10:00:00.000Z", "2026-01-29T09:00:00.000Z"])
+
+    records = list(iter_archived_records(root=str(tmp_path)))
+    [entry] = read_index(str(tmp_path))
+
+    assert [record["page"] for record in records] == [json.loads(RAW)] * 2
+    assert records[0]["user_id"] == "alice"
+    assert entry["path"] == writer.relative_path and entry["path"].startswith(f"dt={entry['date']}{os.sep}alice")
+    assert (entry["pages"], entry["items"]) == (2, 2)
+    assert (entry["min_played_at"], entry["max_played_at"]) == ("2026-01-29T09:00:00.000Z", "2026-01-29T10:00:00.000Z")
+    assert entry["bytes"] == os.path.getsize(tmp_path / entry["path"])
+
+
+
+def test_writer_without_pages_creates_nothing(tmp_path):
+    write(tmp_path, "alice", [])
+
+    assert read_index(str(tmp_path)) == []
+    assert os.listdir(tmp_path) == []
+
+
+
+def test_index_selects_files_by_user_and_played_at(tmp_path):
+    write(tmp_path, "alice", ["2026-01-01T10:00:00.000Z"])
+    write(tmp_path, "alice", ["2026-01-20T10:00:00.000Z"])
+    write(tmp_path, "bob", ["2026-01-20T11:00:00.000Z"])
+
+    def count(**filters) -> int:
+        return len(list(iter_archived_lines(root=str(tmp_path), **filters)))
+
+    assert count() == 3
+    assert count(user_id="alice") == 2
+    assert count(user_id="alice", played_from="2026-01-10T00:00:00") == 1
+    assert count(played_to="2026-01-10T00:00:00") == 1
+
+
+
+def test_live_extraction_archives_every_page(mock_api):
+    server = mock_api(plays_per_user=120)
+    Extractor(MockSource(server.base_url, USER_ID, archive=True), enrich_tracks=False, enrich_artists=False).collect()
+
+    [entry] = read_index()
+    assert (entry["user_id"], entry["pages"], entry["items"]) == (USER_ID, 3, 120)
@@ -0,0 +1,62 @@
+"""Воспроизведение архива сырых ответов (replay)."""
+
+import pandas as pd
+import pytest
+from sqlalchemy import text
+
+from conftest import USER_ID
+from db import load_plays
+from extractor import Extractor, MockSource
+from key_index import KeyIndex
+from replay import load_replay, replay_etl
+
+
+
+@pytest.fixture
+def archived(mock_api):
+    """Извлекает историю с мока с записью сырых ответов в архив."""
+    server = mock_api(plays_per_user=60)
+    source = MockSource(base_url=server.base_url, user_id=USER_ID, archive=True)
+    return Extractor(source, enrich_tracks=False, enrich_artists=False).collect()
+
+
+
+def test_replay_reproduces_live_extraction(archived):
+    raw, transformed = replay_etl(user_id=USER_ID)
+
+    assert sorted(raw["played_at"]) == sorted(archived["played_at"])
+    assert transformed["count"].astype(int).sum() == len(archived)
+
+
+
+def test_replay_filters_by_user(archived):
+    raw, _ = replay_etl(user_id="someone-else")
+
+    assert raw.empty
+
+
+
+def test_load_replay_keeps_plays_missing_from_archive(archived, sqlite_engine, monkeypatch):
+    monkeypatch.setattr("replay.create_tables", lambda engine: None)  # Таблицы SQLite создал sqlite_engine
+    outside = archived.iloc[:1].copy()
+    outside["played_at"] = pd.Timestamp("2020-01-01T12:00:00Z")
+    outside["timestamp"] = "2020-01-01"
+    load_plays(sqlite_engine, outside)
+    raw, _ = replay_etl(user_id=USER_ID)
+
+    load_replay(sqlite_engine, raw)
+    load_replay(sqlite_engine, raw)  # Повторная загрузка ничего не меняет
+
+    with sqlite_engine.connect() as conn:
+        plays = conn.execute(text("SELECT count(*) FROM my_played_tracks")).scalar()
+        counts = dict(conn.execute(text('SELECT "timestamp", sum(CAST(count AS INTEGER)) FROM fav_artist GROUP BY 1')).all())
+    assert plays == len(archived) + 1
+    assert counts.pop("2020-01-01") == 1
+    assert sum(counts.values()) == len(archived)
+    assert len(KeyIndex.load(USER_ID)) == plays
+
+
+
+def test_load_replay_refuses_other_user(sqlite_engine):
+    with pytest.raises(ValueError):
+        load_replay(sqlite_engine, pd.DataFrame(), "someone-else")
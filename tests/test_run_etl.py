@@ -0,0 +1,68 @@
+"""Проверка качества и трансформация в run_etl в режимах fail, drop и quarantine."""
+
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from quarantine import QuarantineSink
+from spotify_etl import run_etl
+
+
+
+def with_violations(df: pd.DataFrame) -> pd.DataFrame:
+    """Добавляет к записям повтор played_at и строку без названия трека."""
+    broken = df.iloc[[0, 1]].copy()
+    broken["song_name"] = broken["song_name"].astype(object)
+    broken.iloc[1, broken.columns.get_loc("song_name")] = None
+    broken.iloc[1, broken.columns.get_loc("played_at")] = df["played_at"].max() + pd.Timedelta(seconds=1)
+    return pd.concat([df.astype({"song_name": object}), broken], ignore_index=True)
+
+
+
+def batches(df: pd.DataFrame, arrow: bool) -> list:
+    halves = [df.iloc[: len(df) // 2], df.iloc[len(df) // 2:]]
+    return [pa.RecordBatch.from_pandas(half, preserve_index=False) for half in halves] if arrow else halves
+
+
+
+@pytest.mark.parametrize("arrow", [False, True])
+def test_clean_batches_pass_in_every_mode(plays, arrow):
+    df = plays(40)
+    for on_error in ["fail", "drop"]:
+        raw, transformed = run_etl(batches(df, arrow), on_error)
+        assert len(raw) == 40
+        assert transformed["count"].astype(int).sum() == 40
+
+
+
+@pytest.mark.parametrize("arrow", [False, True])
+def test_fail_mode_raises(plays, arrow):
+    with pytest.raises(ValueError):
+        run_etl(batches(with_violations(plays(40)), arrow), "fail")
+
+
+
+@pytest.mark.parametrize("arrow", [False, True])
+def test_drop_mode_removes_invalid_rows(plays, arrow):
+    raw, transformed = run_etl(batches(with_violations(plays(40)), arrow), "drop")
+
+    played_at = raw.column("played_at").to_pylist() if arrow else raw["played_at"].tolist()
+    assert len(raw) == 40 and len(set(played_at)) == 40
+    assert transformed["count"].astype(int).sum() == 40
+
+
+
+@pytest.mark.parametrize("arrow", [False, True])
+def test_quarantine_mode_keeps_reasons(plays, arrow):
+    sink = QuarantineSink()
+
+    raw, _ = run_etl(batches(with_violations(plays(40)), arrow), "quarantine", sink)
+
+    assert len(raw) == 40
+    assert sorted(sink.frame()["reason"]) == ["duplicate_played_at", "null_song_name"]
+
+
+
+def test_quarantine_mode_requires_sink(plays):
+    with pytest.raises(ValueError):
+        run_etl([plays(10)], "quarantine")
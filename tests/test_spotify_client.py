@@ -0,0 +1,119 @@
+"""Повторы, выключатель и хеджирование SpotifyClient на моке Spotify API."""
+
+import time
+
+import pytest
+import requests
+
+import spotify_client
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from conftest import USER_ID
+from extractor import ApiSource, iter_batches_from_pages
+from key_index import played_at_keys
+from spotify_client import SpotifyClient
+
+
+
+def make_client(server, **options) -> SpotifyClient:
+    """Клиент без пауз отката и с выключателем, размыкающимся на повторах одной страницы."""
+    options.setdefault("breaker", CircuitBreaker(0.5, 20, 3, 30))
+    return SpotifyClient(base_url=server.base_url, retry_base=0, **options)
+
+
+
+def test_server_errors_are_retried(mock_api):
+    server = mock_api(error_ratio=1.0)
+    client = make_client(server, server_retries=2, breaker=CircuitBreaker(0.5, 20, 100, 30))
+
+    with pytest.raises(requests.exceptions.HTTPError) as error:
+        client.get_raw("me/player/recently-played", USER_ID, {"limit": 50})
+
+    assert error.value.response.status_code == 503
+    assert server.counters["errors"] == 3
+    assert client.stats()["server_retries"] == 2
+
+
+
+def test_breaker_opens_and_archive_is_used(mock_api):
+    healthy = mock_api(plays_per_user=120)
+    archived = list(ApiSource(USER_ID, USER_ID, make_client(healthy), archive=True).iter_pages())
+    keys = played_at_keys(next(iter_batches_from_pages(archived, batch_size=1000)))
+    watermark = int(keys[len(keys) // 2])
+
+    down = mock_api(error_ratio=1.0)
+    client = make_client(down)
+    pages = list(ApiSource(USER_ID, USER_ID, client, archive=False).iter_pages(watermark))
+
+    # Три ответа 503 размыкают выключатель, четвёртая попытка уходит в архив
+    assert down.counters["requests"] == 3
+    assert client.breaker.state == "open"
+    assert pages
+    batch = next(iter_batches_from_pages(pages, watermark, batch_size=1000))
+    assert sorted(played_at_keys(batch)) == sorted(keys[keys > watermark])
+
+
+
+def test_breaker_without_archive_raises(mock_api):
+    down = mock_api(error_ratio=1.0)
+    with pytest.raises(CircuitOpenError):
+        list(ApiSource(USER_ID, USER_ID, make_client(down), archive=False).iter_pages())
+
+
+
+@pytest.fixture
+def hedging(monkeypatch):
+    """Дубликат уходит через 50 мс, пока замеров задержки мало."""
+    monkeypatch.setattr(spotify_client, "HEDGE_DEFAULT_DELAY", 0.05)
+
+
+
+def slow_first_request(client: SpotifyClient, monkeypatch, delay: float = 0.5, error: Exception = None) -> None:
+    """Первый запрос клиента отвечает через delay секунд (или падает с error)."""
+    original = client._timed_get
+    calls = []
+
+    def timed_get(*args):
+        calls.append(args)
+        if len(calls) == 1:
+            time.sleep(delay)
+            if error is not None:
+                raise error
+        return original(*args)
+
+    monkeypatch.setattr(client, "_timed_get", timed_get)
+
+
+
+def test_hedge_wins_over_slow_request(mock_api, hedging, monkeypatch):
+    server = mock_api()
+    client = make_client(server, hedge=True)
+    slow_first_request(client, monkeypatch)
+
+    raw = client.get_raw("me/player/recently-played", USER_ID, {"limit": 5})
+
+    assert b'"items"' in raw
+    stats = client.stats()
+    assert (stats["hedged"], stats["hedge_wins"]) == (1, 1)
+
+
+
+def test_hedge_not_sent_for_fast_request(mock_api, hedging):
+    server = mock_api()
+    client = make_client(server, hedge=True)
+
+    client.get_raw("me/player/recently-played", USER_ID, {"limit": 5})
+
+    assert client.stats()["hedged"] == 0
+    assert server.counters["requests"] == 1
+
+
+
+def test_hedge_covers_failed_primary(mock_api, hedging, monkeypatch):
+    server = mock_api()
+    client = make_client(server, hedge=True)
+    slow_first_request(client, monkeypatch, 0.1, requests.exceptions.ConnectionError("reset"))
+
+    raw = client.get_raw("me/player/recently-played", USER_ID, {"limit": 5})
+
+    assert b'"items"' in raw
+    assert client.stats()["hedge_wins"] == 1
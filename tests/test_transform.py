@@ -0,0 +1,65 @@
+"""Категориальные колонки пачек и агрегация transform_df()."""
+
+import pandas as pd
+
+from decoding import concat_frames
+from spotify_etl import transform_df
+
+
+
+def expected_counts(df: pd.DataFrame) -> pd.DataFrame:
+    """Агрегация по строковым колонкам, как до перевода пачек в category."""
+    plain = df.astype({"timestamp": str, "artist_name": str})
+    counts = plain.groupby(["timestamp", "artist_name"], as_index=False).size().rename(columns={"size": "count"})
+    counts["ID"] = counts["timestamp"] + "-" + counts["artist_name"]
+    return counts[["ID", "timestamp", "artist_name", "count"]]
+
+
+
+def test_batch_string_columns_are_categorical(plays):
+    df = plays(120)
+
+    for name in ("song_name", "artist_name", "timestamp"):
+        assert isinstance(df[name].dtype, pd.CategoricalDtype), name
+    assert df["artist_name"].cat.categories.is_unique
+
+
+
+def test_concat_frames_unions_dictionaries():
+    first = pd.DataFrame({"artist_name": pd.Categorical(["A", "B"]), "count": [1, 2]})
+    second = pd.DataFrame({"artist_name": pd.Categorical(["C", "A"]), "count": [3, 4]})
+
+    df = concat_frames([first, second])
+
+    assert isinstance(df["artist_name"].dtype, pd.CategoricalDtype)
+    assert list(df["artist_name"]) == ["A", "B", "C", "A"]
+    assert sorted(df["artist_name"].cat.categories) == ["A", "B", "C"]
+    assert list(df.columns) == ["artist_name", "count"] and list(df.index) == [0, 1, 2, 3]
+
+
+
+def test_concat_frames_mixed_dtypes_falls_back_to_concat():
+    first = pd.DataFrame({"artist_name": pd.Categorical(["A"])})
+    second = pd.DataFrame({"artist_name": ["B"]})
+
+    df = concat_frames([first, second])
+
+    assert list(df["artist_name"]) == ["A", "B"]
+
+
+
+def test_transform_matches_string_groupby(plays):
+    df = plays(300)
+
+    result = transform_df(df)
+
+    pd.testing.assert_frame_equal(result, expected_counts(df), check_dtype=False)
+    assert result["count"].sum() == len(df)
+
+
+
+def test_transform_same_for_pandas_and_arrow(plays):
+    frame = plays(300)
+    table = plays(300, arrow=True)
+
+    pd.testing.assert_frame_equal(transform_df(frame), transform_df(table), check_dtype=False)
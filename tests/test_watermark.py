@@ -0,0 +1,62 @@
+"""Отметка последней загрузки (watermark) как курсор after."""
+
+import pandas as pd
+import pytest
+
+import spotify_client
+from conftest import USER_ID
+from key_index import played_at_keys
+from spotify_client import SpotifyClient
+from spotify_etl import iter_track_batches, spotify_etl
+from watermark import drop_watermarks, load_watermark, save_watermark
+
+
+
+@pytest.fixture
+def api(mock_api, monkeypatch):
+    """Клиент Spotify, направленный на мок, без обогащения пачек."""
+    server = mock_api(plays_per_user=80)
+    monkeypatch.setattr(spotify_client, "_client", SpotifyClient(base_url=server.base_url))
+    monkeypatch.setenv("SPOTIFY_ENRICH_TRACKS", "0")
+    monkeypatch.setenv("SPOTIFY_ENRICH_ARTISTS", "0")
+    return server
+
+
+
+def test_watermark_only_moves_forward():
+    save_watermark(USER_ID, 2000)
+    save_watermark(USER_ID, 1000)
+    save_watermark("other", 500)
+
+    assert load_watermark(USER_ID) == 2000
+    assert load_watermark("other") == 500
+    assert load_watermark("unknown") is None
+
+
+
+def test_drop_watermarks_forgets_all_users():
+    save_watermark(USER_ID, 2000)
+
+    assert drop_watermarks()
+    assert load_watermark(USER_ID) is None
+    assert not drop_watermarks()
+
+
+
+def test_extraction_starts_after_watermark(api):
+    everything = played_at_keys(pd.concat(list(iter_track_batches(after_ms=0))))
+    watermark = int(sorted(everything)[len(everything) // 2])
+    save_watermark(USER_ID, watermark)
+
+    fresh = played_at_keys(pd.concat(list(iter_track_batches())))
+
+    assert len(fresh) == (everything > watermark).sum()
+    assert (fresh > watermark).all()
+
+
+
+def test_nothing_new_short_circuits(api):
+    everything = played_at_keys(pd.concat(list(iter_track_batches(after_ms=0))))
+    save_watermark(USER_ID, int(everything.max()))
+
+    assert spotify_etl(on_error="fail").empty